@@ -0,0 +1,278 @@
+# scripts/benchmark.py
+#
+# Reproducible scaling benchmark for the pipeline stages.
+#
+#   python scripts/benchmark.py [--sizes=10000,100000,1000000] [--stages=normalize,query,group,nest,summary,overall]
+#                               [--save-baseline] [--tolerance=0.25] [--query-limit=20000]
+#                               [--summary-groups=200] [--llm-latency=0.05]
+#
+# Corpora are generated once per size by generate_alerts.py (fixed seed) and
+# cached in BENCH_DIR. The summary stages talk to ollama_stub.py instead of a
+# real model, so they measure pipeline overhead rather than GPU time. Each run
+# is written to BENCH_DIR/results-<run_id>.json; stages whose throughput drops
+# more than --tolerance below BASELINE_FILE are reported as regressions (exit 1).
+
+import contextlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import generate_alerts
+import group_faiss_matches
+import nest_grouped_matches
+import normalize_alerts
+import telemetry
+
+BENCH_DIR = "data/benchmarks"
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+RULES_FILE = "data/parsed_rules.jsonl"
+DEFAULT_SIZES = [10_000, 100_000]
+ALL_STAGES = ["normalize", "query", "group", "nest", "summary", "overall"]
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_QUERY_LIMIT = 20_000   # alerts encoded per size; the encoder dominates and scales linearly
+DEFAULT_SUMMARY_GROUPS = 200
+DEFAULT_LLM_LATENCY_S = 0.05
+STUB_MODEL = "argus-bench-stub"
+
+
+def option(args, name, default):
+    return next((a.split("=", 1)[1] for a in args if a.startswith(f"--{name}=")), default)
+
+
+def corpus_path(size):
+    path = os.path.join(BENCH_DIR, f"corpus-{size}.json")
+    if not os.path.exists(path):
+        print(f"[*] Generating {size} synthetic alerts → {path}")
+        generate_alerts.write_corpus(size, path)
+    return path
+
+
+def load_rule_sample(limit=50):
+    """A handful of real rule payloads (or stand-ins) to attach to synthetic matches."""
+    rules = []
+    if os.path.exists(RULES_FILE):
+        with open(RULES_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                rules.append(json.loads(line))
+                if len(rules) >= limit:
+                    break
+    return rules or [{"title": f"Rule {i}", "tactic": "", "technique": "", "technique_id": "", "query": "",
+                      "description": "", "risk_score": 50, "tags": [], "references": []} for i in range(limit)]
+
+
+def synthetic_matches(alerts, rules, k=5):
+    """Stand-in for query_faiss output so grouping can be measured without FAISS."""
+    for i, alert in enumerate(alerts):
+        yield {
+            "alert": alert,
+            "matches": [dict(rules[(i + j) % len(rules)], score=float(j)) for j in range(k)],
+        }
+
+
+def timed(stage, size, items, fn):
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    row = {
+        "stage": stage,
+        "size": size,
+        "items": items,
+        "seconds": round(seconds, 4),
+    }
+    row["items_per_s"] = round(row["items"] / seconds, 2) if seconds > 0 else 0.0
+    print_row(row)
+    return row, result
+
+
+def print_row(row):
+    print(f"    {row['stage']:<10} {row['items']:>9} items  {row['seconds']:>8.2f}s  {row['items_per_s']:>12,.0f}/s")
+
+
+def bench_query(size, alerts, limit):
+    try:
+        import query_faiss
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        print(f"    query      skipped ({e})")
+        return {"stage": "query", "size": size, "skipped": str(e)}
+    if not os.path.exists(query_faiss.FAISS_INDEX_FILE):
+        print("    query      skipped (no FAISS index; run embed_chunks.py)")
+        return {"stage": "query", "size": size, "skipped": "no index"}
+
+    model = SentenceTransformer(query_faiss.EMBED_MODEL)
+    index, metadata = query_faiss.load_index_and_metadata()
+    sample = alerts[:limit]
+    row, _ = timed("query", size, len(sample),
+                   lambda: sum(1 for _ in query_faiss.search_alerts(model, index, metadata, sample)))
+    return row
+
+
+def stub_responder(payload):
+    prompt = payload.get("prompt", "")
+    if "JSON array" in prompt:
+        return json.dumps([f"Risk {i}" for i in range(1, 6)])
+    if "JSON object" in prompt:
+        return json.dumps({"what": "Stub.", "impact": "Stub.", "mitigation": "Stub."})
+    return "Stub executive summary of the alert group."
+
+
+def bench_llm_stages(size, nested, stages, max_groups):
+    import llm_summary
+    import llm_summary_overall
+
+    # Trim the tree to at most max_groups groups, keeping its shape
+    trimmed, kept = {}, 0
+    for tactic, technique, host_user, group in llm_summary.iter_groups(nested):
+        if kept >= max_groups:
+            break
+        trimmed.setdefault(tactic, {}).setdefault(technique, {}).setdefault(host_user, []).append(group)
+        kept += 1
+
+    rows = []
+    # Per-group progress lines would dominate the timing at scale
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        llm_summary.USE_CACHE = False
+        if "summary" in stages:
+            with contextlib.redirect_stdout(devnull):
+                row, summaries = timed("summary", size, kept, lambda: llm_summary.summarize_nested(
+                    trimmed, STUB_MODEL, llm_summary.DEFAULT_WORKERS, os.path.join(tmp, "summaries.jsonl")))
+            print_row(row)
+            rows.append(row)
+        else:
+            summaries = [{"tactic": t, "technique": te, "host_user": hu, "alert_count": 1, "summary": "stub"}
+                         for t, te, hu, _ in llm_summary.iter_groups(trimmed)]
+        if "overall" in stages:
+            from pathlib import Path
+            llm_summary_overall.MODEL_TAG = STUB_MODEL
+            llm_summary_overall.TXT_OUT = Path(tmp) / "top5.txt"
+            llm_summary_overall.HTML_OUT = Path(tmp) / "top5.html"
+            with contextlib.redirect_stdout(devnull):
+                row, _ = timed("overall", size, len(summaries),
+                               lambda: llm_summary_overall.generate_takeaways(summaries))
+            print_row(row)
+            rows.append(row)
+    return rows
+
+
+def run_size(size, stages, opts):
+    print(f"\n[*] Size {size:,}")
+    rows = []
+    path = corpus_path(size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        norm_path = os.path.join(tmp, "normalized.jsonl")
+
+        def normalize():
+            with open(norm_path, "w", encoding="utf-8") as out_f:
+                return normalize_alerts.normalize_stream(normalize_alerts.iter_alerts(path), out_f)
+
+        if "normalize" in stages:
+            row, _ = timed("normalize", size, size, normalize)
+            rows.append(row)
+        else:
+            normalize()
+
+        needs_alerts = any(s in stages for s in ("query", "group", "nest", "summary", "overall"))
+        if not needs_alerts:
+            return rows
+        with open(norm_path, "r", encoding="utf-8") as f:
+            alerts = [json.loads(line) for line in f]
+
+    if "query" in stages:
+        rows.append(bench_query(size, alerts, opts["query_limit"]))
+
+    rules = load_rule_sample()
+    row, grouped = timed("group", size, size,
+                         lambda: group_faiss_matches.to_records(group_faiss_matches.group_matches(synthetic_matches(alerts, rules))))
+    if "group" in stages:
+        rows.append(row)
+    del alerts
+
+    row, nested = timed("nest", size, len(grouped), lambda: nest_grouped_matches.nest_for_summary(grouped))
+    if "nest" in stages:
+        rows.append(row)
+
+    if "summary" in stages or "overall" in stages:
+        rows.extend(bench_llm_stages(size, nested, stages, opts["summary_groups"]))
+    return rows
+
+
+def compare(results, baseline, tolerance):
+    """Return rows whose throughput fell more than `tolerance` below the baseline."""
+    base = {(r["stage"], r["size"]): r for r in baseline.get("results", []) if "items_per_s" in r}
+    regressions = []
+    for row in results:
+        ref = base.get((row["stage"], row["size"]))
+        if ref is None or "items_per_s" not in row or not ref["items_per_s"]:
+            continue
+        change = row["items_per_s"] / ref["items_per_s"] - 1
+        row["vs_baseline"] = round(change, 4)
+        if change < -tolerance:
+            regressions.append(row)
+    return regressions
+
+
+def main():
+    args = sys.argv[1:]
+    sizes = [int(s) for s in option(args, "sizes", ",".join(map(str, DEFAULT_SIZES))).split(",")]
+    stages = option(args, "stages", ",".join(ALL_STAGES)).split(",")
+    tolerance = float(option(args, "tolerance", DEFAULT_TOLERANCE))
+    opts = {
+        "query_limit": int(option(args, "query-limit", DEFAULT_QUERY_LIMIT)),
+        "summary_groups": int(option(args, "summary-groups", DEFAULT_SUMMARY_GROUPS)),
+        "llm_latency": float(option(args, "llm-latency", DEFAULT_LLM_LATENCY_S)),
+    }
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    telemetry.METRICS_FILE = os.path.join(BENCH_DIR, "step_metrics.jsonl")  # keep stage spans out of the pipeline log
+
+    print("=== Argus benchmark ===")
+    results = []
+    with contextlib.ExitStack() as stack:
+        if "summary" in stages or "overall" in stages:
+            import llm_client
+            from ollama_stub import StubOllamaServer
+
+            stub = stack.enter_context(StubOllamaServer(responder=stub_responder, latency_s=opts["llm_latency"]))
+            llm_client.get_client(STUB_MODEL, host=stub.url)
+        for size in sizes:
+            results.extend(run_size(size, stages, opts))
+
+    report = {
+        "run_id": telemetry.RUN_ID,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": generate_alerts.DEFAULT_SEED,
+        "options": opts,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        "results": results,
+    }
+
+    regressions = []
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), tolerance)
+
+    out_path = os.path.join(BENCH_DIR, f"results-{telemetry.RUN_ID}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[+] Results → {out_path}")
+
+    if "--save-baseline" in args:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Baseline updated → {BASELINE_FILE}")
+
+    for row in regressions:
+        print(f"[!] Regression: {row['stage']} @ {row['size']:,}: {row['vs_baseline']:+.0%} items/s vs baseline")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
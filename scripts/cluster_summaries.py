@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Cluster near-duplicate group summaries before the executive stage.
+
+Many groups differ only in host or user and get near-identical summaries. Each
+summary (with its own host and user masked out) is embedded with the retrieval
+model, and summaries of the same tactic whose cosine similarity to a cluster's
+representative is at least SIMILARITY_THRESHOLD join that cluster. Representatives
+are picked greedily by alert count, so every cluster is led by its largest group.
+
+Each output record is the representative's summary with aggregate counts and the
+affected hosts/users; llm_summary_overall.py reads it in place of the raw summaries.
+
+    python scripts/cluster_summaries.py [--threshold=0.9]
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, List, Tuple
+
+import faiss
+import numpy as np
+
+import telemetry
+
+INPUT_FILE = "data/group_summaries.jsonl"
+OUTPUT_FILE = "data/summary_clusters.jsonl"
+EMBED_MODEL = "all-MiniLM-L6-v2"
+SIMILARITY_THRESHOLD = 0.9
+
+
+def host_and_user(group: Dict[str, Any]) -> Tuple[str, str]:
+    if "host" in group or "user" in group:
+        return str(group.get("host", "unknown")), str(group.get("user", "unknown"))
+    # Older summaries only carry nest_grouped_matches' "<host>_<user>" key
+    host, _, user = str(group.get("host_user", "unknown_unknown")).rpartition("_")
+    return host or "unknown", user or "unknown"
+
+
+def cluster_text(group: Dict[str, Any]) -> str:
+    """Summary with the group's own host and user masked, so they do not set clusters apart."""
+    text = str(group.get("summary", ""))
+    for name, placeholder in zip(host_and_user(group), ("the host", "the user")):
+        if name and name != "unknown":
+            text = re.sub(rf"\b{re.escape(name)}\b", placeholder, text, flags=re.IGNORECASE)
+    return f"{group.get('technique', '')}: {text}"
+
+
+def embed(model, groups: List[Dict[str, Any]]) -> np.ndarray:
+    with telemetry.span("encode"):
+        vectors = model.encode([cluster_text(g) for g in groups], batch_size=256,
+                               convert_to_numpy=True).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def leader_clusters(vectors: np.ndarray, order: List[int], threshold: float) -> List[List[int]]:
+    """Greedy threshold clustering: each unassigned item in `order` leads a cluster of
+    the unassigned items within `threshold` cosine similarity of it."""
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    assigned = np.zeros(len(vectors), dtype=bool)
+    clusters = []
+    for leader in order:
+        if assigned[leader]:
+            continue
+        _, _, ids = index.range_search(vectors[leader:leader + 1], threshold)
+        members = [leader] + [int(i) for i in ids if i != leader and not assigned[i]]
+        assigned[members] = True
+        clusters.append(members)
+    return clusters
+
+
+def cluster_record(members: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The representative (members[0]) with counts and affected hosts/users of the whole cluster."""
+    record = dict(members[0])
+    hosts = sorted({host_and_user(g)[0] for g in members})
+    users = sorted({host_and_user(g)[1] for g in members})
+    record.update({
+        "alert_count": sum(g.get("alert_count", 0) for g in members),
+        "group_count": len(members),
+        "techniques": sorted({str(g.get("technique", "unknown")) for g in members}),
+        "hosts": hosts,
+        "users": users,
+    })
+    return record
+
+
+def cluster_summaries(groups: List[Dict[str, Any]], model=None,
+                      threshold: float = SIMILARITY_THRESHOLD) -> List[Dict[str, Any]]:
+    """Collapse near-duplicate summaries (same tactic) into one record per cluster."""
+    if not groups:
+        return []
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(EMBED_MODEL)
+
+    vectors = embed(model, groups)
+    by_tactic: Dict[str, List[int]] = {}
+    for i, g in enumerate(groups):
+        by_tactic.setdefault(str(g.get("tactic", "unknown")), []).append(i)
+
+    records = []
+    with telemetry.span("cluster"):
+        for positions in by_tactic.values():
+            order = sorted(range(len(positions)), key=lambda i: -groups[positions[i]].get("alert_count", 0))
+            for cluster in leader_clusters(vectors[positions], order, threshold):
+                records.append(cluster_record([groups[positions[i]] for i in cluster]))
+    records.sort(key=lambda r: r["alert_count"], reverse=True)
+
+    telemetry.count("summaries", len(groups))
+    telemetry.count("clusters", len(records))
+    print(f"[+] Clustered {len(groups)} group summaries into {len(records)} distinct findings "
+          f"(threshold {threshold})")
+    return records
+
+
+def save_clusters(records: List[Dict[str, Any]], output_file: str = OUTPUT_FILE) -> None:
+    with open(output_file, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def main() -> None:
+    threshold = float(next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--threshold=")),
+                           SIMILARITY_THRESHOLD))
+    if not os.path.exists(INPUT_FILE):
+        sys.exit(f"Error: {INPUT_FILE} missing – run the group-summary step first.")
+
+    with telemetry.span("load"):
+        with open(INPUT_FILE, "r", encoding="utf-8") as f:
+            groups = [json.loads(line) for line in f if line.strip()]
+    records = cluster_summaries(groups, threshold=threshold)
+    save_clusters(records)
+    print(f"[+] Clusters written → {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
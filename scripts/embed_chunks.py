@@ -1,14 +1,41 @@
 # scripts/embed_chunks.py
+#
+# Incremental by default: each rule's rule_to_text() output is fingerprinted in
+# MANIFEST_FILE, and only new or changed rules are re-embedded. The index is an
+# IndexIDMap2 so deleted/changed rules can be removed by their stable FAISS ID;
+# metadata is written as a memory-mapped rule store keyed by FAISS ID (see
+# rule_store.py). Pass --full to force a clean rebuild.
+#
+# The index type comes from --index=flat|ip|hnsw|ivfpq (or ARGUS_FAISS_INDEX),
+# with --index-param=name=value overrides; see index_factory.py. Without either,
+# the type recorded in index_factory.PARAMS_FILE is kept. Changing type or
+# parameters rebuilds the index from scratch.
+#
+# The manifest is written last and records a SHA-256 of every other artefact, so
+# an update interrupted between file replacements is detected on the next run
+# and triggers a full rebuild instead of patching mismatched files.
+#
+# The BM25 index for hybrid retrieval (lexical_index.py) is rebuilt from the
+# metadata on every run; it is cheap next to embedding, so a missing or stale
+# data/lexical_index.json (it is not kept in Git) never forces re-embedding.
 
+import hashlib
 import json
 import os
+import sys
 import faiss
-import pickle
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+import index_factory
+import lexical_index
+import rule_store
+import telemetry
+
 RULES_FILE = "data/parsed_rules.jsonl"
 FAISS_INDEX_FILE = "data/faiss_index.bin"
-METADATA_FILE = "data/faiss_metadata.pkl"
+METADATA_FILE = "data/faiss_metadata.bin"
+MANIFEST_FILE = "data/faiss_manifest.json"
 EMBED_MODEL = "all-MiniLM-L6-v2"  # fast, decent quality
 
 def load_rules():
@@ -21,28 +48,178 @@ def load_rules():
 def rule_to_text(rule):
     return f"{rule['title']}\n{rule['technique_id']} {rule['technique']} ({rule['tactic']})\n{rule['description']}\n{rule['query']}"
 
-def main():
-    print("Loading rules...")
-    rules = load_rules()
-    texts = [rule_to_text(rule) for rule in rules]
+def fingerprint(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def rule_keys(rules):
+    """Stable identity per rule (source file name), disambiguated if a name repeats."""
+    seen = {}
+    keys = []
+    for rule in rules:
+        base = rule.get("file") or rule.get("title", "")
+        seen[base] = seen.get(base, 0) + 1
+        keys.append(base if seen[base] == 1 else f"{base}#{seen[base]}")
+    return keys
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def requested_params(args):
+    """Index parameters from the command line/environment, or None to keep the saved ones."""
+    index_type = next((a.split("=", 1)[1] for a in args if a.startswith("--index=")),
+                      os.environ.get("ARGUS_FAISS_INDEX"))
+    overrides = index_factory.parse_overrides(args)
+    if index_type is None and not overrides:
+        return None
+    return index_factory.index_params(index_type or index_factory.load_params()["type"], **overrides)
+
+def same_params(saved, params):
+    return all(saved.get(key) == value for key, value in params.items())
+
+def artefacts():
+    return [FAISS_INDEX_FILE, METADATA_FILE, lexical_index.LEXICAL_INDEX_FILE, index_factory.PARAMS_FILE]
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def artefacts_match(manifest):
+    """True if every artefact on disk is the one the manifest was written with.
+
+    The lexical index is left out: save_atomic() rewrites it from the metadata anyway.
+    """
+    files = manifest.get("files", {})
+    return all(os.path.exists(path) and files.get(path) == file_digest(path)
+               for path in artefacts() if path != lexical_index.LEXICAL_INDEX_FILE)
+
+def load_existing_index(manifest, params):
+    """Return the saved index if it can be updated in place, else None (full rebuild)."""
+    if manifest is None or manifest.get("model") != EMBED_MODEL:
+        return None
+    if not artefacts_match(manifest):
+        print("[~] Index files do not match the manifest (interrupted save?); rebuilding")
+        return None
+    if not same_params(index_factory.load_params(), params):
+        return None
+    index = faiss.read_index(FAISS_INDEX_FILE)
+    if not isinstance(index, faiss.IndexIDMap2) or index.ntotal != len(manifest["rules"]):
+        return None
+    return index
+
+def save_atomic(index, metadata, manifest, params):
+    """Write index, metadata, lexical index and index parameters via temp files, then the manifest.
 
-    print(f"Embedding {len(texts)} rules...")
-    model = SentenceTransformer(EMBED_MODEL)
-    embeddings = model.encode(texts, convert_to_numpy=True)
+    Each file is replaced atomically, but not all of them together: a crash in between
+    leaves a manifest whose digests no longer match, which load_existing_index() catches.
+    """
+    faiss.write_index(index, FAISS_INDEX_FILE + ".tmp")
+    rule_store.write_store(METADATA_FILE + ".tmp", metadata)
+    lexical_index.write_index(lexical_index.LEXICAL_INDEX_FILE + ".tmp", metadata)
+    index_factory.save_params(params, index_factory.PARAMS_FILE + ".tmp")
+    manifest["files"] = {path: file_digest(path + ".tmp") for path in artefacts()}
+    for path in artefacts():
+        os.replace(path + ".tmp", path)
+    with open(MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(MANIFEST_FILE + ".tmp", MANIFEST_FILE)
 
-    print("Creating FAISS index...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
+def build_index(rules=None, full=False, model=None, params=None):
+    """Bring the saved index up to date with `rules` and return (index, metadata).
 
-    print(f"Indexed {index.ntotal} vectors")
+    `model` may be an already-loaded SentenceTransformer; it is only loaded here if
+    something actually needs embedding. `params` (see index_factory.index_params)
+    defaults to whatever the saved index was built with.
+    """
+    params = dict(params or index_factory.load_params())
+    with telemetry.span("load"):
+        if rules is None:
+            print("Loading rules...")
+            rules = load_rules()
+        keys = rule_keys(rules)
+        texts = [rule_to_text(rule) for rule in rules]
+        hashes = [fingerprint(text) for text in texts]
+
+        manifest = None if full else load_manifest()
+        index = None if full else load_existing_index(manifest, params)
+
+    if index is None:
+        print(f"Building FAISS index ({params['type']}) from scratch...")
+        manifest = {"model": EMBED_MODEL, "next_id": 0, "rules": {}}
+    else:
+        print(f"Updating existing index ({index.ntotal} vectors)...")
+
+    known = manifest["rules"]
+    current = set(keys)
+
+    # Rules that disappeared upstream
+    removed = [key for key in known if key not in current]
+    stale_ids = [known.pop(key)["id"] for key in removed]
+
+    # New or changed rules keep/receive a stable ID and get (re-)embedded
+    to_embed, embed_ids = [], []
+    for key, text, digest in zip(keys, texts, hashes):
+        entry = known.get(key)
+        if entry is not None and entry["hash"] == digest:
+            continue
+        if entry is None:
+            entry = known[key] = {"id": manifest["next_id"], "hash": digest}
+            manifest["next_id"] += 1
+        else:
+            stale_ids.append(entry["id"])
+            entry["hash"] = digest
+        to_embed.append(text)
+        embed_ids.append(entry["id"])
+
+    print(f"{len(to_embed)} new/changed, {len(removed)} removed, {len(rules) - len(to_embed)} unchanged")
+    telemetry.count("rules", len(rules))
+    telemetry.count("rules_embedded", len(to_embed))
+    telemetry.count("rules_removed", len(removed))
+
+    if index is not None and stale_ids:
+        if not index_factory.supports_remove(params):
+            print(f"[~] {params['type']} index cannot drop vectors; rebuilding")
+            return build_index(rules, full=True, model=model, params=params)
+        index.remove_ids(np.array(stale_ids, dtype="int64"))
+
+    if to_embed:
+        print(f"Embedding {len(to_embed)} rules...")
+        if model is None:
+            with telemetry.span("load_model"):
+                model = SentenceTransformer(EMBED_MODEL)
+        with telemetry.span("embed"):
+            embeddings = model.encode(to_embed, convert_to_numpy=True,
+                                      normalize_embeddings=index_factory.uses_inner_product(params)).astype("float32")
+        with telemetry.span("index"):
+            if index is None:
+                index = index_factory.make_index(params, embeddings.shape[1], len(embeddings))
+            if not index.is_trained:
+                index.train(embeddings)
+            index.add_with_ids(embeddings, np.array(embed_ids, dtype="int64"))
+
+    if index is None:
+        print("[!] No rules to index.")
+        return None, {}
+
+    index_factory.configure(index, params)
+    print(f"Indexed {index.ntotal} vectors ({params['type']})")
 
     print("Saving index and metadata...")
-    faiss.write_index(index, FAISS_INDEX_FILE)
-    with open(METADATA_FILE, "wb") as f:
-        pickle.dump(rules, f)
+    metadata = {known[key]["id"]: rule for key, rule in zip(keys, rules)}
+    with telemetry.span("write"):
+        save_atomic(index, metadata, manifest, params)
 
     print("Done - Vector index saved.")
+    return index, metadata
+
+def main():
+    args = sys.argv[1:]
+    build_index(full="--full" in args, params=requested_params(args))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""On-disk cache of sentence embeddings for alert texts.
+
+Entries are keyed on a SHA-256 of (model name, text), so a text seen in an earlier run is
+not re-encoded as long as the embedding model is unchanged. Vectors are stored as raw
+float32 blobs in an SQLite LRU table (sqlite_lru.py); lookups and inserts are batched
+per encode chunk.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from sqlite_lru import SQLiteLRU
+
+DEFAULT_CACHE_FILE = "data/embedding_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+
+def text_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Float32 vectors per (model, text), in an SQLite LRU table."""
+
+    def __init__(self, model: str, path: str = DEFAULT_CACHE_FILE, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.model = model
+        self.path = path
+        self._store = SQLiteLRU(path, "embeddings", "vector", "BLOB", max_entries)
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return {text: vector} for the texts that are cached."""
+        keys = {text_key(text, self.model): text for text in texts}
+        found = self._store.get_many(list(keys))
+        return {keys[key]: np.frombuffer(blob, dtype="float32") for key, blob in found.items()}
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        self._store.put_many((text_key(text, self.model), self.model, np.asarray(vec, dtype="float32").tobytes())
+                             for text, vec in zip(texts, vectors))
+
+    def stats(self) -> Dict[str, Any]:
+        return self._store.stats()
+
+    def close(self) -> None:
+        self._store.close()
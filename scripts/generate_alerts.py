@@ -0,0 +1,112 @@
+# scripts/generate_alerts.py
+#
+# Deterministic synthetic XDR alert generator for benchmarking. Produces the
+# same document shape as data/xdr_gui_alerts.json ({"generation_time", ...,
+# "alerts": [...]}) and streams it to disk, so 1M-alert corpora do not need to
+# fit in memory. Usage:
+#
+#   python scripts/generate_alerts.py <count> [output] [seed]
+
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+OUTPUT_FILE = "data/benchmarks/synthetic_alerts.json"
+DEFAULT_SEED = 1337
+
+SOURCES = [
+    "SentinelOne", "CrowdStrike", "Microsoft 365 Defender", "Fortinet", "Carbon Black",
+    "Microsoft Defender", "Elastic", "Google Chronicle", "AWS GuardDuty",
+]
+# (tactic, technique, alert category) as seen in the sample export
+SCENARIOS = [
+    ("Command and Control", "T1071", "beaconing"),
+    ("Credential Access", "T1003", "credential_dumping"),
+    ("Defense Evasion", "T1027", "obfuscation"),
+    ("Discovery", "T1082", "system_information_discovery"),
+    ("Execution", "T1059.001", "script_execution"),
+    ("Exfiltration", "T1041", "data_exfiltration"),
+    ("Impact", "T1486", "ransomware"),
+    ("Initial Access", "T1078", "unauthorized_login"),
+    ("Lateral Movement", "T1021", "remote_service_session"),
+    ("Persistence", "T1053", "scheduled_task_created"),
+    ("Privilege Escalation", "T1068", "privilege_escalation"),
+]
+SEVERITIES = ["low", "medium", "high", "critical"]
+USERS = [
+    "admin", "alice", "analyst01", "backup-admin", "bob", "ceo", "cfo", "engineer01", "guest", "hr-user",
+    "intern", "it.helpdesk", "jdoe", "network-admin", "qa.tester", "root", "sec-ops", "svc-admin",
+    "tech-support", "web-user",
+]
+PROCESSES = ["cmd.exe", "explorer.exe", "mshta.exe", "powershell.exe", "regsvr32.exe", "rundll32.exe", "wmiprvse.exe"]
+
+
+def host_count(count):
+    """Fleet size grows with the corpus (20 hosts for the 1k sample)."""
+    return max(20, count // 1000)
+
+
+def iter_synthetic_alerts(count, seed=DEFAULT_SEED, start=None):
+    rng = random.Random(seed)
+    start = start or datetime(2025, 7, 6, tzinfo=timezone.utc)
+    hosts = [f"HOST-{i:02d}" for i in range(1, host_count(count) + 1)]
+    window_s = max(4 * 3600, count * 15)  # ~4h for 1k alerts, like the sample
+
+    for _ in range(count):
+        tactic, technique, category = rng.choice(SCENARIOS)
+        source = rng.choice(SOURCES)
+        host = rng.choice(hosts)
+        user = rng.choice(USERS)
+        process = rng.choice(PROCESSES)
+        ts = start + timedelta(seconds=rng.uniform(0, window_s))
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "title": f"{source} Alert - {category}",
+            "severity": rng.choice(SEVERITIES),
+            "tactic": tactic,
+            "technique": technique,
+            "host": host,
+            "user": user,
+            "process": process,
+            "timestamp": ts.isoformat(),
+            "source": source,
+            "description": f"{tactic} via {technique} detected by {process} on {host} by {user}",
+        }
+
+
+def write_corpus(count, output_file=OUTPUT_FILE, seed=DEFAULT_SEED):
+    """Stream `count` alerts to output_file in the xdr_gui_alerts.json layout."""
+    header = {
+        "generation_time": datetime.now(timezone.utc).isoformat(),
+        "total_alerts": count,
+        "xdr_source": "argus-synthetic-benchmark",
+        "api_version": "2025.6",
+        "seed": seed,
+    }
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header)[:-1] + ', "alerts": [\n')
+        for i, alert in enumerate(iter_synthetic_alerts(count, seed)):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(alert))
+        f.write("\n]}\n")
+    return output_file
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python scripts/generate_alerts.py <count> [output] [seed]")
+    count = int(sys.argv[1])
+    output_file = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_FILE
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_SEED
+    write_corpus(count, output_file, seed)
+    print(f"[+] Wrote {count} synthetic alerts → {output_file}")
+
+
+if __name__ == "__main__":
+    main()
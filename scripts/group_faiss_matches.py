@@ -1,14 +1,71 @@
+# scripts/group_faiss_matches.py
+#
+# main() groups with bounded memory: matches are read one line at a time and
+# grouped in memory until MAX_BUFFERED_ENTRIES is reached, then the buffered
+# groups are hash-partitioned by group key into spill files. At the end each
+# partition is merged on its own and written out. Tune with --max-entries=N,
+# --partitions=N and --spill-dir=PATH. --max-entries bounds memory while
+# reading; the merge then holds one whole partition (all of its groups and
+# entries) at a time, so peak memory is set by the largest partition; raise
+# --partitions to shrink it. group_matches() is the in-memory variant used by
+# the in-process runner.
+#
+# Windowed mode (--window=15m, optionally --slide=5m for sliding windows) groups
+# by host/user/tactic *and* event-time window, incrementally: only alerts newer
+# than the watermark in the group store are read, their groups are updated in
+# data/group_store.sqlite and marked dirty, and OUTPUT_FILE receives just the
+# dirty groups, which is all llm_summary.py then re-summarizes. Alerts before
+# the watermark (late arrivals), alerts at it that were already grouped, and
+# alerts without a timestamp are counted and skipped. Clean windows that ended
+# more than --retention=7d before the watermark are pruned from the store.
+
+import hashlib
 import json
+import math
 import os
+import sys
+import tempfile
+import zlib
 from collections import defaultdict
+from datetime import datetime, timezone
+
+import telemetry
+from group_store import DEFAULT_RETENTION_S, DEFAULT_STORE_FILE, GroupStore
 
 INPUT_FILE = "data/alert_matches.jsonl"
 OUTPUT_FILE = "data/grouped_matches.jsonl"
+MAX_BUFFERED_ENTRIES = 100_000  # grouped entries held in memory before spilling
+SPILL_PARTITIONS = 64
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
 
 def load_alert_matches(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return [json.loads(line.strip()) for line in f]
 
+def iter_alert_matches(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def group_entry(match):
+    """Return (group_id, host, user, tactic, entry) for one query_faiss record."""
+    alert = match.get("alert", {})
+    # query_faiss records carry ranked "matches"; the best one is the group's matched rule
+    rule = match.get("matched_rule") or (match.get("matches") or [{}])[0]
+
+    host = str(alert.get("host", "")).lower().strip() or "unknown_host"
+    user = str(alert.get("user", "")).lower().strip() or "unknown_user"
+    tactic = str(alert.get("tactic", "")).lower().strip() or "unknown_tactic"
+
+    group_id = f"host-{host}_user-{user}_tactic-{tactic}"
+    entry = {
+        "alert": alert,
+        "matched_rule": rule,
+        "score": match.get("score", rule.get("score", 0.0))
+    }
+    return group_id, host, user, tactic, entry
+
 def group_matches(matches):
     grouped = defaultdict(lambda: {
         "alerts": [],
@@ -19,20 +76,9 @@ def group_matches(matches):
     })
 
     for match in matches:
-        alert = match.get("alert", {})
-        rule = match.get("matched_rule", {})
-
-        host = str(alert.get("host", "")).lower().strip() or "unknown_host"
-        user = str(alert.get("user", "")).lower().strip() or "unknown_user"
-        tactic = str(alert.get("tactic", "")).lower().strip() or "unknown_tactic"
+        group_id, host, user, tactic, entry = group_entry(match)
 
-        group_id = f"host-{host}_user-{user}_tactic-{tactic}"
-
-        grouped[group_id]["alerts"].append({
-            "alert": alert,
-            "matched_rule": rule,
-            "score": match.get("score", 0.0)
-        })
+        grouped[group_id]["alerts"].append(entry)
         grouped[group_id]["host"] = host
         grouped[group_id]["user"] = user
         grouped[group_id]["tactic"] = tactic
@@ -40,30 +86,259 @@ def group_matches(matches):
 
     return grouped
 
+def to_records(grouped):
+    return [
+        {
+            "group_id": group_id,
+            "host": group["host"],
+            "user": group["user"],
+            "tactic": group["tactic"],
+            "alert_count": group["match_count"],
+            "entries": group["alerts"]
+        }
+        for group_id, group in grouped.items()
+    ]
+
 def save_grouped_matches(grouped, output_file):
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     with open(output_file, "w", encoding="utf-8") as f:
-        for group_id, group in grouped.items():
-            group_data = {
-                "group_id": group_id,
-                "host": group["host"],
-                "user": group["user"],
-                "tactic": group["tactic"],
-                "alert_count": group["match_count"],
-                "entries": group["alerts"]
-            }
+        for group_data in to_records(grouped):
             f.write(json.dumps(group_data) + "\n")
 
+def partition_of(group_id, partitions):
+    return zlib.crc32(group_id.encode("utf-8")) % partitions
+
+class SpillingGrouper:
+    """Groups entries in memory and spills them to hash partitions past a size limit.
+
+    Groups that never spilled are written in first-seen order; otherwise output is
+    ordered by partition, then by first appearance within the partition.
+    """
+
+    def __init__(self, max_entries=MAX_BUFFERED_ENTRIES, partitions=SPILL_PARTITIONS, spill_dir=None):
+        self.max_entries = max_entries
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.grouped = {}
+        self.buffered = 0
+        self.matches = 0
+        self.spills = 0
+        self._tmp = None
+
+    def add(self, match):
+        group_id, host, user, tactic, entry = group_entry(match)
+        group = self.grouped.get(group_id)
+        if group is None:
+            group = self.grouped[group_id] = {"group_id": group_id, "host": host, "user": user,
+                                              "tactic": tactic, "alert_count": 0, "entries": []}
+        group["entries"].append(entry)
+        group["alert_count"] += 1
+        self.buffered += 1
+        self.matches += 1
+        if self.buffered >= self.max_entries:
+            self.spill()
+
+    def _partition_path(self, n):
+        return os.path.join(self._tmp.name, f"part-{n:04d}.jsonl")
+
+    def spill(self):
+        """Append every buffered group (as a partial group record) to its partition file."""
+        if not self.grouped:
+            return
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="argus-group-", dir=self.spill_dir)
+        by_partition = defaultdict(list)
+        for group_id, group in self.grouped.items():
+            by_partition[partition_of(group_id, self.partitions)].append(group)
+        for n, groups in by_partition.items():
+            with open(self._partition_path(n), "a", encoding="utf-8") as f:
+                for group in groups:
+                    f.write(json.dumps(group) + "\n")
+        self.grouped = {}
+        self.buffered = 0
+        self.spills += 1
+
+    def iter_groups(self):
+        """Yield complete group records (the to_records() shape)."""
+        if self._tmp is None:
+            yield from self.grouped.values()
+            return
+        self.spill()
+        try:
+            for n in range(self.partitions):
+                path = self._partition_path(n)
+                if not os.path.exists(path):
+                    continue
+                merged = {}
+                for partial in iter_alert_matches(path):
+                    group = merged.get(partial["group_id"])
+                    if group is None:
+                        merged[partial["group_id"]] = partial
+                    else:
+                        group["entries"].extend(partial["entries"])
+                        group["alert_count"] += partial["alert_count"]
+                yield from merged.values()
+        finally:
+            self._tmp.cleanup()
+            self._tmp = None
+
+def group_file(input_file, output_file, max_entries=MAX_BUFFERED_ENTRIES, partitions=SPILL_PARTITIONS,
+               spill_dir=None):
+    """Stream input_file into grouped records in output_file; returns (matches, groups, spills)."""
+    grouper = SpillingGrouper(max_entries, partitions, spill_dir)
+    with telemetry.span("group"):
+        for match in iter_alert_matches(input_file):
+            grouper.add(match)
+    count = 0
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with telemetry.span("write"), open(output_file, "w", encoding="utf-8") as f:
+        for group in grouper.iter_groups():
+            f.write(json.dumps(group) + "\n")
+            count += 1
+    return grouper.matches, count, grouper.spills
+
+def parse_duration(text):
+    """'90s', '15m', '1h', '1d', '0.5s' (or bare seconds) → seconds."""
+    text = str(text).strip().lower()
+    if text and text[-1] in DURATION_UNITS:
+        seconds = float(text[:-1]) * DURATION_UNITS[text[-1]]
+    else:
+        seconds = float(text)
+    return int(seconds) if seconds.is_integer() else seconds
+
+def parse_timestamp(value):
+    """ISO-8601 (naive means UTC) or epoch seconds → aware UTC datetime, or None."""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    try:
+        ts = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+def window_starts(ts, size, slide):
+    """Epoch starts of every window [start, start + size) containing ts."""
+    epoch = ts.timestamp()
+    start = math.floor(epoch / slide) * slide
+    starts = []
+    while start > epoch - size:
+        starts.append(start)
+        start -= slide
+    return starts
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+def alert_key(alert):
+    """alert_id, or a digest of the alert when it has none."""
+    return str(alert.get("alert_id") or "") or hashlib.sha1(json.dumps(alert, sort_keys=True).encode()).hexdigest()
+
+def group_windowed(matches, size, slide=None, watermark=None, watermark_keys=()):
+    """Group matches from `watermark` on by host/user/tactic/window.
+
+    Alerts at exactly the watermark are kept unless their alert_key() is in
+    watermark_keys (grouped by an earlier run). Returns (batch, new_watermark,
+    new_watermark_keys, counts) where batch is {group_id: partial group} ready
+    for GroupStore.add_entries().
+    """
+    slide = slide or size  # tumbling windows unless a smaller slide is given
+    floor = parse_timestamp(watermark) if watermark else None
+    seen = set(watermark_keys) if floor is not None else set()
+    batch = {}
+    newest = floor
+    newest_keys = set(seen)
+    counts = {"new": 0, "late": 0, "untimed": 0}
+
+    for match in matches:
+        alert = match.get("alert", {})
+        ts = parse_timestamp(alert.get("timestamp", ""))
+        if ts is None:
+            counts["untimed"] += 1
+            continue
+        if floor is not None and (ts < floor or (ts == floor and alert_key(alert) in seen)):
+            counts["late"] += 1
+            continue
+        counts["new"] += 1
+        if newest is None or ts > newest:
+            newest, newest_keys = ts, {alert_key(alert)}
+        elif ts == newest:
+            newest_keys.add(alert_key(alert))
+
+        group_id, host, user, tactic, entry = group_entry(match)
+        for start in window_starts(ts, size, slide):
+            window_start = iso(start)
+            key = f"{group_id}_window-{window_start}"
+            group = batch.get(key)
+            if group is None:
+                group = batch[key] = {"host": host, "user": user, "tactic": tactic, "window_start": window_start,
+                                      "window_end": iso(start + size), "entries": []}
+            group["entries"].append(entry)
+
+    return batch, newest.isoformat() if newest else watermark, sorted(newest_keys), counts
+
+def group_file_windowed(input_file, output_file, size, slide=None, store_path=DEFAULT_STORE_FILE,
+                        retention=DEFAULT_RETENTION_S):
+    """Fold new matches into the group store, prune expired windows and write out every dirty group."""
+    store = GroupStore(store_path)
+    try:
+        watermark = store.get_watermark()
+        with telemetry.span("group"):
+            batch, new_watermark, new_keys, counts = group_windowed(
+                iter_alert_matches(input_file), size, slide, watermark, store.get_watermark_keys())
+        with telemetry.span("store"):
+            store.add_entries(batch, new_watermark, new_keys)
+            pruned = store.prune(retention)
+        dirty = 0
+        with telemetry.span("write"), open(output_file, "w", encoding="utf-8") as f:
+            for group in store.iter_dirty():
+                f.write(json.dumps(group) + "\n")
+                dirty += 1
+        stats = store.stats()
+    finally:
+        store.close()
+    for name, n in counts.items():
+        telemetry.count(f"alerts_{name}", n)
+    telemetry.count("groups_updated", len(batch))
+    telemetry.count("groups_dirty", dirty)
+    telemetry.count("groups_pruned", pruned)
+    print(f"[+] {counts['new']} new alerts updated {len(batch)} windowed groups "
+          f"({counts['late']} already grouped by watermark {watermark or '-'}, {counts['untimed']} without timestamp)")
+    if pruned:
+        print(f"[~] Pruned {pruned} clean groups older than the retention horizon")
+    print(f"[+] {dirty} dirty of {stats['groups']} groups → {output_file}; watermark now {stats['watermark']}")
+    return counts, dirty
+
+def option(args, name, default):
+    return next((a.split("=", 1)[1] for a in args if a.startswith(f"--{name}=")), default)
+
 def main():
     if not os.path.exists(INPUT_FILE):
         print(f"[!] Input file not found: {INPUT_FILE}")
         return
 
-    matches = load_alert_matches(INPUT_FILE)
-    grouped = group_matches(matches)
-    save_grouped_matches(grouped, OUTPUT_FILE)
+    args = sys.argv[1:]
+    window = option(args, "window", None)
+    if window:
+        slide = option(args, "slide", None)
+        retention = option(args, "retention", None)
+        group_file_windowed(INPUT_FILE, OUTPUT_FILE, parse_duration(window),
+                            parse_duration(slide) if slide else None, option(args, "store", DEFAULT_STORE_FILE),
+                            parse_duration(retention) if retention else DEFAULT_RETENTION_S)
+        return
+
+    matches, groups, spills = group_file(
+        INPUT_FILE, OUTPUT_FILE,
+        max_entries=int(option(args, "max-entries", MAX_BUFFERED_ENTRIES)),
+        partitions=int(option(args, "partitions", SPILL_PARTITIONS)),
+        spill_dir=option(args, "spill-dir", None),
+    )
+    telemetry.count("matches", matches)
+    telemetry.count("groups", groups)
+    telemetry.count("spills", spills)
 
-    print(f"[+] Grouped {len(grouped)} sets of FAISS alert matches → {OUTPUT_FILE}")
+    print(f"[+] Grouped {groups} sets of FAISS alert matches → {OUTPUT_FILE}"
+          + (f" ({spills} spills)" if spills else ""))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Persistent store of time-windowed alert groups for incremental runs.
+
+group_faiss_matches.py --window=... appends each run's new entries to their
+(host, user, tactic, window) group here and marks the group dirty. llm_summary.py
+re-summarizes only dirty groups and marks them clean again. A group's `version` is bumped
+on every update, so a group that changed while its summary was being generated stays dirty.
+The event-time watermark (newest alert timestamp already grouped) is kept alongside,
+with the keys of the alerts at exactly that timestamp so a re-read never counts them twice.
+
+Entries keep the alert, its score and a slim copy of the matched rule (no query text).
+prune() drops clean groups whose window ended more than a retention horizon before
+the watermark, so a store fed every few minutes stays bounded.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_STORE_FILE = "data/group_store.sqlite"
+DEFAULT_RETENTION_S = 7 * 86400  # clean windows ending this long before the watermark are pruned
+STORED_RULE_FIELDS = ("title", "tactic", "technique", "technique_id", "risk_score")
+
+
+def stored_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """The entry with its matched rule cut down to what the summary stages read."""
+    rule = entry.get("matched_rule") or {}
+    return {**entry, "matched_rule": {k: rule[k] for k in STORED_RULE_FIELDS if k in rule}}
+
+
+class GroupStore:
+    def __init__(self, path: str = DEFAULT_STORE_FILE) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS groups ("
+            " group_id TEXT PRIMARY KEY,"
+            " host TEXT NOT NULL,"
+            " user TEXT NOT NULL,"
+            " tactic TEXT NOT NULL,"
+            " window_start TEXT NOT NULL,"
+            " window_end TEXT NOT NULL,"
+            " alert_count INTEGER NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " dirty INTEGER NOT NULL,"
+            " updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_dirty ON groups(dirty);"
+            "CREATE INDEX IF NOT EXISTS idx_window_end ON groups(window_end);"
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " group_id TEXT NOT NULL,"
+            " entry TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_entries_group ON entries(group_id);"
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        self._db.commit()
+
+    def get_watermark(self) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = 'watermark'").fetchone()
+        return row[0] if row else None
+
+    def get_watermark_keys(self) -> List[str]:
+        """Keys of the alerts grouped at exactly the watermark timestamp."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = 'watermark_keys'").fetchone()
+        return json.loads(row[0]) if row else []
+
+    def add_entries(self, batch: Dict[str, Dict[str, Any]], watermark: Optional[str] = None,
+                    watermark_keys: Optional[List[str]] = None) -> None:
+        """Append {group_id: {host, user, tactic, window_start, window_end, entries}} and mark those groups dirty.
+
+        The watermark (and the keys of the alerts at it) is stored in the same transaction,
+        so a crash never skips or double-counts alerts.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            for group_id, group in batch.items():
+                entries = group["entries"]
+                self._db.execute(
+                    "INSERT INTO groups (group_id, host, user, tactic, window_start, window_end,"
+                    " alert_count, version, dirty, updated) VALUES (?, ?, ?, ?, ?, ?, ?, 1, 1, ?)"
+                    " ON CONFLICT(group_id) DO UPDATE SET alert_count = alert_count + excluded.alert_count,"
+                    " version = version + 1, dirty = 1, updated = excluded.updated",
+                    (group_id, group["host"], group["user"], group["tactic"], group["window_start"],
+                     group["window_end"], len(entries), now),
+                )
+                self._db.executemany(
+                    "INSERT INTO entries (group_id, entry) VALUES (?, ?)",
+                    ((group_id, json.dumps(stored_entry(entry))) for entry in entries),
+                )
+            if watermark is not None:
+                self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('watermark', ?)", (watermark,))
+            if watermark_keys is not None:
+                self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('watermark_keys', ?)",
+                                 (json.dumps(sorted(watermark_keys)),))
+
+    def prune(self, retention_s: float = DEFAULT_RETENTION_S) -> int:
+        """Delete clean groups (and their entries) whose window ended retention_s before the watermark."""
+        watermark = self.get_watermark()
+        if not watermark:
+            return 0
+        cutoff = (datetime.fromisoformat(watermark) - timedelta(seconds=retention_s)).isoformat()
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM entries WHERE group_id IN"
+                " (SELECT group_id FROM groups WHERE dirty = 0 AND window_end < ?)", (cutoff,))
+            return self._db.execute("DELETE FROM groups WHERE dirty = 0 AND window_end < ?", (cutoff,)).rowcount
+
+    def iter_dirty(self) -> Iterator[Dict[str, Any]]:
+        """Yield every dirty group as a grouped-match record (plus window and version)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT group_id, host, user, tactic, window_start, window_end, alert_count, version"
+                " FROM groups WHERE dirty = 1 ORDER BY window_start, group_id"
+            ).fetchall()
+        for group_id, host, user, tactic, window_start, window_end, alert_count, version in rows:
+            with self._lock:
+                entries = [json.loads(entry) for (entry,) in self._db.execute(
+                    "SELECT entry FROM entries WHERE group_id = ? ORDER BY rowid", (group_id,))]
+            yield {
+                "group_id": group_id,
+                "host": host,
+                "user": user,
+                "tactic": tactic,
+                "alert_count": alert_count,
+                "entries": entries,
+                "window_start": window_start,
+                "window_end": window_end,
+                "version": version,
+            }
+
+    def mark_clean(self, groups: Iterable[Tuple[str, int]]) -> int:
+        """Clear the dirty flag for (group_id, version) pairs unless the group changed since."""
+        with self._lock, self._db:
+            cursor = self._db.executemany(
+                "UPDATE groups SET dirty = 0 WHERE group_id = ? AND version = ?", list(groups)
+            )
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total, dirty = self._db.execute("SELECT COUNT(*), COALESCE(SUM(dirty), 0) FROM groups").fetchone()
+        watermark = self.get_watermark()
+        return {"groups": total, "dirty": dirty, "watermark": watermark}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def dirty_versions(records: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """(group_id, version) of the store-backed groups among `records`."""
+    return [(r["group_id"], r["version"]) for r in records if "version" in r and "group_id" in r]
@@ -0,0 +1,131 @@
+# scripts/index_factory.py
+#
+# FAISS index choices for rule retrieval. The exhaustive flat scan is exact and
+# fine for a few thousand rules; the ANN options trade a little recall for much
+# lower query latency on 50k+ rule sets:
+#
+#   flat   exact L2 scan (default)
+#   ip     exact inner product on L2-normalised vectors (cosine similarity)
+#   hnsw   graph index; no training, but no in-place removal either
+#   ivfpq  inverted lists + product quantisation; trained, compact, lossy
+#
+# The chosen type and its parameters are written to PARAMS_FILE next to
+# faiss_index.bin, so query_faiss.py applies the matching search-time settings
+# (efSearch / nprobe) and query normalisation without extra flags.
+
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+PARAMS_FILE = "data/faiss_index.json"
+DEFAULT_TYPE = "flat"
+
+INDEX_TYPES = {
+    "flat": {},
+    "ip": {},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivfpq": {"nlist": 1024, "m": 48, "nbits": 8, "nprobe": 16},
+}
+
+
+def index_params(index_type=DEFAULT_TYPE, **overrides):
+    """Default parameters for index_type, with overrides applied."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {index_type!r} (choose from {', '.join(INDEX_TYPES)})")
+    return {"type": index_type, **INDEX_TYPES[index_type], **overrides}
+
+
+def parse_overrides(args):
+    """--index-param=name=value flags → {name: int/float value}."""
+    overrides = {}
+    for arg in args:
+        if arg.startswith("--index-param="):
+            name, value = arg.split("=", 2)[1:]
+            overrides[name] = float(value) if "." in value else int(value)
+    return overrides
+
+
+def uses_inner_product(params):
+    return params["type"] == "ip"
+
+
+def supports_remove(params):
+    """HNSW graphs cannot drop vectors; changed rules force a rebuild."""
+    return params["type"] != "hnsw"
+
+
+def _fit_ivfpq(params, dim, n):
+    """Shrink nlist/m/nbits so training is valid for small rule sets."""
+    nlist = max(1, min(params["nlist"], n // 39))  # FAISS wants ~39 points per centroid
+    m = params["m"]
+    while dim % m:
+        m -= 1
+    nbits = max(1, min(params["nbits"], int(math.log2(max(n // 39, 2)))))  # same rule per PQ codebook
+    return nlist, m, nbits
+
+
+def make_index(params, dim, n_train=0):
+    """Return an empty IndexIDMap2 around the configured index (untrained for ivfpq).
+
+    For ivfpq the sizes actually used are recorded in params["built"].
+    """
+    kind = params["type"]
+    metric = faiss.METRIC_INNER_PRODUCT if uses_inner_product(params) else faiss.METRIC_L2
+    if kind in ("flat", "ip"):
+        base = faiss.index_factory(dim, "Flat", metric)
+    elif kind == "hnsw":
+        base = faiss.index_factory(dim, f"HNSW{params['M']},Flat", metric)
+        faiss.downcast_index(base).hnsw.efConstruction = params["ef_construction"]
+    else:
+        nlist, m, nbits = _fit_ivfpq(params, dim, n_train)
+        params["built"] = {"nlist": nlist, "m": m, "nbits": nbits}
+        base = faiss.index_factory(dim, f"IVF{nlist},PQ{m}x{nbits}", metric)
+    return faiss.IndexIDMap2(base)
+
+
+def configure(index, params):
+    """Apply search-time parameters to a built or freshly loaded index."""
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if params["type"] == "hnsw":
+        base.hnsw.efSearch = params["ef_search"]
+    elif params["type"] == "ivfpq":
+        base.nprobe = min(params["nprobe"], base.nlist)
+    return index
+
+
+def subset_search(index, ids):
+    """Return search(vectors, k) over the given FAISS IDs only.
+
+    flat/ip/hnsw hold full vectors, so the subset is copied into a small exact flat
+    index and its cost scales with the subset. ivfpq codes are lossy, so it searches
+    the main index through an ID selector instead.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(base, faiss.IndexIVF):
+        selector = faiss.IDSelectorBatch(ids)
+        search_params = faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+
+        def search(vectors, k, _selector=selector):  # the default arg keeps the selector alive
+            return index.search(vectors, k, params=search_params)
+        return search
+
+    sub = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+    sub.add_with_ids(np.vstack([index.reconstruct(int(i)) for i in ids]), ids)
+    return sub.search
+
+
+def load_params(path=PARAMS_FILE):
+    """Saved parameters, or flat defaults for indexes built before PARAMS_FILE existed."""
+    if not os.path.exists(path):
+        return index_params(DEFAULT_TYPE)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_params(params, path=PARAMS_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
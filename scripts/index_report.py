@@ -0,0 +1,130 @@
+# scripts/index_report.py
+#
+# Recall-vs-latency comparison of the index_factory options against the exact
+# flat L2 scan. Rule vectors come from parsed_rules.jsonl; --synthetic=N pads the
+# corpus to N vectors with jittered copies to emulate a 50k+ multi-vendor rule
+# set. Queries are normalized alerts (or jittered rules when none exist).
+#
+#   python scripts/index_report.py [--types=flat,ip,hnsw,ivfpq] [--synthetic=50000]
+#                                  [--queries=1000] [--k=5]
+
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+import embed_chunks
+import index_factory
+import query_faiss
+
+REPORT_FILE = "data/index_report.json"
+DEFAULT_QUERIES = 1000
+JITTER = 0.05
+SEED = 1337
+
+# Search-time knob swept per type to trace the recall/latency curve
+SWEEPS = {
+    "hnsw": ("ef_search", [16, 32, 64, 128, 256]),
+    "ivfpq": ("nprobe", [1, 4, 16, 64]),
+}
+
+
+def option(args, name, default):
+    return next((a.split("=", 1)[1] for a in args if a.startswith(f"--{name}=")), default)
+
+
+def jittered(vectors, count, rng):
+    """`count` noisy copies of random rows, renormalised like the encoder output."""
+    picks = vectors[rng.integers(0, len(vectors), count)]
+    noisy = picks + rng.normal(0, JITTER, picks.shape).astype("float32")
+    faiss.normalize_L2(noisy)
+    return noisy
+
+
+def load_vectors(model, synthetic, n_queries, rng):
+    rules = embed_chunks.load_rules()
+    print(f"[*] Embedding {len(rules)} rules...")
+    base = model.encode([embed_chunks.rule_to_text(r) for r in rules], convert_to_numpy=True,
+                        normalize_embeddings=True).astype("float32")
+    if synthetic > len(base):
+        base = np.vstack([base, jittered(base, synthetic - len(base), rng)])
+
+    if os.path.exists(query_faiss.ALERT_FILE):
+        alerts = query_faiss.load_alerts()[:n_queries]
+        queries = model.encode([query_faiss.alert_to_text(a) for a in alerts], convert_to_numpy=True,
+                               normalize_embeddings=True).astype("float32")
+    else:
+        queries = jittered(base, n_queries, rng)
+    return base, queries
+
+
+def measure(index, queries, k, truth):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    seconds = time.perf_counter() - start
+    hits = sum(len(set(row) & set(ref)) for row, ref in zip(found, truth))
+    return {
+        "recall_at_k": round(hits / truth.size, 4),
+        "ms_per_query": round(seconds * 1000 / len(queries), 4),
+    }
+
+
+def evaluate(index_type, vectors, queries, k, truth):
+    params = index_factory.index_params(index_type)
+    start = time.perf_counter()
+    index = index_factory.make_index(params, vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    build_s = time.perf_counter() - start
+    size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+    knob, values = SWEEPS.get(index_type, (None, [None]))
+    rows = []
+    for value in values:
+        if knob:
+            params[knob] = value
+        index_factory.configure(index, params)
+        row = {"type": index_type, "build_s": round(build_s, 3), "size_mb": round(size_mb, 2)}
+        if knob:
+            row[knob] = value
+        row.update(measure(index, queries, k, truth))
+        print(f"    {index_type:<6} {(f'{knob}={value}' if knob else ''):<14} "
+              f"recall@{k} {row['recall_at_k']:.3f}  {row['ms_per_query']:.3f} ms/query  "
+              f"build {row['build_s']:.1f}s  {row['size_mb']:.1f} MB")
+        rows.append(row)
+    return rows
+
+
+def main():
+    args = sys.argv[1:]
+    types = option(args, "types", ",".join(index_factory.INDEX_TYPES)).split(",")
+    synthetic = int(option(args, "synthetic", 0))
+    n_queries = int(option(args, "queries", DEFAULT_QUERIES))
+    k = int(option(args, "k", query_faiss.TOP_K))
+
+    rng = np.random.default_rng(SEED)
+    model = SentenceTransformer(embed_chunks.EMBED_MODEL)
+    vectors, queries = load_vectors(model, synthetic, n_queries, rng)
+    print(f"[*] {len(vectors)} vectors, {len(queries)} queries, k={k}")
+
+    # Ground truth: exact L2 neighbours, i.e. what the default flat index returns
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for index_type in types:
+        results.extend(evaluate(index_type, vectors, queries, k, truth))
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"vectors": len(vectors), "queries": len(queries), "k": k, "results": results}, f, indent=2)
+    print(f"[+] Report → {REPORT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
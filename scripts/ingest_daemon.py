@@ -0,0 +1,345 @@
+# scripts/ingest_daemon.py
+#
+# Long-running ingestion service. Alerts arrive from a spool directory (files
+# dropped into --spool, in any format normalize_alerts.iter_alerts() reads) and/or
+# a local socket (--socket=127.0.0.1:9515 or a unix socket path; one JSON alert
+# per line). They are normalized, micro-batched through the embedding +
+# index.search path, folded into time-windowed groups in the group store, and the
+# dirty groups are re-summarized on a timer. Usage:
+#
+#   python scripts/ingest_daemon.py [--spool=data/spool] [--socket=127.0.0.1:9515]
+#       [--window=15m] [--slide=5m] [--retention=7d] [--batch-size=256] [--max-latency=2s]
+#       [--queue-size=10000] [--summary-interval=60s] [--model=llama3:8b] [--no-llm]
+#
+# Backpressure: the intake queue holds at most --queue-size alerts; when it is
+# full, spool reading pauses and socket clients stop being read (TCP flow
+# control pushes back on the sender). --max-latency bounds how long an alert
+# waits for its batch to fill; --summary-interval bounds how stale a dirty
+# group's summary can get. Spool files should be written elsewhere and renamed
+# in. A spool file moves to <spool>/processed only once all of its alerts are in
+# the group store, or to <spool>/failed if it could not be read or one of its
+# batches was dropped; after a crash it is still in the spool and is read again.
+
+import asyncio
+import json
+import os
+import shutil
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from group_faiss_matches import group_windowed, parse_duration, parse_timestamp
+from group_store import DEFAULT_RETENTION_S, DEFAULT_STORE_FILE, GroupStore
+from normalize_alerts import iter_alerts, normalize
+
+SPOOL_DIR = "data/spool"
+SPOOL_SUFFIXES = (".json", ".jsonl", ".ndjson")
+SPOOL_POLL_S = 1.0
+DEFAULT_WINDOW = "15m"
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_MAX_LATENCY = "2s"
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_SUMMARY_INTERVAL = "60s"
+DEFAULT_MODEL = "llama3:8b"
+CLIENT_DRAIN_S = 5.0  # on shutdown, how long connected socket clients get to finish sending
+
+
+def option(args, name, default):
+    return next((a.split("=", 1)[1] for a in args if a.startswith(f"--{name}=")), default)
+
+
+class Retriever:
+    """Embedding model + FAISS index, loaded once and used from a single worker thread."""
+
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+        import query_faiss
+
+        self._query_faiss = query_faiss
+        self.model = SentenceTransformer(query_faiss.EMBED_MODEL)
+        self.index, self.metadata = query_faiss.load_index_and_metadata()
+        self.partitions = query_faiss.build_partitions(self.index, self.metadata)
+        self.lexical = query_faiss.load_lexical_index()
+
+    def match(self, alerts):
+        return [{"alert": alert, "matches": match_set}
+                for alert, match_set in self._query_faiss.search_alerts(self.model, self.index, self.metadata, alerts,
+                                                                        partitions=self.partitions,
+                                                                        lexical=self.lexical)]
+
+
+class SpoolFile:
+    """A spool file whose alerts are still in flight."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = 0     # alerts queued but not yet stored (or dropped)
+        self.read = False    # every alert has been queued
+        self.failed = False  # unreadable, or a batch with its alerts was dropped
+
+
+class IngestDaemon:
+    def __init__(self, spool=None, socket_addr=None, window=DEFAULT_WINDOW, slide=None,
+                 batch_size=DEFAULT_BATCH_SIZE, max_latency=DEFAULT_MAX_LATENCY, queue_size=DEFAULT_QUEUE_SIZE,
+                 summary_interval=DEFAULT_SUMMARY_INTERVAL, model=DEFAULT_MODEL, with_llm=True,
+                 store_path=DEFAULT_STORE_FILE, retention=None, retriever=None):
+        self.spool = spool
+        self.socket_addr = socket_addr
+        self.window = parse_duration(window)
+        self.slide = parse_duration(slide) if slide else None
+        self.retention = parse_duration(retention) if retention else DEFAULT_RETENTION_S
+        self.batch_size = batch_size
+        self.max_latency = parse_duration(max_latency)
+        self.summary_interval = parse_duration(summary_interval)
+        self.model = model
+        self.with_llm = with_llm
+        self.store = GroupStore(store_path)
+        self.intake = asyncio.Queue(maxsize=queue_size)
+        self.dirty = asyncio.Event()
+        self.stopping = asyncio.Event()
+        # One thread for retrieval/grouping (the model is not shared), one for summaries
+        self._retrieval_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+        self._summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self.retriever = retriever  # anything with match(alerts); Retriever() is loaded by run() if None
+        self._clients = {}  # handler task -> its StreamReader
+        self._spooled = {}  # spool file name -> SpoolFile, until it is moved out of the spool
+
+    # --- sources -------------------------------------------------------------
+
+    async def watch_spool(self):
+        for sub in ("processed", "failed"):
+            os.makedirs(os.path.join(self.spool, sub), exist_ok=True)
+        print(f"[*] Watching spool directory {self.spool}")
+        while not self.stopping.is_set():
+            names = sorted(n for n in os.listdir(self.spool) if n.lower().endswith(SPOOL_SUFFIXES))
+            for name in names:
+                if self.stopping.is_set():
+                    break
+                if name in self._spooled:
+                    continue  # still being stored
+                spooled = self._spooled[name] = SpoolFile(os.path.join(self.spool, name))
+                try:
+                    for alert in iter_alerts(spooled.path):
+                        spooled.pending += 1
+                        await self.intake.put((time.perf_counter(), alert, spooled))  # blocks while the queue is full
+                    print(f"[+] Spooled {spooled.pending} alerts from {name}")
+                except (OSError, ValueError) as e:
+                    print(f"[!] Could not read {name}: {e}")
+                    spooled.failed = True
+                spooled.read = True
+                self.settle(spooled)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), SPOOL_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    def settle(self, spooled):
+        """Move a spool file out of the spool once none of its alerts are in flight."""
+        if spooled.read and spooled.pending == 0:
+            name = os.path.basename(spooled.path)
+            shutil.move(spooled.path, os.path.join(self.spool, "failed" if spooled.failed else "processed", name))
+            del self._spooled[name]
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername") or "unix"
+        received = 0
+        self._clients[asyncio.current_task()] = reader
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    alert = json.loads(line)
+                except ValueError:
+                    telemetry.count("bad_lines")
+                    continue
+                # Not reading while the queue is full lets TCP flow control throttle the sender
+                await self.intake.put((time.perf_counter(), alert, None))
+                received += 1
+        finally:
+            self._clients.pop(asyncio.current_task(), None)
+            writer.close()
+            print(f"[#] {peer}: {received} alerts")
+
+    async def serve_socket(self):
+        if "/" in self.socket_addr:
+            server = await asyncio.start_unix_server(self.handle_client, path=self.socket_addr)
+        else:
+            host, _, port = self.socket_addr.rpartition(":")
+            server = await asyncio.start_server(self.handle_client, host or "127.0.0.1", int(port))
+        print(f"[*] Listening on {self.socket_addr}")
+        await self.stopping.wait()
+        server.close()  # stop accepting new clients
+        if self._clients:
+            # Give connected clients a moment to finish, then end their streams: lines already
+            # received are still queued, so run() only joins the intake once they are in it
+            print(f"[*] Draining {len(self._clients)} socket client(s)...")
+            await asyncio.wait(list(self._clients), timeout=CLIENT_DRAIN_S)
+            for reader in self._clients.values():
+                reader.feed_eof()
+            await asyncio.gather(*self._clients, return_exceptions=True)
+
+    # --- processing ----------------------------------------------------------
+
+    async def next_batch(self):
+        """Up to batch_size alerts; returns early once the oldest has waited max_latency."""
+        first = await self.intake.get()
+        batch = [first]
+        deadline = first[0] + self.max_latency
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.intake.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def process(self, alerts):
+        """Normalize → retrieve → fold into windowed groups (runs on the retrieval thread)."""
+        with telemetry.span("normalize"):
+            normalized = [normalize(alert) for alert in alerts]
+        with telemetry.span("retrieve"):
+            matches = self.retriever.match(normalized)
+        with telemetry.span("group"):
+            # Live streams arrive out of order, so every alert is kept; the watermark only advances
+            batch, newest, newest_keys, counts = group_windowed(matches, self.window, self.slide)
+            stored = self.store.get_watermark()
+            if stored and newest and parse_timestamp(stored) > parse_timestamp(newest):
+                newest, newest_keys = stored, None
+            elif stored and newest and parse_timestamp(stored) == parse_timestamp(newest):
+                newest_keys = sorted(set(newest_keys) | set(self.store.get_watermark_keys()))
+            self.store.add_entries(batch, newest, newest_keys)
+            self.store.prune(self.retention)
+        return len(batch), counts
+
+    async def run_pipeline(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            try:
+                groups, counts = await loop.run_in_executor(self._retrieval_pool, self.process,
+                                                            [alert for _, alert, _ in batch])
+                dropped = False
+            except Exception as e:
+                print(f"[!] Dropped a batch of {len(batch)} alerts: {e}")
+                telemetry.count("alerts_failed", len(batch))
+                groups, counts, dropped = 0, {"untimed": 0}, True
+            for _, _, spooled in batch:
+                if spooled is not None:
+                    spooled.pending -= 1
+                    spooled.failed = spooled.failed or dropped
+                    self.settle(spooled)
+            latency = time.perf_counter() - batch[0][0]
+            telemetry.count("alerts", len(batch))
+            telemetry.count("alerts_untimed", counts["untimed"])
+            telemetry.gauge("batch_latency_s", round(latency, 3))
+            telemetry.gauge("queue_depth", self.intake.qsize())
+            print(f"[+] Batch of {len(batch)} alerts → {groups} groups updated "
+                  f"({latency:.2f}s from arrival, queue {self.intake.qsize()})")
+            if groups:
+                self.dirty.set()
+            for _ in batch:
+                self.intake.task_done()
+
+    def summarize_dirty(self):
+        import llm_summary
+        from nest_grouped_matches import nest_for_summary
+
+        groups = list(self.store.iter_dirty())
+        if not groups:
+            return 0
+        llm_summary.summarize_nested(nest_for_summary(groups), self.model, llm_summary.DEFAULT_WORKERS,
+                                     llm_summary.OUTPUT_FILE, store_path=self.store.path)
+        return len(groups)
+
+    async def run_summaries(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.dirty.wait()
+            # Coalesce updates for up to summary_interval before summarizing
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.summary_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.dirty.clear()
+            try:
+                count = await loop.run_in_executor(self._summary_pool, self.summarize_dirty)
+            except Exception as e:  # keep ingesting; the groups stay dirty and are retried next round
+                print(f"[!] Summarization failed: {e}")
+                if self.stopping.is_set():
+                    return  # no retry on shutdown; the groups stay dirty for the next start
+                self.dirty.set()
+                continue
+            telemetry.count("groups_summarized", count)
+            telemetry.flush()
+            if self.stopping.is_set():
+                return
+
+    # --- lifecycle -----------------------------------------------------------
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        if self.retriever is None:
+            print("[*] Loading embedding model and FAISS index...")
+            self.retriever = await loop.run_in_executor(self._retrieval_pool, Retriever)
+
+        sources = []
+        if self.spool:
+            sources.append(asyncio.create_task(self.watch_spool()))
+        if self.socket_addr:
+            sources.append(asyncio.create_task(self.serve_socket()))
+        pipeline = asyncio.create_task(self.run_pipeline())
+        summaries = asyncio.create_task(self.run_summaries()) if self.with_llm else None
+        print("[+] Ingestion daemon running (Ctrl-C to stop)")
+
+        await self.stopping.wait()
+        print("[*] Stopping: draining queued alerts...")
+        await asyncio.gather(*sources, return_exceptions=True)
+        await self.intake.join()
+        pipeline.cancel()
+        if summaries is not None:
+            if self.dirty.is_set():
+                await summaries  # one last pass over the remaining dirty groups
+            else:
+                summaries.cancel()
+        self._retrieval_pool.shutdown()
+        self._summary_pool.shutdown()
+        self.store.close()
+        telemetry.flush()
+        print("[+] Stopped.")
+
+
+def main():
+    args = sys.argv[1:]
+    spool = option(args, "spool", None)
+    socket_addr = option(args, "socket", None)
+    if not spool and not socket_addr:
+        spool = SPOOL_DIR
+    daemon = IngestDaemon(
+        spool=spool,
+        socket_addr=socket_addr,
+        window=option(args, "window", DEFAULT_WINDOW),
+        slide=option(args, "slide", None),
+        retention=option(args, "retention", None),
+        batch_size=int(option(args, "batch-size", DEFAULT_BATCH_SIZE)),
+        max_latency=option(args, "max-latency", DEFAULT_MAX_LATENCY),
+        queue_size=int(option(args, "queue-size", DEFAULT_QUEUE_SIZE)),
+        summary_interval=option(args, "summary-interval", DEFAULT_SUMMARY_INTERVAL),
+        model=option(args, "model", DEFAULT_MODEL),
+        with_llm="--no-llm" not in args,
+    )
+    asyncio.run(daemon.run())
+
+
+if __name__ == "__main__":
+    main()
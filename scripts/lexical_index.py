@@ -0,0 +1,122 @@
+# scripts/lexical_index.py
+#
+# BM25 inverted index over rule titles, MITRE technique IDs/names, tactics, tags
+# and query tokens, written by embed_chunks.py next to the FAISS index and keyed
+# by the same FAISS IDs. query_faiss.py fuses its ranking with the dense search
+# by reciprocal rank, so exact tokens such as "T1486" or "cmd.exe" count even
+# when the sentence embedding only matches them loosely.
+#
+# Tokens are lower-cased runs of letters, digits, "_", "." and "-"; compound
+# tokens also add their parts ("cmd.exe" → cmd.exe, cmd, exe) and sub-technique
+# IDs add their parent ("t1059.001" → t1059.001, t1059, 001).
+
+import json
+import re
+
+import numpy as np
+
+LEXICAL_INDEX_FILE = "data/lexical_index.json"
+K1 = 1.2
+B = 0.75
+RRF_K = 60  # reciprocal rank fusion damping; the usual default
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9_.\-]*[a-z0-9]|[a-z0-9]")
+TECHNIQUE_RE = re.compile(r"\bT\d{4}(?:\.\d{3})?\b", re.IGNORECASE)
+STOPWORDS = {"a", "an", "and", "are", "as", "by", "for", "from", "in", "is", "of", "on", "or", "the",
+             "to", "via", "with", "where", "not", "true", "false", "alert", "detected", "involving"}
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(str(text).lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = [p for p in re.split(r"[_.\-]", token) if p and p not in STOPWORDS]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def technique_ids(text):
+    """Parent technique IDs mentioned in text ('T1059.001' → 'T1059')."""
+    return {match.upper().split(".", 1)[0] for match in TECHNIQUE_RE.findall(str(text))}
+
+
+def rule_tokens(rule):
+    fields = [rule.get("title", ""), rule.get("technique_id", ""), rule.get("technique", ""),
+              rule.get("tactic", ""), " ".join(rule.get("tags") or []), rule.get("query", "")]
+    return tokenize(" ".join(str(f) for f in fields if f))
+
+
+def write_index(path, metadata):
+    """Write the index for {faiss_id: rule}."""
+    postings, doc_len, by_technique = {}, {}, {}
+    for faiss_id, rule in metadata.items():
+        tokens = rule_tokens(rule)
+        doc_len[faiss_id] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            postings.setdefault(token, []).append([faiss_id, tf])
+        for technique in technique_ids(rule.get("technique_id", "")):
+            by_technique.setdefault(technique, []).append(faiss_id)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"k1": K1, "b": B, "doc_len": doc_len, "postings": postings,
+                   "techniques": by_technique}, f)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """[[id, ...] best first, ...] → [(id, fused score)] best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+class LexicalIndex:
+    """BM25 search over a written index; per-posting weights are precomputed at load."""
+
+    def __init__(self, path=LEXICAL_INDEX_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        doc_len = {int(faiss_id): n for faiss_id, n in data["doc_len"].items()}
+        self.count = len(doc_len)
+        self.slots = max(doc_len, default=-1) + 1
+        avgdl = sum(doc_len.values()) / max(self.count, 1)
+        k1, b = data["k1"], data["b"]
+        self.postings = {}
+        for token, entries in data["postings"].items():
+            ids = np.array([faiss_id for faiss_id, _ in entries], dtype="int64")
+            tf = np.array([tf for _, tf in entries], dtype="float32")
+            lengths = np.array([doc_len[faiss_id] for faiss_id, _ in entries], dtype="float32")
+            idf = np.log(1.0 + (self.count - len(entries) + 0.5) / (len(entries) + 0.5))
+            weights = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / avgdl))
+            self.postings[token] = (ids, weights.astype("float32"))
+        self.techniques = data["techniques"]
+
+    def scores(self, text):
+        scores = np.zeros(self.slots, dtype="float32")
+        for token in tokenize(text):
+            if token in self.postings:
+                ids, weights = self.postings[token]
+                scores[ids] += weights
+        return scores
+
+    def search(self, text, k, ids=None):
+        """Top-k [(faiss_id, score)]: among `ids` if given, else every rule with a positive score."""
+        scores = self.scores(text)
+        if ids is not None:
+            candidates = np.asarray(ids, dtype="int64")
+            scores = scores[candidates]
+        else:
+            candidates = np.flatnonzero(scores > 0)
+            scores = scores[candidates]
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def technique_rules(self, text):
+        """IDs of the rules whose technique ID is mentioned in text."""
+        return [faiss_id for technique in sorted(technique_ids(text))
+                for faiss_id in self.techniques.get(technique, [])]
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Shared HTTP client for the local Ollama server.
+
+Replaces one `ollama run <model>` subprocess per prompt with calls to `/api/generate`
+(the same endpoint the archived summary_p1.py used):
+
+- One keep-alive connection per worker thread, reused across prompts.
+- `keep_alive` pins the model in memory between calls so it stays warm.
+- Optional token streaming via an `on_token` callback.
+- Connect/read timeouts, with a single reconnect if the server dropped an idle socket.
+
+Point it at another server (or the stub in ollama_stub.py) with `OLLAMA_HOST`.
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_KEEP_ALIVE = "30m"  # how long Ollama keeps the model loaded after a call
+DEFAULT_TIMEOUT_S = 300     # per-request socket timeout
+
+
+class LLMError(RuntimeError):
+    """Raised when the Ollama server is unreachable or returns an error."""
+
+
+class OllamaClient:
+    """Thread-safe `/api/generate` client with per-thread persistent connections."""
+
+    def __init__(
+        self,
+        model: str,
+        host: str = DEFAULT_HOST,
+        keep_alive: str = DEFAULT_KEEP_ALIVE,
+        timeout: float = DEFAULT_TIMEOUT_S,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if "://" not in host:
+            host = "http://" + host
+        parts = urlsplit(host)
+        self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.options = dict(options or {})
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "eval_tokens": 0, "eval_duration_ns": 0}
+
+    # -- connection handling ------------------------------------------------
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            conn = cls(self._netloc, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def close(self) -> None:
+        """Close the calling thread's connection."""
+        self._reset()
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> http.client.HTTPResponse:
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (ConnectionError, http.client.HTTPException) as e:
+                # An idle keep-alive socket may have been closed server-side; reconnect once.
+                self._reset()
+                if attempt == 2:
+                    raise LLMError(f"cannot reach Ollama at {self.host}: {e}") from e
+                continue
+            except OSError as e:  # timeouts, DNS failures, refused connections
+                self._reset()
+                raise LLMError(f"cannot reach Ollama at {self.host}: {e}") from e
+
+            if resp.status != 200:
+                detail = resp.read().decode(errors="ignore").strip()
+                self._reset()
+                raise LLMError(f"Ollama returned HTTP {resp.status} for model '{self.model}': {detail}")
+            return resp
+        raise AssertionError("unreachable")
+
+    # -- API -----------------------------------------------------------------
+
+    def generate(
+        self,
+        prompt: str,
+        stream: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+        format: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Return the full completion for `prompt`.
+
+        With `stream=True` tokens are read as they are generated and passed to `on_token`.
+        `format="json"` enables Ollama's JSON-constrained output.
+        """
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        merged = {**self.options, **(options or {})}
+        if merged:
+            payload["options"] = merged
+        if format:
+            payload["format"] = format
+
+        try:
+            resp = self._post("/api/generate", payload)
+            if stream:
+                pieces = []
+                final: Dict[str, Any] = {}
+                for line in resp:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise LLMError(chunk["error"])
+                    token = chunk.get("response", "")
+                    if token:
+                        pieces.append(token)
+                        if on_token:
+                            on_token(token)
+                    if chunk.get("done"):
+                        final = chunk  # keep reading to EOF so the connection can be reused
+                text = "".join(pieces)
+            else:
+                final = json.loads(resp.read())
+                if "error" in final:
+                    raise LLMError(final["error"])
+                text = final.get("response", "")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self._reset()
+            raise LLMError(f"request to {self.host} failed: {e}") from e
+
+        self._record(final)
+        return text.strip()
+
+    def _record(self, final: Dict[str, Any]) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += int(final.get("prompt_eval_count", 0) or 0)
+            self.stats["eval_tokens"] += int(final.get("eval_count", 0) or 0)
+            self.stats["eval_duration_ns"] += int(final.get("eval_duration", 0) or 0)
+
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(model: str, **kwargs: Any) -> OllamaClient:
+    """Return a process-wide client for `model`, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(model)
+        if client is None:
+            client = _clients[model] = OllamaClient(model, **kwargs)
+        return client
@@ -2,63 +2,477 @@
 """Summarize grouped FAISS matches with OpenLLaMA.
 
 - Keeps original paths.
-- Adds robust error handling around the Ollama CLI so you can actually see why a run fails (e.g. model not pulled, daemon not running, bad tag).
+- Talks to the Ollama server over HTTP (see llm_client.py) with robust error handling so you can actually see why a run fails (e.g. model not pulled, daemon not running, bad tag).
 - Lets you override the model on the command line:  `python scripts/llm_summary.py llama3:8b`.
+- Summarizes groups concurrently with a bounded worker pool:  `python scripts/llm_summary.py llama3:8b 4`.
+  Start the server with `OLLAMA_NUM_PARALLEL` >= the worker count so requests are actually served in parallel.
+- Reuses summaries of unchanged groups from a persistent cache (summary_cache.py); set `USE_CACHE = False` to force regeneration.
+- Packs small groups (<= SMALL_GROUP_ALERTS alerts) several to a prompt and asks for a JSON array of summaries;
+  groups missing from a malformed reply are retried one by one. Third argument sets groups per prompt (1 disables):
+  `python scripts/llm_summary.py llama3:8b 4 10`.
+- Incremental with windowed grouping (`group_faiss_matches.py --window=... [--store=PATH]`): pass the same store as
+  `--store=PATH` (bare `--store` for data/group_store.sqlite). The input then holds only dirty groups, their summaries
+  replace the matching records in the output file, and the groups are marked clean in that store.
 """
 
 import json
-import subprocess
 import os
+import re
 import sys
-from typing import Any, Dict, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import telemetry
+from group_store import DEFAULT_STORE_FILE, GroupStore, dirty_versions
+from llm_client import LLMError, get_client
+from summary_cache import DEFAULT_CACHE_FILE, SummaryCache, cache_key
 
 INPUT_FILE = "data/nested_grouped_matches.json"
 OUTPUT_FILE = "data/group_summaries.jsonl"
 DEFAULT_MODEL = "llama3:8b"  # override with argv[1]
+DEFAULT_WORKERS = 4  # in-flight LLM requests, override with argv[2]
+DEFAULT_BATCH_GROUPS = 10  # small groups per prompt, override with argv[3]
+SMALL_GROUP_ALERTS = 2  # groups up to this size are batched
+USE_CACHE = True
+CACHE_FILE = DEFAULT_CACHE_FILE
+CACHE_MAX_ENTRIES = 50_000
+NUM_CTX = 4096  # matches PARAMETER num_ctx in data/models/Modelfile
+RESPONSE_TOKENS = 768  # left free for the summary itself
+PROMPT_TOKEN_BUDGET = NUM_CTX - RESPONSE_TOKENS
+CHARS_PER_TOKEN = 4  # rough English/log-text average; no tokenizer needed
+MAX_DESCRIPTION_CHARS = 400
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def scan_json(text: str, opener: str, closer: str) -> Any:
+    """Return first syntactically-valid JSON substring (raises if none)."""
+    start = text.find(opener)
+    while start != -1:
+        depth = 0
+        for idx in range(start, len(text)):
+            ch = text[idx]
+            if ch == opener:
+                depth += 1
+            elif ch == closer:
+                depth -= 1
+                if depth == 0:
+                    snippet = text[start : idx + 1]
+                    try:
+                        return json.loads(snippet)
+                    except json.JSONDecodeError:
+                        break
+        start = text.find(opener, start + 1)
+    raise ValueError("no valid JSON block found")
+
+
+def _distance(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("inf")  # lexical-only matches have no FAISS distance and rank after real ones
+
+
+def _risk(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0  # "N/A" and missing scores rank last
+
+
+_VOLATILE = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?"  # ISO timestamps
+    r"|\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}:\d{2}:\d{2}(?:\.\d+)?\b"                  # bare dates / times
+    r"|\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"                 # GUIDs
+)
+
+
+def _signature(description: str) -> str:
+    """Cluster key: descriptions that differ only in case, spacing, timestamps or GUIDs.
 
+    Technique IDs, host names and other numbers are kept, so T1486 and T1490 or
+    HOST-01 and HOST-09 stay separate evidence.
+    """
+    return re.sub(r"\s+", " ", _VOLATILE.sub("#", description.casefold())).strip()
 
-def format_prompt(tactic: str, technique: str, host_user: str, entries: List[Dict[str, Any]]) -> str:
-    """Build an LLM‑ready executive‑level prompt from alert entries."""
-    sample_descriptions = [e["alert"].get("description", "") for e in entries[:10]]
-    sample_text = "\n".join(f"- {desc}" for desc in sample_descriptions)
-    return (
+
+def rank_evidence(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Collapse entries into description clusters, highest rule risk then closest FAISS match first."""
+    clusters: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        description = str(entry.get("alert", {}).get("description", "")).strip()
+        if not description:
+            continue
+        rule = entry.get("matched_rule") or {}
+        risk = _risk(rule.get("risk_score"))
+        score = _distance(entry.get("score"))  # L2 distance: lower is closer
+        cluster = clusters.get(_signature(description))
+        if cluster is None:
+            clusters[_signature(description)] = {"description": description, "rule": rule.get("title", ""),
+                                                 "risk": risk, "score": score, "count": 1}
+            continue
+        cluster["count"] += 1
+        if (-risk, score) < (-cluster["risk"], cluster["score"]):
+            cluster.update(description=description, rule=rule.get("title", ""), risk=risk, score=score)
+    return sorted(clusters.values(), key=lambda c: (-c["risk"], c["score"], -c["count"]))
+
+
+def evidence_line(cluster: Dict[str, Any]) -> str:
+    description = cluster["description"]
+    if len(description) > MAX_DESCRIPTION_CHARS:
+        description = description[:MAX_DESCRIPTION_CHARS].rstrip() + "…"
+    notes = []
+    if cluster["count"] > 1:
+        notes.append(f"x{cluster['count']}")
+    if cluster["rule"]:
+        notes.append(f"rule: {cluster['rule']}" + (f", risk {cluster['risk']:g}" if cluster["risk"] else ""))
+    return f"- {description}" + (f" ({'; '.join(notes)})" if notes else "")
+
+
+def pack_evidence(entries: List[Dict[str, Any]], budget: int) -> str:
+    """Ranked evidence lines for `entries`, as many as fit in `budget` tokens (at least one)."""
+    clusters = rank_evidence(entries)
+    used = 0
+    lines: List[str] = []
+    for cluster in clusters:
+        line = evidence_line(cluster)
+        cost = estimate_tokens(line + "\n")
+        if lines and used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    omitted = clusters[len(lines):]
+    if omitted:
+        lines.append(f"- … plus {sum(c['count'] for c in omitted)} more alerts in {len(omitted)} other patterns")
+    return "\n".join(lines)
+
+
+def format_prompt(
+    tactic: str,
+    technique: str,
+    host_user: str,
+    entries: List[Dict[str, Any]],
+    budget: int = PROMPT_TOKEN_BUDGET,
+) -> str:
+    """Build an LLM‑ready executive‑level prompt from alert entries.
+
+    Near-duplicate descriptions are collapsed into one line with a count, ranked by rule
+    risk and FAISS distance, and added until the prompt would exceed `budget` tokens.
+    """
+    head = (
         "Summarize the following security alert group in executive terms.\n\n"
         f"MITRE tactic: {tactic}\n"
         f"Technique: {technique}\n"
         f"Host/User group: {host_user}\n\n"
         "Example alert details:\n"
-        f"{sample_text}\n\n"
+    )
+    tail = (
+        "\n\n"
         "Explain what this activity means, the behaviors observed, and what business impact or risk it may imply."
     )
+    return head + pack_evidence(entries, budget - estimate_tokens(head) - estimate_tokens(tail)) + tail
+
+
+BATCH_HEAD = (
+    "Summarize each of the following security alert groups in executive terms: what the activity means, "
+    "the behaviors observed, and the business impact or risk, in 2-3 sentences per group.\n"
+    "Return ONLY a JSON array (no markdown, no commentary) with one object per group, in the same order: "
+    '[{{"group": 1, "summary": "..."}}, ...]. There are {count} groups.\n'
+)
+
+
+def format_batch_prompt(jobs: List[Tuple[str, str, str, Dict[str, Any]]], budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """One prompt covering several groups, numbered from 1, sharing the token budget."""
+    head = BATCH_HEAD.format(count=len(jobs))
+    share = (budget - estimate_tokens(head)) // max(1, len(jobs))
+    blocks = []
+    for number, (tactic, technique, host_user, group) in enumerate(jobs, 1):
+        block = (f"\nGroup {number}:\nMITRE tactic: {tactic}\nTechnique: {technique}\n"
+                 f"Host/User group: {host_user}\nAlert details:\n")
+        blocks.append(block + pack_evidence(group.get("entries", []), share - estimate_tokens(block)))
+    return head + "\n".join(blocks)
+
+
+def parse_batch_reply(text: str, count: int) -> Dict[int, str]:
+    """Map group number (1-based) → summary for every well-formed item in the reply."""
+    try:
+        items = scan_json(text, "[", "]")
+    except ValueError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+    summaries: Dict[int, str] = {}
+    for position, item in enumerate(items, 1):
+        if isinstance(item, dict):
+            number, summary = item.get("group", position), item.get("summary")
+        else:  # a bare list of strings, in order
+            number, summary = position, item
+        if isinstance(number, int) and 1 <= number <= count and isinstance(summary, str) and summary.strip():
+            summaries.setdefault(number, summary.strip())
+    return summaries
 
 
 def run_ollama(model: str, prompt: str) -> str:
-    """Run an Ollama model locally and return the generated text. Prints helpful diagnostics if the command fails."""
-    cmd = ["ollama", "run", model]
+    """Send a prompt to the local Ollama server and return the generated text. Prints helpful diagnostics if the request fails."""
+    client = get_client(model)
     try:
-        completed = subprocess.run(
-            cmd,
-            input=prompt.encode(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-        )
-        return completed.stdout.decode().strip()
-    except subprocess.CalledProcessError as e:
-        err = e.stderr.decode(errors="ignore").strip()
-        print(f"[!] Ollama failed (exit {e.returncode}) while running '{' '.join(cmd)}'", file=sys.stderr)
-        if err:
-            print("[ollama stderr]", file=sys.stderr)
-            print(err, file=sys.stderr)
+        return client.generate(prompt)
+    except LLMError as e:
+        print(f"[!] Ollama request failed for model '{model}' at {client.host}", file=sys.stderr)
+        print(f"[ollama error] {e}", file=sys.stderr)
         print("\nSuggestions:\n"
               "  • Is the Ollama daemon running?  Try `ollama serve` in another terminal.\n"
               "  • Have you pulled the model?   Try `ollama pull " + model + "`.\n"
-              "  • Is the tag correct?          Run `ollama list` to see local models.", file=sys.stderr)
+              "  • Is the tag correct?          Run `ollama list` to see local models.\n"
+              "  • Non-default server?          Set `OLLAMA_HOST` (e.g. http://127.0.0.1:11434).", file=sys.stderr)
         raise
 
 
+def iter_groups(nested: Dict[str, Any]) -> Iterator[Tuple[str, str, str, Dict[str, Any]]]:
+    """Flatten tactic → technique → host_user → [group, ...] in file order."""
+    for tactic, techniques in nested.items():
+        for technique, host_users in techniques.items():
+            for host_user, groups in host_users.items():
+                for group in groups:  # "groups" is a *list* of grouped-match dicts
+                    yield tactic, technique, host_user, group
+
+
+def summarize_group(
+    model: str,
+    tactic: str,
+    technique: str,
+    host_user: str,
+    group: Dict[str, Any],
+    cache: Optional[SummaryCache] = None,
+) -> Dict[str, Any]:
+    """Run one group through the LLM (or the cache) and return its output record."""
+    entries = group.get("entries", [])
+    alert_count = group.get("alert_count", len(entries))
+
+    prompt = format_prompt(tactic, technique, host_user, entries)
+    key = cache_key(prompt, model, get_client(model).options) if cache is not None else ""
+    summary = cache.get(key) if cache is not None else None
+
+    if summary is None:
+        print(f"[*] Summarizing {tactic} -> {technique} -> {host_user} ({alert_count} alerts)")
+        with telemetry.span("llm"):  # summed across workers, so may exceed wall time
+            summary = run_ollama(model, prompt)
+        if cache is not None:
+            cache.put(key, model, summary)
+    else:
+        print(f"[=] Cached {tactic} -> {technique} -> {host_user} ({alert_count} alerts)")
+
+    return group_record(tactic, technique, host_user, group, summary)
+
+
+def group_record(tactic: str, technique: str, host_user: str, group: Dict[str, Any], summary: str) -> Dict[str, Any]:
+    record = {
+        "tactic": tactic,
+        "technique": technique,
+        "host_user": host_user,
+        "alert_count": group.get("alert_count", len(group.get("entries", []))),
+        "summary": summary,
+    }
+    for field in ("host", "user"):
+        if field in group:
+            record[field] = group[field]
+    if "window_start" in group:
+        record["window_start"] = group["window_start"]
+        record["window_end"] = group["window_end"]
+    return record
+
+
+def summarize_batch(
+    model: str,
+    jobs: List[Tuple[str, str, str, Dict[str, Any]]],
+    cache: Optional[SummaryCache] = None,
+) -> List[Dict[str, Any]]:
+    """Summarize several small groups with one prompt; groups the reply misses fall back to summarize_group()."""
+    if len(jobs) == 1:
+        return [summarize_group(model, *jobs[0], cache=cache)]
+
+    # A group's own prompt answers it first (from an unbatched run or a fallback); batched
+    # answers are keyed by the batch prompt plus the group's position in it
+    options = get_client(model).options
+    summaries: Dict[int, str] = {}
+    if cache is not None:
+        for number, (t, te, hu, g) in enumerate(jobs, 1):
+            hit = cache.get(cache_key(format_prompt(t, te, hu, g.get("entries", [])), model, options))
+            if hit is not None:
+                summaries[number] = hit
+    pending = [number for number in range(1, len(jobs) + 1) if number not in summaries]
+
+    if len(pending) > 1:
+        prompt = format_batch_prompt([jobs[n - 1] for n in pending])
+        keys = [cache_key(f"{prompt}\n[batched group {position}]", model, options) if cache is not None else ""
+                for position in range(1, len(pending) + 1)]
+        batched: Dict[int, str] = {}
+        if cache is not None:
+            for position, key in enumerate(keys, 1):
+                hit = cache.get(key)
+                if hit is not None:
+                    batched[position] = hit
+        if len(batched) < len(pending):
+            print(f"[*] Summarizing {len(pending)} small groups in one prompt")
+            with telemetry.span("llm"):
+                reply = run_ollama(model, prompt)
+            telemetry.count("batched_prompts")
+            for position, summary in parse_batch_reply(reply, len(pending)).items():
+                if position not in batched:
+                    batched[position] = summary
+                    if cache is not None:
+                        cache.put(keys[position - 1], model, summary)
+        for position, number in enumerate(pending, 1):
+            if position in batched:
+                summaries[number] = batched[position]
+
+    records = []
+    for number, job in enumerate(jobs, 1):
+        if number in summaries:
+            records.append(group_record(*job, summaries[number]))
+        else:
+            if len(pending) > 1:
+                telemetry.count("batch_fallbacks")
+            records.append(summarize_group(model, *job, cache=cache))
+    return records
+
+
+def batch_jobs(jobs: List[Tuple[str, str, str, Dict[str, Any]]], batch_groups: int = DEFAULT_BATCH_GROUPS) -> List[List[int]]:
+    """Split job indices into units: small groups share a unit (up to batch_groups), larger ones go alone.
+
+    Units are ordered by their first job, so results can be written out in job order as they complete.
+    """
+    units: List[List[int]] = []
+    open_unit: Optional[List[int]] = None
+    for i, (*_, group) in enumerate(jobs):
+        if batch_groups > 1 and group.get("alert_count", len(group.get("entries", []))) <= SMALL_GROUP_ALERTS:
+            if open_unit is None or len(open_unit) == batch_groups:
+                open_unit = []
+                units.append(open_unit)
+            open_unit.append(i)
+        else:
+            units.append([i])
+    return units
+
+
+def summary_key(record: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return record["tactic"], record["technique"], record["host_user"], record.get("window_start", "")
+
+
+def merge_summaries(output_file: str, records: List[Dict[str, Any]]) -> int:
+    """Replace/add `records` in output_file (keyed by group and window), keeping the rest; returns the total."""
+    merged: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    merged[summary_key(record)] = record
+    for record in records:
+        merged[summary_key(record)] = record
+    with open(output_file + ".tmp", "w", encoding="utf-8") as f:
+        for record in merged.values():
+            f.write(json.dumps(record) + "\n")
+    os.replace(output_file + ".tmp", output_file)
+    return len(merged)
+
+
+def summarize_nested(
+    nested: Dict[str, Any],
+    model: str = DEFAULT_MODEL,
+    workers: int = DEFAULT_WORKERS,
+    output_file: Optional[str] = OUTPUT_FILE,
+    batch_groups: int = DEFAULT_BATCH_GROUPS,
+    store_path: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Summarize every group in `nested`, returning the records in deterministic order.
+
+    With `store_path` (windowed mode) `nested` holds the store's dirty groups: their summaries are
+    merged into output_file rather than replacing it, and the groups are marked clean in that store.
+    """
+    jobs = list(iter_groups(nested))
+    incremental = store_path is not None
+    if not incremental and any("version" in group for *_, group in jobs):
+        raise ValueError("groups come from a windowed group store; pass its path (--store=PATH)")
+    stream_file = None if incremental else output_file
+    cache = SummaryCache(CACHE_FILE, CACHE_MAX_ENTRIES) if USE_CACHE else None
+    records: List[Dict[str, Any]] = []
+    client = get_client(model)
+    before = dict(client.stats)
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        out_f = open(stream_file, "w", encoding="utf-8") if stream_file else None
+        try:
+            # map() yields in submission order, so the output stays deterministic
+            # even though up to `workers` prompts are in flight at once.
+            units = batch_jobs(jobs, batch_groups)
+            slots: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+            done = 0
+            summarize_unit = lambda unit: summarize_batch(model, [jobs[i] for i in unit], cache=cache)
+            for unit, unit_records in zip(units, pool.map(summarize_unit, units)):
+                for i, record in zip(unit, unit_records):
+                    slots[i] = record
+                done += len(unit)
+                # Emit the finished prefix so the file stays in job order
+                while len(records) < len(jobs) and slots[len(records)] is not None:
+                    record = slots[len(records)]
+                    records.append(record)
+                    if out_f is not None:
+                        out_f.write(json.dumps(record) + "\n")
+                print(f"[✓] Completed summary {done}/{len(jobs)}")
+        finally:
+            if out_f is not None:
+                out_f.close()
+
+    elapsed = time.perf_counter() - start
+    prompts = client.stats["requests"] - before["requests"]
+    eval_tokens = client.stats["eval_tokens"] - before["eval_tokens"]
+    eval_ns = client.stats["eval_duration_ns"] - before["eval_duration_ns"]
+    telemetry.count("groups", len(records))
+    telemetry.count("prompts", prompts)
+    telemetry.count("prompt_tokens", client.stats["prompt_tokens"] - before["prompt_tokens"])
+    telemetry.count("eval_tokens", eval_tokens)
+    telemetry.rate("prompts_per_s", prompts, elapsed)
+    telemetry.rate("tokens_per_s", eval_tokens, elapsed)
+    telemetry.rate("decode_tokens_per_s", eval_tokens, eval_ns / 1e9)
+
+    print(f"\n[+] Summarized {len(records)} groups" + (f" -> {output_file}" if output_file else ""))
+    if incremental:
+        if output_file:
+            total = merge_summaries(output_file, records)
+            print(f"[+] Merged into {total} summaries -> {output_file}")
+        store = GroupStore(store_path)
+        cleaned = store.mark_clean(dirty_versions([group for *_, group in jobs]))
+        store.close()
+        telemetry.count("groups_cleaned", cleaned)
+        print(f"[#] Marked {cleaned} groups clean in {store_path}")
+    if cache is not None:
+        stats = cache.stats()
+        telemetry.count("cache_hits", stats["hits"])
+        telemetry.count("cache_misses", stats["misses"])
+        print(f"[#] Cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%}), {stats['evictions']} evicted, {stats['entries']} entries -> {CACHE_FILE}")
+        cache.close()
+    return records
+
+
+def store_option(args: List[str]) -> Optional[str]:
+    """--store=PATH, bare --store for the default group store, or None (full run)."""
+    if "--store" in args:
+        return DEFAULT_STORE_FILE
+    return next((a.split("=", 1)[1] for a in args if a.startswith("--store=")), None)
+
+
 def main() -> None:
-    model = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    model = args[0] if len(args) > 0 else DEFAULT_MODEL
+    workers = int(args[1]) if len(args) > 1 else DEFAULT_WORKERS
+    batch_groups = int(args[2]) if len(args) > 2 else DEFAULT_BATCH_GROUPS
+    store_path = store_option(sys.argv[1:])
 
     if not os.path.exists(INPUT_FILE):
         raise FileNotFoundError(INPUT_FILE)
@@ -66,38 +480,7 @@ def main() -> None:
     with open(INPUT_FILE, "r", encoding="utf-8") as f:
         nested: Dict[str, Any] = json.load(f)
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out_f:
-        group_count = 0
-
-        # Structure: tactic → technique → host_user → [group, group, ...]
-        for tactic, techniques in nested.items():
-            for technique, host_users in techniques.items():
-                for host_user, groups in host_users.items():
-                    for group in groups:  # "groups" is a *list* of grouped-match dicts
-                        entries = group.get("entries", [])
-                        alert_count = group.get("alert_count", len(entries))
-
-                        prompt = format_prompt(tactic, technique, host_user, entries)
-                        print(f"[*] Summarizing {tactic} -> {technique} -> {host_user} ({alert_count} alerts)")
-                        summary = run_ollama(model, prompt)
-
-                        out_f.write(
-                            json.dumps(
-                                {
-                                    "tactic": tactic,
-                                    "technique": technique,
-                                    "host_user": host_user,
-                                    "alert_count": alert_count,
-                                    "summary": summary,
-                                }
-                            )
-                            + "\n"
-                        )
-
-                        group_count += 1
-                        print(f"[✓] Completed summary {group_count}")
-
-    print(f"\n[+] Summarized {group_count} groups -> {OUTPUT_FILE}")
+    summarize_nested(nested, model, workers, OUTPUT_FILE, batch_groups, store_path)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,22 @@
 #!/usr/bin/env python3
 """
-org_takeaways_retry_forever.py
-──────────────────────────────
-• Step 1 – ask the LLM for a JSON array of 5 titles; retry until it parses.
-• Step 2 – for each title, ask for a JSON object with keys:
+org_takeaways.py
+────────────────
+• Step 1 – ask the LLM for a JSON array of 5 titles; retry (bounded) until it parses.
+• Step 2 – for all titles at once, ask for a JSON object with keys:
             {"what": "...", "impact": "...", "mitigation": "..."}
-           …again retrying until JSON parses.
+           using Ollama's JSON mode (`format: json`), again with bounded retries.
+
+The context for step 1 must fit the model's num_ctx. When the group summaries do not,
+they are map-reduced: each tactic's summaries are condensed in chunks of at most
+REDUCE_FAN_IN items / REDUCE_TOKEN_BUDGET tokens, level by level and in parallel, into
+one digest per tactic; the tactic digests are reduced the same way into an
+organization-level digest if they still exceed CONTEXT_TOKEN_BUDGET. Override the fan-in
+and per-level budget with --fan-in=N and --level-budget=TOKENS.
+
+Retries back off exponentially with jitter and stop after MAX_ATTEMPTS. Titles are
+required (the run fails without them); a title whose details never parse is reported
+with a placeholder instead of blocking the report.
 
 Outputs
 -------
@@ -16,68 +27,210 @@ data/top5_takeaways.html  – polished HTML for execs
 from __future__ import annotations
 
 import json
-import subprocess
+import random
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from html import escape
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
+
+import telemetry
+from llm_client import get_client
+from llm_summary import CHARS_PER_TOKEN, estimate_tokens, scan_json
 
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 
 GROUP_SUMMARIES = Path("data/group_summaries.jsonl")
+SUMMARY_CLUSTERS = Path("data/summary_clusters.jsonl")  # cluster_summaries.py; used when newer
 TXT_OUT         = Path("data/top5_takeaways.txt")
 HTML_OUT        = Path("data/top5_takeaways.html")
-MODEL_TAG       = sys.argv[1] if len(sys.argv) > 1 else "llama3:8b"
-RETRY_DELAY_S   = 2          # seconds to wait between retries
+MODEL_TAG       = "llama3:8b"  # override with argv[1]
+MAX_ATTEMPTS    = 4          # LLM calls per JSON answer before giving up
+BACKOFF_BASE_S  = 1.0        # first retry delay; doubles per attempt, ±50% jitter
+BACKOFF_MAX_S   = 20.0
+DETAIL_PLACEHOLDER = "Details unavailable: the model did not return a valid answer."
+NUM_CTX         = 4096       # PARAMETER num_ctx in data/models/Modelfile
+CONTEXT_TOKEN_BUDGET = 2800  # context handed to TITLES_PROMPT
+REDUCE_FAN_IN   = 20         # summaries/digests condensed per reduce call
+REDUCE_TOKEN_BUDGET = 2800   # input tokens per reduce call
+DIGEST_WORDS    = 250        # target length of each digest (must stay well under the budget)
+MAX_REDUCE_LEVELS = 8        # past this, the remaining texts are truncated and joined instead
+REDUCE_WORKERS  = 4          # reduce calls in flight
+MAX_LISTED      = 5          # hosts/users named per summary cluster
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def ask_llm(prompt: str) -> str:
-    """Run Ollama and return stdout (raises RuntimeError on failure)."""
-    proc = subprocess.run(
-        ["ollama", "run", MODEL_TAG],
-        input=prompt.encode(),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    if proc.returncode != 0:
-        raise RuntimeError(proc.stderr.decode(errors="ignore"))
-    return proc.stdout.decode().strip()
-
-
-def scan_json(text: str, opener: str, closer: str) -> Any:
-    """Return first syntactically-valid JSON substring (raises if none)."""
-    start = text.find(opener)
-    while start != -1:
-        depth = 0
-        for idx in range(start, len(text)):
-            ch = text[idx]
-            if ch == opener:
-                depth += 1
-            elif ch == closer:
-                depth -= 1
-                if depth == 0:
-                    snippet = text[start : idx + 1]
-                    try:
-                        return json.loads(snippet)
-                    except json.JSONDecodeError:
-                        break
-        start = text.find(opener, start + 1)
-    raise ValueError("no valid JSON block found")
+def ask_llm(prompt: str, format: Optional[str] = None) -> str:
+    """Query the Ollama server and return the response (raises RuntimeError on failure)."""
+    telemetry.count("prompts")
+    with telemetry.span("llm"):
+        return get_client(MODEL_TAG).generate(prompt, format=format)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with ±50% jitter, so concurrent retries do not stay in lockstep."""
+    return min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+
+def ask_json(prompt: str, opener: str, closer: str, check: Callable[[Any], None], label: str,
+             format: Optional[str] = None) -> Any:
+    """Ask until the reply holds JSON that passes `check` (which raises ValueError), up to MAX_ATTEMPTS."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            value = scan_json(ask_llm(prompt, format=format), opener, closer)
+            check(value)
+            return value
+        except Exception as e:
+            telemetry.count("retries")
+            if attempt == MAX_ATTEMPTS:
+                raise ValueError(f"{label}: no valid answer after {MAX_ATTEMPTS} attempts ({e})") from e
+            delay = backoff_delay(attempt)
+            print(f"[!] {label} JSON parse failed: {e}\n    Retrying in {delay:.1f}s ({attempt}/{MAX_ATTEMPTS})…")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def check_titles(titles: Any) -> None:
+    if not isinstance(titles, list) or len(titles) != 5:
+        raise ValueError("array length != 5")
+
+
+def check_detail(detail: Any) -> None:
+    if not isinstance(detail, dict) or not all(str(detail.get(k, "")).strip() for k in ("what", "impact", "mitigation")):
+        raise ValueError("missing keys")
+
+
+def fetch_detail(title: str) -> Dict[str, str]:
+    try:
+        # JSON mode constrains the reply to a single object, which is exactly what is asked for
+        detail = ask_json(DETAIL_PROMPT.format(title=title), "{", "}", check_detail, f"'{title}'", format="json")
+    except ValueError as e:
+        print(f"[!] {e}; using a placeholder")
+        telemetry.count("detail_failures")
+        return {"what": DETAIL_PLACEHOLDER, "impact": DETAIL_PLACEHOLDER, "mitigation": DETAIL_PLACEHOLDER}
+    return {k: str(detail[k]).strip() for k in ("what", "impact", "mitigation")}
+
+
+def affected(g: Dict[str, Any]) -> str:
+    """'on <host_user>' for a group; host/user counts (and the first few names) for a cluster."""
+    if "group_count" not in g:
+        return f"on {g['host_user']}"
+    names = []
+    for field in ("hosts", "users"):
+        values = g.get(field, [])
+        listed = ", ".join(values[:MAX_LISTED]) + (", …" if len(values) > MAX_LISTED else "")
+        names.append(f"{len(values)} {field} ({listed})")
+    return f"across {g['group_count']} groups, " + " and ".join(names)
+
+
+def group_line(g: Dict[str, Any]) -> str:
+    """One bullet for a group summary (or summary cluster), its paragraphs kept together."""
+    summary = " ".join(str(g["summary"]).split())
+    return f"- [{g['alert_count']} alerts] {g['tactic']}/{g['technique']} {affected(g)}: {summary}"
+
+
+def by_alerts(gs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(gs, key=lambda g: g.get("alert_count", 0), reverse=True)
 
 
 def build_context(gs: List[Dict[str, Any]]) -> str:
-    """Readable bullet list of alert-group summaries."""
-    return "\n".join(
-        f"- [{g['alert_count']} alerts] {g['tactic']}/{g['technique']} "
-        f"on {g['host_user']}: {g['summary']}"
-        for g in sorted(gs, key=lambda g: g.get("alert_count", 0), reverse=True)
-    )
+    """Readable bullet list of alert-group summaries (or summary clusters)."""
+    return "\n".join(group_line(g) for g in by_alerts(gs))
+
+
+def clip(text: str, tokens: int) -> str:
+    """Cut text so that estimate_tokens() of the result is at most `tokens`."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:max(0, (tokens - 1) * CHARS_PER_TOKEN - 1)].rstrip() + "…"
+
+
+def chunk_texts(texts: List[str], fan_in: int, budget: int) -> List[List[str]]:
+    """Greedy, order-preserving chunks of at most fan_in texts and ~budget tokens."""
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if current and (len(current) >= fan_in or used + cost > budget):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def digest(scope: str, texts: List[str]) -> str:
+    telemetry.count("reduce_prompts")
+    return ask_llm(REDUCE_PROMPT.format(scope=scope, words=DIGEST_WORDS, items="\n".join(texts))).strip()
+
+
+def reduce_all(inputs: Dict[str, List[str]], pool: ThreadPoolExecutor,
+               fan_in: int = REDUCE_FAN_IN, budget: int = REDUCE_TOKEN_BUDGET) -> Dict[str, str]:
+    """Reduce each scope's texts to a single text, one level at a time across all scopes in parallel.
+
+    Scopes whose texts already fit `budget` are joined as-is, without an LLM call. Texts are
+    clipped to under half the budget so every chunk takes at least two and each level shrinks;
+    after MAX_REDUCE_LEVELS the remaining texts are truncated to share the budget and joined.
+    """
+    item_budget = max(1, budget // 2 - 1)
+    pending = {scope: [clip(t, item_budget) for t in texts] for scope, texts in inputs.items()}
+    done: Dict[str, str] = {}
+    level = 0
+    while pending:
+        for scope in list(pending):
+            texts = pending[scope]
+            joined = "\n".join(texts)
+            if len(texts) == 1 or estimate_tokens(joined) <= budget:
+                done[scope] = joined
+                del pending[scope]
+        if not pending:
+            break
+        if level == MAX_REDUCE_LEVELS:
+            print(f"[!] Still over budget after {level} reduce levels; truncating {len(pending)} scope(s)")
+            for scope, texts in pending.items():
+                share = max(1, budget // len(texts) - 1)
+                done[scope] = clip("\n".join(clip(t, share) for t in texts), budget)
+            break
+        level += 1
+        jobs = [(scope, chunk) for scope, texts in pending.items() for chunk in chunk_texts(texts, fan_in, budget)]
+        print(f"[*] Reduce level {level}: {len(jobs)} digests for {len(pending)} scope(s)")
+        digests = list(pool.map(lambda job: digest(*job), jobs))
+        pending = {scope: [] for scope in pending}
+        for (scope, _), text in zip(jobs, digests):
+            pending[scope].append(clip(text, item_budget))
+    telemetry.gauge("reduce_levels", level)
+    return done
+
+
+def reduce_context(groups: List[Dict[str, Any]], fan_in: int = REDUCE_FAN_IN,
+                   level_budget: int = REDUCE_TOKEN_BUDGET, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """build_context() when it fits `budget`, else a tactic → organization map-reduce digest."""
+    context = build_context(groups)
+    if estimate_tokens(context) <= budget:
+        return context
+
+    by_tactic: Dict[str, List[Dict[str, Any]]] = {}
+    for g in groups:
+        by_tactic.setdefault(str(g.get("tactic", "unknown")), []).append(g)
+    print(f"[*] Context of ~{estimate_tokens(context)} tokens exceeds {budget}; "
+          f"reducing {len(groups)} summaries across {len(by_tactic)} tactics")
+
+    with ThreadPoolExecutor(max_workers=REDUCE_WORKERS) as pool:
+        inputs = {f"tactic: {tactic}": [group_line(g) for g in by_alerts(gs)] for tactic, gs in by_tactic.items()}
+        tactic_digests = reduce_all(inputs, pool, fan_in, level_budget)
+        lines = []
+        for tactic, gs in sorted(by_tactic.items(), key=lambda kv: -sum(g.get("alert_count", 0) for g in kv[1])):
+            alerts = sum(g.get("alert_count", 0) for g in gs)
+            lines.append(f"- {tactic} ({len(gs)} groups, {alerts} alerts): {tactic_digests[f'tactic: {tactic}']}")
+        return reduce_all({"organization": lines}, pool, fan_in, min(level_budget, budget))["organization"]
 
 
 def html_report(items: List[Dict[str, str]]) -> str:
@@ -122,6 +275,12 @@ TITLES_PROMPT = (
     "distinct risk titles based on the context below.\n\nContext:\n{context}"
 )
 
+REDUCE_PROMPT = (
+    "Condense the following security alert-group summaries ({scope}) into one digest of at most "
+    "{words} words. Keep every distinct threat, affected host/user and alert count; merge repeats. "
+    "Plain text only, no preamble, no markdown.\n\n{items}"
+)
+
 DETAIL_PROMPT = (
     "Return ONLY a JSON object with keys 'what', 'impact', 'mitigation'. "
     "Each value must be 1–2 plain sentences, no other keys, no markdown. "
@@ -132,41 +291,24 @@ DETAIL_PROMPT = (
 # Main
 # ---------------------------------------------------------------------------
 
-def main() -> None:
-    if not GROUP_SUMMARIES.exists():
-        sys.exit("Error: data/group_summaries.jsonl missing – run group-summary step first.")
+def generate_takeaways(groups: List[Dict[str, Any]], fan_in: int = REDUCE_FAN_IN,
+                       level_budget: int = REDUCE_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """Produce the five takeaways from group summaries and write the TXT/HTML reports."""
+    with telemetry.span("reduce"):
+        context = reduce_context(groups, fan_in, level_budget)
 
-    groups = [json.loads(l) for l in GROUP_SUMMARIES.read_text().splitlines() if l.strip()]
-    context = build_context(groups)
+    # Step 1 – titles (JSON array of 5; JSON mode is not used because it only yields objects)
+    titles = ask_json(TITLES_PROMPT.format(context=context), "[", "]", check_titles, "Titles")
+    titles = [str(title) for title in titles]
 
-    # Step 1 – titles (retry until JSON array of 5)
-    while True:
-        try:
-            titles_raw = ask_llm(TITLES_PROMPT.format(context=context))
-            titles = scan_json(titles_raw, "[", "]")
-            if isinstance(titles, list) and len(titles) == 5:
-                break
-            raise ValueError("array length != 5")
-        except Exception as e:
-            print(f"[!] Titles JSON parse failed: {e}\n    Retrying in {RETRY_DELAY_S}s…")
-            time.sleep(RETRY_DELAY_S)
+    # Step 2 – details for all titles concurrently, results kept in title order
+    with ThreadPoolExecutor(max_workers=len(titles)) as pool:
+        details = list(pool.map(fetch_detail, titles))
 
-    # Step 2 – details per title (retry each until valid JSON object)
     results: List[Dict[str, str]] = []
     txt_lines: List[str] = []
 
-    for idx, title in enumerate(titles, 1):
-        while True:
-            try:
-                detail_raw = ask_llm(DETAIL_PROMPT.format(title=title))
-                detail = scan_json(detail_raw, "{", "}")
-                if all(detail.get(k, "").strip() for k in ("what", "impact", "mitigation")):
-                    break
-                raise ValueError("missing keys")
-            except Exception as e:
-                print(f"[!] JSON parse failed for '{title}': {e}\n    Retrying in {RETRY_DELAY_S}s…")
-                time.sleep(RETRY_DELAY_S)
-
+    for idx, (title, detail) in enumerate(zip(titles, details), 1):
         results.append({"title": title, **detail})
         txt_lines.extend([
             f"{idx}. {title}",
@@ -181,6 +323,29 @@ def main() -> None:
     TXT_OUT.write_text("\n".join(txt_lines), encoding="utf-8")
     HTML_OUT.write_text(html_report(results), encoding="utf-8")
     print(f"[+] Results written -> {TXT_OUT} | {HTML_OUT}")
+    return results
+
+
+def main() -> None:
+    global MODEL_TAG
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if args:
+        MODEL_TAG = args[0]
+    fan_in = int(next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--fan-in=")), REDUCE_FAN_IN))
+    level_budget = int(next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--level-budget=")),
+                            REDUCE_TOKEN_BUDGET))
+    if fan_in < 2:
+        sys.exit("Error: --fan-in must be at least 2.")
+
+    if not GROUP_SUMMARIES.exists():
+        sys.exit("Error: data/group_summaries.jsonl missing – run group-summary step first.")
+
+    source = GROUP_SUMMARIES
+    if SUMMARY_CLUSTERS.exists() and SUMMARY_CLUSTERS.stat().st_mtime >= GROUP_SUMMARIES.stat().st_mtime:
+        source = SUMMARY_CLUSTERS
+        print(f"[*] Using clustered summaries from {SUMMARY_CLUSTERS}")
+    groups = [json.loads(l) for l in source.read_text().splitlines() if l.strip()]
+    generate_takeaways(groups, fan_in, level_budget)
 
 
 if __name__ == "__main__":
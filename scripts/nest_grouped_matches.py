@@ -4,20 +4,39 @@ import json
 from collections import defaultdict
 import os
 
+import telemetry
+
 INPUT_FILE = "data/grouped_matches.jsonl"
 OUTPUT_FILE = "data/nested_grouped_matches.jsonl"
+NESTED_FILE = "data/nested_grouped_matches.json"  # input of llm_summary.py
 
 def load_grouped_matches():
     with open(INPUT_FILE, "r", encoding="utf-8") as f:
         return [json.loads(line.strip()) for line in f]
 
+def nest_for_summary(groups):
+    """Arrange grouped matches as tactic → technique → host_user → [group, ...]."""
+    nested = {}
+    for group in groups:
+        tactic = str(group.get("tactic", "unknown")).strip() or "unknown"
+        technique = str(group.get("technique", "unknown")).strip() or "unknown"
+        host_user = f"{group.get('host', 'unknown')}_{group.get('user', 'unknown')}"
+        nested.setdefault(tactic, {}).setdefault(technique, {}).setdefault(host_user, []).append(group)
+    return nested
+
+def save_nested(nested, output_file=NESTED_FILE):
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(nested, f)
+
 def main():
     if not os.path.exists(INPUT_FILE):
         print(f"[!] Input file not found: {INPUT_FILE}")
         return
 
     print("[*] Loading grouped match entries...")
-    matches = load_grouped_matches()
+    with telemetry.span("load"):
+        matches = load_grouped_matches()
+    telemetry.count("groups", len(matches))
     print(f"[+] Loaded {len(matches)} grouped entries")
 
     print("[*] Consolidating entries by tactic, technique, host, user...")
@@ -49,5 +68,11 @@ def main():
 
     print(f"[✓] Output written to {OUTPUT_FILE}")
 
+    with telemetry.span("nest"):
+        nested = nest_for_summary(matches)
+    with telemetry.span("write"):
+        save_nested(nested)
+    print(f"[✓] Summarisation input written to {NESTED_FILE}")
+
 if __name__ == "__main__":
     main()
@@ -1,38 +1,173 @@
 # scripts/normalize_alerts.py
+#
+# Streams the input instead of json.load()-ing it, so memory stays flat for
+# multi-gigabyte exports. Accepts either the XDR export shape
+# ({"...": ..., "alerts": [ {...}, ... ]}), a bare JSON array of alerts, or
+# NDJSON (one alert per line, .jsonl/.ndjson). Usage:
+#
+#   python scripts/normalize_alerts.py [input] [output]
 
 import json
+import sys
+import time
+
+import telemetry
+from vendor_schemas import FieldMapper
 
 INPUT_FILE = "data/xdr_gui_alerts.json"
 OUTPUT_FILE = "data/normalized_alerts.jsonl"
+ALERTS_KEY = "alerts"
+CHUNK_SIZE = 1 << 16  # bytes read per refill
+NDJSON_SUFFIXES = (".jsonl", ".ndjson")
 
-def normalize(alert):
-    norm = {
-        "source": alert.get("source", "Unknown"),
-        "alert_id": alert.get("alert_id") or alert.get("id") or alert.get("uuid") or "",
-        "title": alert.get("title") or alert.get("alert_name") or alert.get("Name") or alert.get("threatName") or alert.get("event_type") or "Unknown Alert",
-        "tactic": alert.get("tactic") or alert.get("Tactic") or alert.get("attack_tactic") or alert.get("mitreTactic") or "",
-        "technique": alert.get("technique") or alert.get("Technique") or alert.get("attack_technique") or alert.get("mitreTechnique") or "",
-        "technique_id": alert.get("technique_id") or alert.get("attack_id") or alert.get("techniqueId") or alert.get("mitreID") or "",
-        "process": alert.get("process") or alert.get("application") or alert.get("processName") or alert.get("Process") or "",
-        "host": alert.get("host") or alert.get("host_name") or alert.get("HostName") or alert.get("agentComputerName") or alert.get("asset_id") or alert.get("resource") or alert.get("src_device") or "",
-        "user": alert.get("user") or alert.get("user_name") or alert.get("User") or alert.get("username") or alert.get("principal") or alert.get("userName") or "",
-        "timestamp": alert.get("timestamp") or alert.get("log_time") or alert.get("time") or alert.get("event_time") or alert.get("Timestamp") or alert.get("time_detected") or "",
-    }
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_VALUE_END = _WHITESPACE + ",:]}"  # what may follow a complete number
 
+# Field aliases per vendor live in vendor_schemas.py; each source resolves to its alias table once
+_mapper = FieldMapper()
+
+def normalize(alert):
+    norm = _mapper.extract(alert)
     norm["description"] = f"{norm['title']} involving {norm['process']} on {norm['host']} by {norm['user']}"
     return norm
 
+class _JSONStream:
+    """Incremental reader over a text file: decodes one JSON value at a time."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos > CHUNK_SIZE:  # drop consumed text so the buffer stays bounded
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos}, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # A value ending at the buffer edge may be truncated, and a number may
+                # stop early on a split "3" | ".5" or "1e" | "5": wait for what follows it
+                if self.eof or (end < len(self.buf) and (self.buf[end] in _VALUE_END
+                                                         or not isinstance(obj, (int, float)))):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+def _iter_array(stream):
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.pos += 1
+        return
+    while True:
+        yield stream.value()
+        sep = stream.peek()
+        stream.pos += 1
+        if sep == "]":
+            return
+        if sep != ",":
+            raise ValueError(f"malformed array: unexpected {sep!r}")
+
+def iter_alerts(path, key=ALERTS_KEY):
+    """Yield raw alerts one at a time from a JSON export, JSON array or NDJSON file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(NDJSON_SUFFIXES):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        stream = _JSONStream(f)
+        first = stream.peek()
+        if first == "[":
+            yield from _iter_array(stream)
+            return
+
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            name = stream.value()
+            stream.expect(":")
+            if name == key and stream.peek() == "[":
+                yield from _iter_array(stream)
+            else:
+                stream.value()  # skip small top-level metadata
+            sep = stream.peek()
+            stream.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"malformed object: unexpected {sep!r}")
+
+def normalize_stream(alerts, out_f):
+    """Normalize and write alerts as they arrive; returns the count."""
+    count = 0
+    for alert in alerts:
+        out_f.write(json.dumps(normalize(alert)) + "\n")
+        count += 1
+    return count
+
+def normalize_file(input_file=INPUT_FILE, output_file=None):
+    """In-memory variant for the in-process pipeline: return all normalized alerts,
+    optionally checkpointing them to output_file."""
+    start = time.perf_counter()
+    with telemetry.span("normalize"):
+        alerts = [normalize(alert) for alert in iter_alerts(input_file)]
+    telemetry.count("alerts", len(alerts))
+    telemetry.rate("alerts_per_s", len(alerts), time.perf_counter() - start)
+    if output_file:
+        with telemetry.span("write"), open(output_file, "w", encoding="utf-8") as out_f:
+            for norm in alerts:
+                out_f.write(json.dumps(norm) + "\n")
+    print(f"Normalized {len(alerts)} alerts" + (f" → {output_file}" if output_file else ""))
+    return alerts
+
 def main():
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        alerts = data.get("alerts", [])
+    input_file = sys.argv[1] if len(sys.argv) > 1 else INPUT_FILE
+    output_file = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_FILE
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out_f:
-        for alert in alerts:
-            norm = normalize(alert)
-            out_f.write(json.dumps(norm) + "\n")
+    start = time.perf_counter()
+    with open(output_file, "w", encoding="utf-8") as out_f:
+        count = normalize_stream(iter_alerts(input_file), out_f)
+    elapsed = time.perf_counter() - start
 
-    print(f"Normalized {len(alerts)} alerts → {OUTPUT_FILE}")
+    rate = count / elapsed if elapsed > 0 else 0.0
+    telemetry.count("alerts", count)
+    telemetry.rate("alerts_per_s", count, elapsed)
+    print(f"Normalized {count} alerts → {output_file} ({elapsed:.2f}s, {rate:,.0f} alerts/s)")
 
 if __name__ == "__main__":
     main()
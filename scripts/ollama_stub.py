@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Minimal stand-in for the Ollama `/api/generate` endpoint.
+
+Useful for exercising the summary stages without a GPU:
+
+    python scripts/ollama_stub.py 11435 &
+    OLLAMA_HOST=http://127.0.0.1:11435 python scripts/llm_summary.py
+
+In-process use (tests, benchmarks):
+
+    with StubOllamaServer(responder=lambda payload: "[]") as stub:
+        client = OllamaClient("stub", host=stub.url)
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+Responder = Callable[[Dict[str, Any]], str]
+
+
+def echo_responder(payload: Dict[str, Any]) -> str:
+    """Default reply: a short canned summary, or a JSON document when JSON mode is requested."""
+    if payload.get("format") == "json":
+        return json.dumps({"what": "stub", "impact": "stub", "mitigation": "stub"})
+    first_line = payload.get("prompt", "").strip().splitlines()[:1]
+    return f"Stub summary for: {first_line[0] if first_line else ''}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+    server: "_StubHTTPServer"
+
+    def log_message(self, fmt: str, *args: Any) -> None:  # silence per-request logging
+        pass
+
+    def do_POST(self) -> None:
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.server.latency_s:
+            time.sleep(self.server.latency_s)
+        text = self.server.responder(payload)
+        self.server.record(payload)
+
+        stats = {"prompt_eval_count": len(payload.get("prompt", "").split()), "eval_count": len(text.split()),
+                 "eval_duration": 1}
+        if payload.get("stream", True):
+            words = text.split(" ")
+            chunks = [{"model": payload.get("model"), "response": w + (" " if i < len(words) - 1 else ""),
+                       "done": False} for i, w in enumerate(words)]
+            chunks.append({"model": payload.get("model"), "response": "", "done": True, **stats})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                data = (json.dumps(chunk) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            body = json.dumps({"model": payload.get("model"), "response": text, "done": True, **stats}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        # Drop the socket without announcing it, as a server does with idle keep-alive connections
+        self.close_connection = self.server.drop_connections
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, responder: Responder, latency_s: float, drop_connections: bool) -> None:
+        super().__init__(addr, _Handler)
+        self.responder = responder
+        self.latency_s = latency_s
+        self.drop_connections = drop_connections
+        self.requests: list = []
+        self._lock = threading.Lock()
+
+    def record(self, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self.requests.append(payload)
+
+
+class StubOllamaServer:
+    """Run the stub on a background thread; `port=0` picks a free port.
+
+    `drop_connections=True` closes every connection after its reply, to exercise the
+    client's reconnect.
+    """
+
+    def __init__(self, port: int = 0, responder: Optional[Responder] = None, latency_s: float = 0.0,
+                 drop_connections: bool = False) -> None:
+        self._server = _StubHTTPServer(("127.0.0.1", port), responder or echo_responder, latency_s,
+                                       drop_connections)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> list:
+        """Payloads received so far, in arrival order."""
+        return list(self._server.requests)
+
+    def start(self) -> "StubOllamaServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 11435
+    stub = StubOllamaServer(port=port)
+    print(f"[*] Stub Ollama listening on {stub.url} (Ctrl+C to stop)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,20 @@
 
 import toml
 import os
+import sys
 import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
 
 INPUT_DIR = "data/raw_rules/elastic/rules"
 OUTPUT_FILE = "data/parsed_rules.jsonl"
 FAILURE_LOG = "data/parse_failures.json"
 STATS_LOG = "data/parse_stats.json"
+MANIFEST_FILE = "data/parse_manifest.json"  # path -> mtime/size/sha256 + parsed record
+MAX_WORKERS = os.cpu_count() or 1
 
 def parse_rule(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
@@ -49,14 +57,39 @@ def parse_rule(file_path):
             "file": os.path.basename(file_path)
         }
 
-def main():
-    all_rules = []
-    parse_failures = []
-
-    total_files = 0
-    parsed_files = 0
-    failed_files = 0
-
+def file_digest(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def parse_job(file_path):
+    """Process-pool worker: parse one file, returning (path, digest, rule, error)."""
+    try:
+        digest = file_digest(file_path)
+        return file_path, digest, parse_rule(file_path), None
+    except Exception as e:
+        return file_path, None, None, str(e)
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def cached_entry(manifest, file_path, st):
+    """Return the manifest entry for an unchanged file, else None."""
+    entry = manifest.get(file_path)
+    if entry is None or entry["size"] != st.st_size:
+        return None
+    if entry["mtime"] == st.st_mtime:
+        return entry
+    # Touched but possibly identical (e.g. fresh git checkout): fall back to the content hash
+    if entry.get("sha256") and entry["sha256"] == file_digest(file_path):
+        entry["mtime"] = st.st_mtime
+        return entry
+    return None
+
+def collect_rule_files():
+    paths = []
     for root, _, files in os.walk(INPUT_DIR):
         for fname in files:
             if fname.endswith(".toml"):
@@ -66,38 +99,104 @@ def main():
                 if "_deprecated" in full_path.lower():
                     continue
 
-                total_files += 1
-
-                try:
-                    parsed = parse_rule(full_path)
-                    if parsed:
-                        parsed_files += 1
-                        print(f"[*] Parsed: {parsed['title']}")
-                        all_rules.append(parsed)
-                except Exception as e:
-                    failed_files += 1
-                    parse_failures.append({
-                        "file": full_path,
-                        "error": str(e)
-                    })
-                    print(f"[!] Failed to parse {full_path}: {e}")
+                paths.append(full_path)
+    return paths
+
+def run(full=False, checkpoint=True):
+    """Parse every rule file (reusing unchanged records) and return the parsed rules.
+
+    With checkpoint=False the parsed rules are only returned, not written to OUTPUT_FILE.
+    """
+    start = time.perf_counter()
+
+    with telemetry.span("scan"):
+        paths = collect_rule_files()
+        manifest = {} if full else load_manifest()
+        new_manifest = {}
+        results = {}
+        to_parse = []
+
+        for full_path in paths:
+            st = os.stat(full_path)
+            entry = cached_entry(manifest, full_path, st)
+            if entry is not None:
+                results[full_path] = (entry.get("rule"), entry.get("error"))
+                new_manifest[full_path] = entry
+            else:
+                to_parse.append((full_path, st))
+
+    cache_hits = len(paths) - len(to_parse)
+    print(f"[*] {len(paths)} rule files: {cache_hits} unchanged, {len(to_parse)} to parse")
+
+    parse_start = time.perf_counter()
+    with telemetry.span("parse"):
+        if to_parse:
+            workers = min(MAX_WORKERS, len(to_parse))
+            stats_by_path = dict(to_parse)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for full_path, digest, parsed, error in pool.map(parse_job, [p for p, _ in to_parse], chunksize=32):
+                    st = stats_by_path[full_path]
+                    results[full_path] = (parsed, error)
+                    new_manifest[full_path] = {
+                        "mtime": st.st_mtime,
+                        "size": st.st_size,
+                        "sha256": digest,
+                        "rule": parsed,
+                        "error": error,
+                    }
+    parse_sec = time.perf_counter() - parse_start
+    telemetry.count("rule_files", len(paths))
+    telemetry.count("cache_hits", cache_hits)
+    telemetry.count("files_parsed", len(to_parse))
+    telemetry.rate("files_parsed_per_s", len(to_parse), parse_sec)
+
+    all_rules = []
+    parse_failures = []
+
+    total_files = len(paths)
+    parsed_files = 0
+    failed_files = 0
+
+    for full_path in paths:
+        parsed, error = results[full_path]
+        if error is not None:
+            failed_files += 1
+            parse_failures.append({
+                "file": full_path,
+                "error": error
+            })
+            print(f"[!] Failed to parse {full_path}: {error}")
+        elif parsed:
+            parsed_files += 1
+            all_rules.append(parsed)
 
     # Write parsed rules
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out_f:
-        for rule in all_rules:
-            out_f.write(json.dumps(rule) + "\n")
+    if checkpoint:
+        with open(OUTPUT_FILE, "w", encoding="utf-8") as out_f:
+            for rule in all_rules:
+                out_f.write(json.dumps(rule) + "\n")
 
     # Write failed file log
     with open(FAILURE_LOG, "w", encoding="utf-8") as fail_f:
         json.dump(parse_failures, fail_f, indent=2)
 
+    # Persist the manifest (dropping files that no longer exist)
+    with open(MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as man_f:
+        json.dump(new_manifest, man_f)
+    os.replace(MANIFEST_FILE + ".tmp", MANIFEST_FILE)
+
     # Write summary stats
     percent = (parsed_files / total_files * 100) if total_files else 0
     stats = {
         "total_files": total_files,
         "parsed_successfully": parsed_files,
         "failed": failed_files,
-        "success_rate": round(percent, 2)
+        "success_rate": round(percent, 2),
+        "cache_hits": cache_hits,
+        "cache_misses": len(to_parse),
+        "parse_workers": min(MAX_WORKERS, len(to_parse)) if to_parse else 0,
+        "parse_sec": round(parse_sec, 3),
+        "total_sec": round(time.perf_counter() - start, 3)
     }
 
     with open(STATS_LOG, "w", encoding="utf-8") as stats_f:
@@ -108,6 +207,11 @@ def main():
     print(f"[*] Parsed: {parsed_files}/{total_files} → {OUTPUT_FILE}")
     print(f"[!] Failed TOML parses: {failed_files} → {FAILURE_LOG}")
     print(f"[#] Success rate: {percent:.2f}% → {STATS_LOG}")
+    print(f"[#] Reused {cache_hits} cached records, parsed {len(to_parse)} in {parse_sec:.2f}s")
+    return all_rules
+
+def main():
+    run(full="--full" in sys.argv[1:])
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,50 @@
 import json
 import faiss
-import pickle
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import os
+import re
+import sys
+import time
+
+import index_factory
+import telemetry
+from embedding_cache import EmbeddingCache
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex, reciprocal_rank_fusion
+from rule_store import RuleStore
 
 ALERT_FILE = "data/normalized_alerts.jsonl"
 FAISS_INDEX_FILE = "data/faiss_index.bin"
-METADATA_FILE = "data/faiss_metadata.pkl"
+METADATA_FILE = "data/faiss_metadata.bin"
 OUTPUT_FILE = "data/alert_matches.jsonl"
 EMBED_MODEL = "all-MiniLM-L6-v2"
+TOP_K = 5
+BATCH_SIZE = 256  # distinct alert texts encoded and searched per chunk
+MAX_PENDING = BATCH_SIZE * 16  # alerts held back (to keep input order) before a partial chunk is flushed
+MATCH_CACHE_SIZE = 50_000  # distinct texts whose match sets are kept for repeats
+HYBRID_CANDIDATES = 4  # dense and lexical hits per list fused, as a multiple of k
+MIN_PARTITION_RULES = 25  # smaller technique/tactic partitions fall back to the next level, then global
+ID_SHORTCUT_MARGIN = 1.5  # BM25 score ratio between the k-th and (k+1)-th rule needed to skip the encoder
+MATCH_FIELDS = ["title", "tactic", "technique", "technique_id", "query", "description",
+                "risk_score", "tags", "references"]
 
 def load_alerts():
     with open(ALERT_FILE, "r", encoding="utf-8") as f:
         return [json.loads(line.strip()) for line in f]
 
 def load_index_and_metadata():
-    index = faiss.read_index(FAISS_INDEX_FILE)
-    with open(METADATA_FILE, "rb") as f:
-        metadata = pickle.load(f)
+    """Load the index with the search settings recorded by embed_chunks.py."""
+    index = index_factory.configure(faiss.read_index(FAISS_INDEX_FILE), index_factory.load_params())
+    metadata = RuleStore(METADATA_FILE, fields=MATCH_FIELDS)
     return index, metadata
 
+def load_lexical_index():
+    """The BM25 index written by embed_chunks.py, or None (dense search only) if missing."""
+    if not os.path.exists(LEXICAL_INDEX_FILE):
+        print(f"[~] {LEXICAL_INDEX_FILE} not found; re-run embed_chunks.py for hybrid retrieval")
+        return None
+    return LexicalIndex(LEXICAL_INDEX_FILE)
+
 def alert_to_text(alert):
     fields = [
         alert.get("title", ""),
@@ -32,43 +57,245 @@ def alert_to_text(alert):
     ]
     return " ".join(str(f).strip() for f in fields if f)
 
+def technique_key(value):
+    """'T1059.001' → 'T1059'; '' for anything that is not a technique ID."""
+    value = str(value or "").strip().upper()
+    return value.split(".", 1)[0] if re.fullmatch(r"T\d{4}(\.\d{3})?", value) else ""
+
+def partition_keys(record):
+    """Partitions a rule or alert belongs to, most specific first.
+
+    Alerts carry the technique ID in "technique", rules in "technique_id".
+    """
+    keys = []
+    technique = technique_key(record.get("technique_id")) or technique_key(record.get("technique"))
+    if technique:
+        keys.append(("technique", technique))
+    tactic = str(record.get("tactic") or "").strip().lower()
+    if tactic:
+        keys.append(("tactic", tactic))
+    return keys
+
+def build_partitions(index, metadata, min_rules=MIN_PARTITION_RULES):
+    """{("technique"|"tactic", key): (search function, FAISS IDs)} for partitions of at least min_rules rules."""
+    members = {}
+    for faiss_id in metadata:
+        for key in partition_keys(metadata[faiss_id]):
+            members.setdefault(key, []).append(faiss_id)
+    with telemetry.span("partition"):
+        partitions = {key: (index_factory.subset_search(index, ids), ids)
+                      for key, ids in members.items() if len(ids) >= min_rules}
+    print(f"[*] Pre-filtering on {sum(k[0] == 'technique' for k in partitions)} technique and "
+          f"{sum(k[0] == 'tactic' for k in partitions)} tactic partitions (≥ {min_rules} rules each)")
+    return partitions
+
+def partition_for(alert, partitions):
+    return next((key for key in partition_keys(alert) if key in partitions), None)
+
+def search_partitioned(index, partitions, vectors, keys, k):
+    """Search each row in its partition; rows without one, or with fewer than k hits there, search globally."""
+    distances = np.empty((len(vectors), k), dtype="float32")
+    indices = np.empty((len(vectors), k), dtype="int64")
+    rows_by_key = {}
+    for row, key in enumerate(keys):
+        rows_by_key.setdefault(key, []).append(row)
+    fallback = rows_by_key.pop(None, [])
+    for key, rows in rows_by_key.items():
+        search, _ = partitions[key]
+        d, i = search(vectors[rows], k)
+        short = (i < 0).any(axis=1)
+        distances[rows], indices[rows] = d, i
+        fallback.extend(row for row, is_short in zip(rows, short) if is_short)
+    if fallback:
+        distances[fallback], indices[fallback] = index.search(vectors[fallback], k)
+    telemetry.count("partitioned_searches", len(vectors) - len(fallback))
+    telemetry.count("global_searches", len(fallback))
+    return distances, indices
+
+def build_match_set(distances, indices, metadata, fused=None):
+    """A distance of None marks a rule found only lexically: "score" is null and "lexical_only" is set."""
+    match_set = []
+    for row, (distance, idx) in enumerate(zip(distances, indices)):
+        if idx < 0:  # FAISS pads with -1 when fewer than k vectors exist
+            continue
+        rule = metadata[int(idx)]  # RuleStore, or the {faiss_id: rule} dict from build_index()
+        match = {
+            "title": rule.get("title", ""),
+            "tactic": rule.get("tactic", ""),
+            "technique": rule.get("technique", ""),
+            "technique_id": rule.get("technique_id", ""),
+            "query": rule.get("query", ""),
+            "description": rule.get("description", ""),
+            "risk_score": rule.get("risk_score", ""),
+            "tags": rule.get("tags", []),
+            "references": rule.get("references", []),
+            "score": None if distance is None else float(distance)
+        }
+        if distance is None:
+            match["lexical_only"] = True
+        if fused is not None:
+            match["fused_score"] = round(fused[row], 6)
+        match_set.append(match)
+    return match_set
+
+def fuse_match_set(text, ids, distances, indices, metadata, lexical, k):
+    """Reciprocal-rank fusion of one alert text's dense hits with its BM25 hits.
+
+    "score" stays the dense distance; rules found only lexically have none. With
+    `ids` (the alert's partition), the lexical search is limited to those rules.
+    """
+    dense = {int(i): float(d) for d, i in zip(distances, indices) if i >= 0}
+    hits = [faiss_id for faiss_id, score in lexical.search(text, len(distances), ids=ids)
+            if score > 0 and faiss_id in metadata]
+    fused = reciprocal_rank_fusion([list(dense), hits])[:k]
+    return build_match_set([dense.get(faiss_id) for faiss_id, _ in fused],
+                           [faiss_id for faiss_id, _ in fused], metadata, [score for _, score in fused])
+
+def technique_match_set(text, lexical, metadata, k):
+    """Match set from exact technique-ID hits alone, or None unless BM25 settles the top k.
+
+    The top k rules carrying the ID must all score, and the k-th must beat the next
+    one by ID_SHORTCUT_MARGIN; otherwise the choice among them is left to the dense
+    search. These alerts skip the encoder, so their matches are lexical-only.
+    """
+    rules = [faiss_id for faiss_id in lexical.technique_rules(text) if faiss_id in metadata]
+    if len(rules) < k:
+        return None
+    ranked = lexical.search(text, k + 1, ids=rules)
+    if ranked[k - 1][1] <= 0 or (len(ranked) > k and ranked[k - 1][1] < ID_SHORTCUT_MARGIN * ranked[k][1]):
+        return None
+    fused = reciprocal_rank_fusion([[faiss_id for faiss_id, _ in ranked[:k]]])
+    return build_match_set([None] * len(fused), [faiss_id for faiss_id, _ in fused], metadata,
+                           [score for _, score in fused])
+
+def encode_texts(model, texts, batch_size=BATCH_SIZE, embed_cache=None):
+    """Encode texts as a float32 matrix, reusing vectors from embed_cache where present."""
+    vectors = embed_cache.get_many(texts) if embed_cache is not None else {}
+    missing = [text for text in texts if text not in vectors]
+    if missing:
+        with telemetry.span("encode"):
+            fresh = model.encode(missing, batch_size=batch_size, convert_to_numpy=True).astype("float32")
+        if embed_cache is not None:
+            embed_cache.put_many(missing, fresh)
+        vectors.update(zip(missing, fresh))
+    telemetry.count("texts_encoded", len(missing))
+    return np.vstack([vectors[text] for text in texts])
+
+def search_alerts(model, index, metadata, alerts, k=TOP_K, batch_size=BATCH_SIZE, embed_cache=None,
+                  partitions=None, lexical=None, id_shortcut=True):
+    """Yield (alert, match_set) in input order.
+
+    Each distinct alert text is encoded and searched once; alerts repeating a text
+    share its match set. With `partitions` (build_partitions()), each alert only
+    searches the rules of its technique, else its tactic, else the whole index.
+    With a `lexical` index, dense and BM25 hits are fused by reciprocal rank, and
+    (with id_shortcut) a text naming a technique ID whose top k rules BM25 ranks
+    unambiguously is answered from those rules without being encoded.
+    """
+    inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    candidates = k * HYBRID_CANDIDATES if lexical is not None else k
+    seen = {}                  # text -> match_set from earlier chunks
+    pending, new_texts = [], {}
+
+    def drain():
+        fresh = {}
+        if new_texts:
+            texts = list(new_texts)
+            query_vectors = encode_texts(model, texts, batch_size, embed_cache)
+            if inner_product:
+                faiss.normalize_L2(query_vectors)
+            with telemetry.span("search"):
+                if partitions:
+                    distances, indices = search_partitioned(index, partitions, query_vectors,
+                                                            [new_texts[text] for text in texts], candidates)
+                else:
+                    distances, indices = index.search(query_vectors, candidates)
+            if inner_product:
+                distances = 2.0 - 2.0 * distances  # cosine → squared L2 on unit vectors, so lower stays closer
+            for row, text in enumerate(texts):
+                if lexical is not None:
+                    key = new_texts[text]
+                    ids = partitions[key][1] if key is not None else None
+                    fresh[text] = fuse_match_set(text, ids, distances[row], indices[row], metadata, lexical, k)
+                else:
+                    fresh[text] = build_match_set(distances[row], indices[row], metadata)
+            telemetry.count("unique_texts", len(texts))
+        for alert, text in pending:
+            yield alert, fresh[text] if text in fresh else seen[text]
+        telemetry.count("alerts", len(pending))
+        if len(seen) + len(fresh) > MATCH_CACHE_SIZE:
+            seen.clear()
+        seen.update(fresh)
+        pending.clear()
+        new_texts.clear()
+
+    for alert in alerts:
+        text = alert_to_text(alert)
+        if text not in seen and lexical is not None and id_shortcut:
+            match_set = technique_match_set(text, lexical, metadata, k)
+            if match_set is not None:
+                seen[text] = match_set
+                telemetry.count("id_shortcuts")
+        if text not in seen:
+            # The text includes tactic and technique, so repeats share a partition too
+            new_texts[text] = partition_for(alert, partitions) if partitions else None
+        pending.append((alert, text))
+        if len(new_texts) >= batch_size or len(pending) >= MAX_PENDING:
+            yield from drain()
+    yield from drain()
+
+def match_alerts(alerts, model, index, metadata, output_file=None, embed_cache=None, prefilter=True,
+                 hybrid=True):
+    """Return [{"alert", "matches"}] for every alert, optionally checkpointing to output_file."""
+    partitions = build_partitions(index, metadata) if prefilter else None
+    lexical = load_lexical_index() if hybrid else None
+    start = time.perf_counter()
+    results = [{"alert": alert, "matches": match_set}
+               for alert, match_set in search_alerts(model, index, metadata, alerts, embed_cache=embed_cache,
+                                                     partitions=partitions, lexical=lexical)]
+    telemetry.rate("alerts_per_s", len(alerts), time.perf_counter() - start)
+    if output_file:
+        with telemetry.span("write"), open(output_file, "w", encoding="utf-8") as out_f:
+            for record in results:
+                out_f.write(json.dumps(record) + "\n")
+    print(f"[+] Matched {len(alerts)} alerts with FAISS rules" + (f" → {output_file}" if output_file else ""))
+    return results
+
 def main():
     if not os.path.exists(ALERT_FILE):
         print("[!] Normalized alerts not found.")
         return
 
-    model = SentenceTransformer(EMBED_MODEL)
-    index, metadata = load_index_and_metadata()
-    alerts = load_alerts()
+    # --embed-cache keeps alert embeddings on disk across runs
+    embed_cache = EmbeddingCache(EMBED_MODEL) if "--embed-cache" in sys.argv[1:] else None
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out_f:
-        for alert in alerts:
-            alert_text = alert_to_text(alert)
-            query_vector = model.encode([alert_text])
-            distances, indices = index.search(query_vector, k=5)
-
-            match_set = []
-            for i, idx in enumerate(indices[0]):
-                rule = metadata[idx]
-                match_set.append({
-                    "title": rule.get("title", ""),
-                    "tactic": rule.get("tactic", ""),
-                    "technique": rule.get("technique", ""),
-                    "technique_id": rule.get("technique_id", ""),
-                    "query": rule.get("query", ""),
-                    "description": rule.get("description", ""),
-                    "risk_score": rule.get("risk_score", ""),
-                    "tags": rule.get("tags", []),
-                    "references": rule.get("references", []),
-                    "score": float(distances[0][i])
-                })
+    with telemetry.span("load"):
+        model = SentenceTransformer(EMBED_MODEL)
+        index, metadata = load_index_and_metadata()
+        alerts = load_alerts()
+    # --no-prefilter searches every alert against the whole index
+    partitions = None if "--no-prefilter" in sys.argv[1:] else build_partitions(index, metadata)
+    # --no-lexical is dense-only; --no-id-shortcut still encodes alerts with exact technique-ID hits
+    lexical = None if "--no-lexical" in sys.argv[1:] else load_lexical_index()
 
+    start = time.perf_counter()
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as out_f:
+        for alert, match_set in search_alerts(model, index, metadata, alerts, embed_cache=embed_cache,
+                                              partitions=partitions, lexical=lexical,
+                                              id_shortcut="--no-id-shortcut" not in sys.argv[1:]):
             out_f.write(json.dumps({
                 "alert": alert,
                 "matches": match_set
             }) + "\n")
+    telemetry.rate("alerts_per_s", len(alerts), time.perf_counter() - start)
 
     print(f"[+] Matched {len(alerts)} alerts with FAISS rules → {OUTPUT_FILE}")
+    if embed_cache is not None:
+        stats = embed_cache.stats()
+        telemetry.count("embed_cache_hits", stats["hits"])
+        telemetry.count("embed_cache_misses", stats["misses"])
+        print(f"[=] Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%})")
+        embed_cache.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,143 @@
+# scripts/rule_store.py
+#
+# Read-only, memory-mapped rule metadata keyed by FAISS ID (replaces the pickled
+# {faiss_id: rule} dict). The file is columnar: each field is one blob of JSON-
+# encoded values plus an int64 offset table indexed by FAISS ID, so a lookup is
+# two array reads and a json.loads of just that cell. Readers only touch the
+# pages of the fields they ask for, and nothing is unpickled.
+#
+# Layout (native byte order, i.e. little-endian on the hosts we run on):
+#   MAGIC | uint32 header length | header JSON
+#   present  uint8[slots]             1 where the ID holds a rule
+#   per field: offsets int64[slots+1] then the concatenated values
+# Byte positions of each section are recorded in the header.
+
+import json
+import mmap
+import struct
+from array import array
+
+MAGIC = b"ARGUSRS1"
+ROW_CACHE_SIZE = 4096  # decoded rows kept per store; top-k hits repeat a lot
+_MISSING = object()
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def write_store(path, rows, fields=None):
+    """Write {faiss_id: rule} to path. `fields` defaults to every key seen."""
+    if fields is None:
+        fields = []
+        for rule in rows.values():
+            fields.extend(key for key in rule if key not in fields)
+    slots = max(rows, default=-1) + 1
+
+    present = bytearray(slots)
+    for slot in rows:
+        present[slot] = 1
+    columns = {}
+    for field in fields:
+        offsets = array("q", [0])
+        chunks, pos = [], 0
+        for slot in range(slots):
+            rule = rows.get(slot)
+            if rule is not None and field in rule:
+                cell = json.dumps(rule[field], ensure_ascii=False).encode("utf-8")
+                chunks.append(cell)
+                pos += len(cell)
+            offsets.append(pos)
+        columns[field] = (offsets.tobytes(), b"".join(chunks))
+
+    # Section positions are relative to the end of the header
+    layout, pos = {"present": 0}, _align(slots)
+    for field, (offsets, blob) in columns.items():
+        layout[field] = {"offsets": pos, "data": pos + len(offsets)}
+        pos = _align(pos + len(offsets) + len(blob))
+    header = json.dumps({"fields": fields, "slots": slots, "count": len(rows), "layout": layout}).encode("utf-8")
+    start = _align(len(MAGIC) + 4 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(b"\0" * (start - f.tell()))
+        f.write(present)
+        for field, (offsets, blob) in columns.items():
+            f.write(b"\0" * (start + layout[field]["offsets"] - f.tell()))
+            f.write(offsets)
+            f.write(blob)
+
+
+class RuleStore:
+    """Mapping-like view: store[faiss_id] → dict of the selected fields."""
+
+    def __init__(self, path, fields=None):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a rule store")
+        (size,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        header = json.loads(self._mm[len(MAGIC) + 4:len(MAGIC) + 4 + size])
+        start = _align(len(MAGIC) + 4 + size)
+
+        self.slots = header["slots"]
+        self.count = header["count"]
+        self.fields = [f for f in (fields or header["fields"]) if f in header["layout"]]
+        view = memoryview(self._mm)
+        self._present = view[start:start + self.slots]
+        self._columns = {}
+        for field in self.fields:
+            section = header["layout"][field]
+            pos = start + section["offsets"]
+            offsets = view[pos:pos + 8 * (self.slots + 1)].cast("q")
+            self._columns[field] = (offsets, start + section["data"])
+        self._views = [view, self._present] + [offsets for offsets, _ in self._columns.values()]
+        self._rows = {}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (faiss_id for faiss_id in range(self.slots) if self._present[faiss_id] == 1)
+
+    def __contains__(self, faiss_id):
+        return 0 <= faiss_id < self.slots and self._present[faiss_id] == 1
+
+    def value(self, faiss_id, field, default=None):
+        offsets, base = self._columns[field]
+        lo, hi = offsets[faiss_id], offsets[faiss_id + 1]
+        return json.loads(self._mm[base + lo:base + hi]) if hi > lo else default
+
+    def __getitem__(self, faiss_id):
+        row = self._rows.get(faiss_id)
+        if row is None:
+            if faiss_id not in self:
+                raise KeyError(faiss_id)
+            row = {}
+            for field in self.fields:
+                value = self.value(faiss_id, field, _MISSING)
+                if value is not _MISSING:
+                    row[field] = value
+            if len(self._rows) >= ROW_CACHE_SIZE:
+                self._rows.clear()
+            self._rows[faiss_id] = row
+        return row
+
+    def get(self, faiss_id, default=None):
+        return self[faiss_id] if faiss_id in self else default
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()  # the mmap refuses to close while views are exported
+        self._columns = {}
+        self._views = []
+        self._rows = {}
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
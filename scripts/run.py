@@ -1,76 +1,152 @@
 # run_pipeline.py
+#
+#   python scripts/run.py                    interactive, one subprocess per stage
+#   python scripts/run.py --in-process       all stages as function calls in this process;
+#                                            the embedding model and FAISS index load once
+#     --no-checkpoints                       keep intermediate data in memory only
+#     --no-llm                               stop after nesting (skip both LLM stages)
+#     --model=<tag>                          Ollama model for the LLM stages
+#   python scripts/run.py --make [--force]   make-style: skip fresh steps, run independent
+#                                            steps concurrently (e.g. rules alongside alerts)
+#   --window=15m [--slide=5m] [--store=PATH]  any mode: windowed incremental grouping into the
+#                                            group store; summaries are merged, not rewritten
 
 import subprocess
 import sys
+import os
 import time
+import hashlib
+import threading
 import psutil
 import GPUtil
 import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
+import telemetry
+from group_store import DEFAULT_STORE_FILE
+
+# "inputs"/"outputs" drive --make: a step is skipped when all outputs exist, are newer
+# than every input, and the hash of its "code" files matches the last successful run.
+# "code" lists every local module the script imports, directly or through another one.
+# A directory input counts as its newest file.
 steps = [
     {
         "name": "Parse Rules",
-        "script": "scripts/parse_rules.py"
+        "script": "scripts/parse_rules.py",
+        "code": ["scripts/telemetry.py"],
+        "inputs": ["data/raw_rules/elastic/rules"],
+        "outputs": ["data/parsed_rules.jsonl", "data/parse_failures.json", "data/parse_stats.json"]
     },
     {
         "name": "Embed Rules into FAISS Index",
-        "script": "scripts/embed_chunks.py"
+        "script": "scripts/embed_chunks.py",
+        "code": ["scripts/index_factory.py", "scripts/rule_store.py", "scripts/lexical_index.py",
+                 "scripts/telemetry.py"],
+        "inputs": ["data/parsed_rules.jsonl"],
+        "outputs": ["data/faiss_index.bin", "data/faiss_metadata.bin", "data/faiss_manifest.json",
+                    "data/faiss_index.json", "data/lexical_index.json"]
     },
     {
         "name": "Normalize Alerts",
-        "script": "scripts/normalize_alerts.py"
+        "script": "scripts/normalize_alerts.py",
+        "code": ["scripts/vendor_schemas.py", "scripts/telemetry.py"],
+        "inputs": ["data/xdr_gui_alerts.json"],
+        "outputs": ["data/normalized_alerts.jsonl"]
     },
     {
         "name": "Query FAISS with First Alert",
-        "script": "scripts/query_faiss.py"
+        "script": "scripts/query_faiss.py",
+        "code": ["scripts/index_factory.py", "scripts/rule_store.py", "scripts/lexical_index.py",
+                 "scripts/embedding_cache.py", "scripts/sqlite_lru.py", "scripts/telemetry.py"],
+        "inputs": ["data/normalized_alerts.jsonl", "data/faiss_index.bin", "data/faiss_metadata.bin",
+                   "data/faiss_index.json", "data/lexical_index.json"],
+        "outputs": ["data/alert_matches.jsonl"]
     },
     {
         "name": "Group FAISS Matches",
-        "script": "scripts/group_faiss_matches.py"
+        "script": "scripts/group_faiss_matches.py",
+        "code": ["scripts/group_store.py", "scripts/telemetry.py"],
+        "inputs": ["data/alert_matches.jsonl"],
+        "outputs": ["data/grouped_matches.jsonl"]
     },
     {
         "name": "Nest Grouped Matches",
-        "script": "scripts/nest_grouped_matches.py"
+        "script": "scripts/nest_grouped_matches.py",
+        "code": ["scripts/telemetry.py"],
+        "inputs": ["data/grouped_matches.jsonl"],
+        "outputs": ["data/nested_grouped_matches.jsonl", "data/nested_grouped_matches.json"]
     },
     {
         "name": "LLM Group Summarisation",
-        "script": "scripts/llm_summary.py"
+        "script": "scripts/llm_summary.py",
+        "code": ["scripts/llm_client.py", "scripts/summary_cache.py", "scripts/sqlite_lru.py", "scripts/group_store.py",
+                 "scripts/telemetry.py"],
+        "inputs": ["data/nested_grouped_matches.json"],
+        "outputs": ["data/group_summaries.jsonl"]
+    },
+    {
+        "name": "Cluster Group Summaries",
+        "script": "scripts/cluster_summaries.py",
+        "code": ["scripts/telemetry.py"],
+        "inputs": ["data/group_summaries.jsonl"],
+        "outputs": ["data/summary_clusters.jsonl"]
     },
     {
         "name": "Executive-Level Takeaways",
-        "script": "scripts/llm_summary_overall.py"
+        "script": "scripts/llm_summary_overall.py",
+        "code": ["scripts/llm_client.py", "scripts/llm_summary.py", "scripts/summary_cache.py",
+                 "scripts/sqlite_lru.py", "scripts/group_store.py", "scripts/telemetry.py"],
+        "inputs": ["data/group_summaries.jsonl", "data/summary_clusters.jsonl"],
+        "outputs": ["data/top5_takeaways.txt", "data/top5_takeaways.html"]
     }
 ]
 
-def log_resource_usage(step_name, duration_sec):
+PIPELINE_STATE = "data/pipeline_state.json"  # step name -> code hash of last successful run
+MAX_PARALLEL_STEPS = 2
+
+def log_resource_usage(step_name, duration_sec, usage=None, status="ok"):
+    """Append a kind="step" record: duration, system snapshot and (if sampled) the
+    peak RSS/CPU of the stage's own process tree."""
     try:
         ram = psutil.virtual_memory()
-        cpu = psutil.cpu_percent(interval=0.5)
+        cpu = psutil.cpu_percent(interval=None)  # since the previous call; non-blocking
         gpus = GPUtil.getGPUs()
         gpu_mem = sum(g.memoryUsed for g in gpus) if gpus else 0
 
         metrics = {
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "kind": "step",
             "step": step_name,
+            "status": status,
             "duration_sec": round(duration_sec, 2),
             "ram_used_mb": round(ram.used / (1024 * 1024), 2),
             "cpu_percent": round(cpu, 2),
-            "gpu_memory_mb": round(gpu_mem, 2)
+            "gpu_memory_mb": round(gpu_mem, 2),
+            **(usage or {})
         }
 
-        with open("data/step_metrics.jsonl", "a", encoding="utf-8") as f:
-            f.write(json.dumps(metrics) + "\n")
+        telemetry.write_record(metrics)
     except Exception as e:
         print(f"[!] Failed to record metrics for {step_name}: {e}")
 
+def run_script(step):
+    """Run a stage script as a child process while sampling its resource usage."""
+    cmd = [sys.executable, step["script"]] + step.get("args", [])
+    env = {**os.environ, "ARGUS_RUN_ID": telemetry.RUN_ID, "ARGUS_STEP": step["name"]}
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env)
+    sampler = telemetry.ResourceSampler(proc.pid).start()
+    returncode = proc.wait()
+    usage = sampler.stop()
+    log_resource_usage(step["name"], time.perf_counter() - start, usage,
+                       status="ok" if returncode == 0 else f"exit {returncode}")
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
 def run_step(step, auto_run=False):
     if auto_run:
         print(f"\n[*] Running step: {step['name']}")
         try:
-            start = time.perf_counter()
-            subprocess.run([sys.executable, step["script"]], check=True)
-            end = time.perf_counter()
-            log_resource_usage(step["name"], end - start)
+            run_script(step)
         except subprocess.CalledProcessError as e:
             print(f"[!] Error in step: {step['name']}")
             print(e)
@@ -82,10 +158,7 @@ def run_step(step, auto_run=False):
         if choice == "Y":
             print(f"[>] Running: {step['script']}")
             try:
-                start = time.perf_counter()
-                subprocess.run([sys.executable, step["script"]], check=True)
-                end = time.perf_counter()
-                log_resource_usage(step["name"], end - start)
+                run_script(step)
             except subprocess.CalledProcessError as e:
                 print(f"[!] Error in step: {step['name']}")
                 print(e)
@@ -102,7 +175,237 @@ def run_step(step, auto_run=False):
         else:
             print("[!] Invalid choice. Enter Y, N, C, or A.")
 
+def path_mtime(path):
+    """mtime of a file, or of the newest file under a directory; None if missing."""
+    if os.path.isdir(path):
+        newest = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for fname in files:
+                newest = max(newest, os.path.getmtime(os.path.join(root, fname)))
+        return newest
+    if os.path.exists(path):
+        return os.path.getmtime(path)
+    return None
+
+def code_hash(step):
+    digest = hashlib.sha256()
+    for path in [step["script"]] + step.get("code", []):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    digest.update(json.dumps(step.get("args", [])).encode("utf-8"))
+    return digest.hexdigest()
+
+def load_state():
+    if not os.path.exists(PIPELINE_STATE):
+        return {}
+    with open(PIPELINE_STATE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state):
+    with open(PIPELINE_STATE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(PIPELINE_STATE + ".tmp", PIPELINE_STATE)
+
+def is_fresh(step, state):
+    """Return (fresh, reason)."""
+    output_times = [path_mtime(p) for p in step["outputs"]]
+    input_times = [path_mtime(p) for p in step["inputs"]]
+    if any(t is None for t in input_times):
+        # Nothing to rebuild from (e.g. raw rules not downloaded): keep what we have
+        if all(t is not None for t in output_times):
+            return True, "inputs missing, keeping existing outputs"
+        return False, "missing input"
+    if any(t is None for t in output_times):
+        return False, "missing output"
+    if state.get(step["name"]) != code_hash(step):
+        return False, "code changed"
+    if input_times and max(input_times) > min(output_times):
+        return False, "inputs changed"
+    return True, "up to date"
+
+def step_dependencies(pipeline):
+    """Map step name -> names of the steps that produce its inputs."""
+    producers = {out: step["name"] for step in pipeline for out in step["outputs"]}
+    return {
+        step["name"]: {producers[p] for p in step["inputs"] if p in producers and producers[p] != step["name"]}
+        for step in pipeline
+    }
+
+def run_make(pipeline=steps, force=False, max_parallel=MAX_PARALLEL_STEPS):
+    """Run stale steps in dependency order, independent ones concurrently."""
+    deps = step_dependencies(pipeline)
+    by_name = {step["name"]: step for step in pipeline}
+    state = load_state()
+    state_lock = threading.Lock()
+    done, failed = set(), set()
+    pending = [step["name"] for step in pipeline]
+    running = {}
+
+    def execute(step):
+        run_script(step)
+        with state_lock:
+            state[step["name"]] = code_hash(step)
+            save_state(state)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+        while pending or running:
+            for name in list(pending):
+                if deps[name] & failed:
+                    print(f"[~] Skipping {name}: an upstream step failed.")
+                    pending.remove(name)
+                    failed.add(name)
+                elif deps[name] <= done:
+                    pending.remove(name)
+                    fresh, reason = (False, "forced") if force else is_fresh(by_name[name], state)
+                    if fresh:
+                        print(f"[=] {name}: {reason}, skipping.")
+                        done.add(name)
+                    else:
+                        print(f"\n[*] Running step: {name} ({reason})")
+                        running[pool.submit(execute, by_name[name])] = name
+
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    done.add(name)
+                except subprocess.CalledProcessError as e:
+                    print(f"[!] Error in step: {name}")
+                    print(e)
+                    failed.add(name)
+
+    return not failed
+
+def run_timed(name, fn, *args, **kwargs):
+    print(f"\n[*] Running step: {name}")
+    telemetry.set_step(name)
+    sampler = telemetry.ResourceSampler().start()
+    start = time.perf_counter()
+    status = "failed"
+    try:
+        result = fn(*args, **kwargs)
+        status = "ok"
+        return result
+    finally:
+        telemetry.flush()
+        log_resource_usage(name, time.perf_counter() - start, sampler.stop(), status=status)
+
+def windowed_args(window, slide, store_path):
+    """Command-line flags for the grouping and summary steps in windowed mode."""
+    group_args = [f"--window={window}", f"--store={store_path}"] + ([f"--slide={slide}"] if slide else [])
+    return {"Group FAISS Matches": group_args, "LLM Group Summarisation": [f"--store={store_path}"]}
+
+def run_in_process(checkpoint=True, with_llm=True, model_tag="llama3:8b", window=None, slide=None,
+                   store_path=None):
+    """Run every stage as a function call, passing data between stages in memory.
+
+    Intermediate files are only written when `checkpoint` is set; the FAISS index,
+    rule manifests and the final summaries/takeaways are always persisted. With
+    `window`, matches are folded into the group store and only dirty groups go on.
+    """
+    # Deferred so the interactive subprocess mode never pays for these imports
+    from sentence_transformers import SentenceTransformer
+    import parse_rules
+    import embed_chunks
+    import normalize_alerts
+    import query_faiss
+    import group_faiss_matches
+    import nest_grouped_matches
+
+    rules = run_timed("Parse Rules", parse_rules.run, checkpoint=checkpoint)
+    model = run_timed("Load Embedding Model", SentenceTransformer, embed_chunks.EMBED_MODEL)
+    index, metadata = run_timed("Embed Rules into FAISS Index", embed_chunks.build_index, rules, model=model)
+    if index is None:
+        print("[!] Empty rule index, stopping.")
+        return
+
+    alerts = run_timed("Normalize Alerts", normalize_alerts.normalize_file, normalize_alerts.INPUT_FILE,
+                       normalize_alerts.OUTPUT_FILE if checkpoint else None)
+    matches = run_timed("Query FAISS", query_faiss.match_alerts, alerts, model, index, metadata,
+                        query_faiss.OUTPUT_FILE if checkpoint else None)
+
+    def group_stage():
+        if window:
+            return windowed_group_stage()
+        grouped = group_faiss_matches.group_matches(matches)
+        if checkpoint:
+            group_faiss_matches.save_grouped_matches(grouped, group_faiss_matches.OUTPUT_FILE)
+        print(f"[+] Grouped {len(grouped)} sets of FAISS alert matches")
+        return group_faiss_matches.to_records(grouped)
+
+    def windowed_group_stage():
+        from group_store import GroupStore
+        store = GroupStore(store_path)
+        try:
+            batch, newest, newest_keys, _ = group_faiss_matches.group_windowed(
+                matches, group_faiss_matches.parse_duration(window),
+                group_faiss_matches.parse_duration(slide) if slide else None,
+                store.get_watermark(), store.get_watermark_keys())
+            store.add_entries(batch, newest, newest_keys)
+            store.prune()
+            dirty = list(store.iter_dirty())
+        finally:
+            store.close()
+        print(f"[+] Updated {len(batch)} windowed groups; {len(dirty)} dirty")
+        return dirty
+
+    def nest_stage():
+        nested = nest_grouped_matches.nest_for_summary(groups)
+        if checkpoint:
+            nest_grouped_matches.save_nested(nested)
+        return nested
+
+    groups = run_timed("Group FAISS Matches", group_stage)
+    nested = run_timed("Nest Grouped Matches", nest_stage)
+
+    if not with_llm:
+        return
+
+    import llm_summary
+    import llm_summary_overall
+    import cluster_summaries
+
+    summaries = run_timed("LLM Group Summarisation", llm_summary.summarize_nested, nested, model_tag,
+                          store_path=store_path if window else None)
+    if window:
+        # The takeaways cover every window, not just the groups re-summarized in this run
+        with open(llm_summary.OUTPUT_FILE, "r", encoding="utf-8") as f:
+            summaries = [json.loads(line) for line in f if line.strip()]
+    clusters = run_timed("Cluster Group Summaries", cluster_summaries.cluster_summaries, summaries, model)
+    if checkpoint:
+        cluster_summaries.save_clusters(clusters)
+    llm_summary_overall.MODEL_TAG = model_tag
+    run_timed("Executive-Level Takeaways", llm_summary_overall.generate_takeaways, clusters)
+
+def option(args, name, default=None):
+    return next((a.split("=", 1)[1] for a in args if a.startswith(f"--{name}=")), default)
+
 def main():
+    args = sys.argv[1:]
+    window, slide = option(args, "window"), option(args, "slide")
+    store_path = option(args, "store", DEFAULT_STORE_FILE)
+    if window:
+        step_args = windowed_args(window, slide, store_path)
+        for step in steps:
+            step["args"] = step_args.get(step["name"], [])
+
+    if "--in-process" in args:
+        print("=== RAG Pipeline Runner (in-process) ===")
+        model_tag = option(args, "model", "llama3:8b")
+        run_in_process(checkpoint="--no-checkpoints" not in args, with_llm="--no-llm" not in args,
+                       model_tag=model_tag, window=window, slide=slide, store_path=store_path)
+        print("\n[+] Pipeline complete.")
+        return
+
+    if "--make" in args:
+        print("=== RAG Pipeline Runner (make) ===")
+        ok = run_make(force="--force" in args)
+        print("\n[+] Pipeline complete." if ok else "\n[!] Pipeline finished with errors.")
+        return
+
     print("=== RAG Pipeline Runner ===")
     auto_run = False
     for step in steps:
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""SQLite-backed LRU key/value store shared by the summary and embedding caches.
+
+One table per cache: (key, model, <value column>, created, last_used). Lookups bump
+last_used; once `max_entries` is exceeded the least-recently-used rows are evicted.
+Safe to share across worker threads. Callers own key derivation and value encoding.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+_SQL_BATCH = 500  # stay under SQLite's bound-parameter limit
+
+
+class SQLiteLRU:
+    def __init__(self, path: str, table: str, value_column: str, value_type: str, max_entries: int) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._table = table
+        self._value = value_column
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            f" {value_column} {value_type} NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+        if "last_used" not in columns:  # caches written before entries were tracked by use
+            self._db.execute(f"ALTER TABLE {table} ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._db.execute(f"UPDATE {table} SET last_used = created")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table}(last_used)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        """Return {key: value} for the keys that are stored, marking them as used."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                marks = ",".join("?" * len(batch))
+                found.update(self._db.execute(
+                    f"SELECT key, {self._value} FROM {self._table} WHERE key IN ({marks})", batch
+                ).fetchall())
+            if found:
+                self._db.executemany(f"UPDATE {self._table} SET last_used = ? WHERE key = ?",
+                                     ((now, key) for key in found))
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key: str, model: str, value: Any) -> None:
+        self.put_many([(key, model, value)])
+
+    def put_many(self, rows: Iterable[Tuple[str, str, Any]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {self._table} (key, model, {self._value}, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                ((key, model, value, now, now) for key, model, value in rows),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                f"DELETE FROM {self._table} WHERE key IN"
+                f" (SELECT key FROM {self._table} ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
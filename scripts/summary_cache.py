@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""Content-addressed cache for LLM summaries.
+
+Entries are keyed on a SHA-256 of (prompt, model tag, generation options), so an unchanged
+alert group maps to the same key on every run and its summary is reused without an LLM call.
+Stored in an SQLite LRU table (sqlite_lru.py), so it survives between runs and is safe to
+share across worker threads.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from sqlite_lru import SQLiteLRU
+
+DEFAULT_CACHE_FILE = "data/summary_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 50_000
+
+
+def cache_key(prompt: str, model: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """Stable hash of everything that determines the model's output."""
+    material = json.dumps({"prompt": prompt, "model": model, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SummaryCache(SQLiteLRU):
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        super().__init__(path, "summaries", "summary", "TEXT", max_entries)
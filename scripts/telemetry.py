@@ -0,0 +1,178 @@
+# scripts/telemetry.py
+#
+# Lightweight instrumentation shared by the pipeline stages and run.py.
+#
+# Stages record named timing spans, counters and gauges:
+#
+#     with telemetry.span("embed"):
+#         ...
+#     telemetry.count("alerts", len(alerts))
+#     telemetry.gauge("alerts_per_s", rate)
+#
+# Everything recorded for a step is appended to METRICS_FILE as one JSON line
+# (kind="spans") when the step changes, and when the process exits if it is a
+# pipeline stage: run.py or a script in this directory run as __main__, or any
+# process given ARGUS_RUN_ID / ARGUS_METRICS_FILE. Modules merely imported (by
+# tests, notebooks, `python -c`) write nothing. run.py adds a
+# kind="step" line per stage with the peak RSS/CPU of the stage's process tree,
+# sampled in the background by ResourceSampler. Both carry the same run_id
+# (ARGUS_RUN_ID) so a run can be reassembled from the file.
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+METRICS_FILE = os.environ.get("ARGUS_METRICS_FILE", "data/step_metrics.jsonl")
+RUN_ID = os.environ.get("ARGUS_RUN_ID") or time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+SAMPLE_INTERVAL_S = 0.2
+
+_lock = threading.Lock()
+_step = os.environ.get("ARGUS_STEP") or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+_spans = {}
+_counters = {}
+_gauges = {}
+
+
+def write_record(record):
+    """Append one metrics line, stamped with the run ID."""
+    record = {"run_id": RUN_ID, "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), **record}
+    if os.path.dirname(METRICS_FILE):
+        os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+    with _lock, open(METRICS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def span(name):
+    """Time a block; repeated spans with the same name accumulate."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            total, calls = _spans.get(name, (0.0, 0))
+            _spans[name] = (total + elapsed, calls + 1)
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def rate(name, n, seconds):
+    """Record n/seconds as a gauge (e.g. alerts_per_s)."""
+    gauge(name, round(n / seconds, 2) if seconds > 0 else 0.0)
+
+
+def flush():
+    """Write out everything recorded for the current step, then reset."""
+    with _lock:
+        if not (_spans or _gauges or any(_counters.values())):
+            _counters.clear()
+            return
+        record = {
+            "kind": "spans",
+            "step": _step,
+            "spans": {k: {"sec": round(total, 4), "calls": calls} for k, (total, calls) in _spans.items()},
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+        }
+        _spans.clear()
+        _counters.clear()
+        _gauges.clear()
+    write_record(record)
+
+
+def set_step(name):
+    """Attribute subsequent spans to `name` (used by the in-process runner)."""
+    global _step
+    flush()
+    _step = name
+
+
+def _is_stage_process():
+    if os.environ.get("ARGUS_RUN_ID") or os.environ.get("ARGUS_METRICS_FILE"):
+        return True
+    script = sys.argv[0] if sys.argv else ""
+    return script.endswith(".py") and os.path.dirname(os.path.abspath(script)) == os.path.dirname(os.path.abspath(__file__))
+
+
+def _flush_at_exit():
+    if _is_stage_process():
+        flush()
+
+
+atexit.register(_flush_at_exit)
+
+
+class ResourceSampler:
+    """Background sampler of peak RSS and CPU for a process and all of its children."""
+
+    def __init__(self, pid=None, interval=SAMPLE_INTERVAL_S):
+        import psutil  # only the runner needs psutil
+
+        self._psutil = psutil
+        self.root = psutil.Process(pid or os.getpid())
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_cpu = 0.0
+        self.cpu_total = 0.0
+        self.samples = 0
+        self._procs = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _tree(self):
+        try:
+            procs = [self.root] + self.root.children(recursive=True)
+        except self._psutil.Error:
+            return []
+        # Reuse Process objects so cpu_percent() measures since the previous sample
+        current = {}
+        for proc in procs:
+            current[proc.pid] = self._procs.get(proc.pid, proc)
+        self._procs = current
+        return list(current.values())
+
+    def sample(self):
+        rss, cpu = 0, 0.0
+        for proc in self._tree():
+            try:
+                rss += proc.memory_info().rss
+                cpu += proc.cpu_percent(None)
+            except self._psutil.Error:
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_cpu = max(self.peak_cpu, cpu)
+        self.cpu_total += cpu
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return {
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 2),
+            "peak_cpu_percent": round(self.peak_cpu, 2),
+            "avg_cpu_percent": round(self.cpu_total / self.samples, 2) if self.samples else 0.0,
+            "samples": self.samples,
+        }
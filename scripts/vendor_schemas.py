@@ -0,0 +1,272 @@
+# scripts/vendor_schemas.py
+#
+# Declarative field mappings used by normalize_alerts.normalize().
+#
+# GENERIC_ALIASES is the vendor-agnostic alias chain (first truthy value wins).
+# VENDOR_SCHEMAS lists vendor-native field names that are tried *before* the
+# generic chain for alerts whose "source" matches one of the vendor's names.
+# Flattened dotted keys (e.g. "host.name") are looked up as literal top-level keys.
+#
+# FieldMapper resolves each source to its vendor's merged alias table once and
+# specialises it to the alert shapes seen for that source: an alert then costs
+# one lookup per field instead of a walk past every alias it does not carry.
+# Adding a vendor is a registry edit; no code changes are needed.
+
+import re
+
+CANONICAL_DEFAULTS = {
+    "alert_id": "",
+    "title": "Unknown Alert",
+    "tactic": "",
+    "technique": "",
+    "technique_id": "",
+    "process": "",
+    "host": "",
+    "user": "",
+    "timestamp": "",
+}  # _extractor() builds records in this order
+
+GENERIC_ALIASES = {
+    "alert_id": ["alert_id", "id", "uuid"],
+    "title": ["title", "alert_name", "Name", "threatName", "event_type"],
+    "tactic": ["tactic", "Tactic", "attack_tactic", "mitreTactic"],
+    "technique": ["technique", "Technique", "attack_technique", "mitreTechnique"],
+    "technique_id": ["technique_id", "attack_id", "techniqueId", "mitreID"],
+    "process": ["process", "application", "processName", "Process"],
+    "host": ["host", "host_name", "HostName", "agentComputerName", "asset_id", "resource", "src_device"],
+    "user": ["user", "user_name", "User", "username", "principal", "userName"],
+    "timestamp": ["timestamp", "log_time", "time", "event_time", "Timestamp", "time_detected"],
+}
+
+VENDOR_SCHEMAS = {
+    "elastic": {
+        "sources": ["elastic"],
+        "fields": {
+            "alert_id": ["kibana.alert.uuid", "event.id"],
+            "title": ["kibana.alert.rule.name", "rule.name"],
+            "tactic": ["threat.tactic.name"],
+            "technique": ["threat.technique.name"],
+            "technique_id": ["threat.technique.id"],
+            "process": ["process.name"],
+            "host": ["host.name", "host.hostname"],
+            "user": ["user.name"],
+            "timestamp": ["@timestamp"],
+        },
+    },
+    "sentinelone": {
+        "sources": ["sentinelone", "sentinel one"],
+        "fields": {
+            "alert_id": ["threatId", "threatInfo.threatId"],
+            "title": ["threatInfo.threatName", "threatName"],
+            "tactic": ["mitreTactic"],
+            "technique": ["mitreTechnique"],
+            "technique_id": ["mitreID"],
+            "process": ["threatInfo.originatorProcess", "processName"],
+            "host": ["agentRealtimeInfo.agentComputerName", "agentComputerName"],
+            "user": ["threatInfo.processUser", "userName"],
+            "timestamp": ["threatInfo.createdAt", "createdAt"],
+        },
+    },
+    "defender": {
+        "sources": ["defender", "microsoft 365 defender", "microsoft defender"],
+        "fields": {
+            "alert_id": ["AlertId", "alertId"],
+            "title": ["Title", "alertDisplayName"],
+            "tactic": ["Category", "Tactic"],
+            "technique": ["AttackTechniques", "Technique"],
+            "technique_id": ["MitreTechniques"],
+            "process": ["InitiatingProcessFileName", "FileName"],
+            "host": ["DeviceName", "HostName"],
+            "user": ["AccountName", "AccountUpn", "User"],
+            "timestamp": ["Timestamp", "TimeGenerated"],
+        },
+    },
+    "crowdstrike": {
+        "sources": ["crowdstrike", "falcon"],
+        "fields": {
+            "alert_id": ["detection_id", "composite_id"],
+            "title": ["display_name", "scenario"],
+            "tactic": ["tactic"],
+            "technique": ["technique"],
+            "technique_id": ["technique_id"],
+            "process": ["filename", "FileName"],
+            "host": ["device.hostname", "ComputerName"],
+            "user": ["user_name", "UserName"],
+            "timestamp": ["created_timestamp", "timestamp"],
+        },
+    },
+    "fortinet": {
+        "sources": ["fortinet", "fortigate", "fortiedr"],
+        "fields": {
+            "alert_id": ["logid", "eventid"],
+            "title": ["attack", "msg"],
+            "process": ["app", "application"],
+            "host": ["devname", "srcname", "src_device"],
+            "user": ["srcuser", "user"],
+            "timestamp": ["eventtime", "date"],
+        },
+    },
+    "carbon_black": {
+        "sources": ["carbon black", "carbonblack", "vmware carbon black"],
+        "fields": {
+            "alert_id": ["id", "legacy_alert_id"],
+            "title": ["reason", "threat_name"],
+            "tactic": ["attack_tactic"],
+            "technique": ["attack_technique"],
+            "process": ["process_name"],
+            "host": ["device_name"],
+            "user": ["device_username"],
+            "timestamp": ["create_time", "backend_timestamp"],
+        },
+    },
+    "chronicle": {
+        "sources": ["chronicle", "google chronicle", "google secops"],
+        "fields": {
+            "alert_id": ["metadata.id"],
+            "title": ["metadata.product_event_type", "rule_name"],
+            "process": ["target.process.file.full_path"],
+            "host": ["principal.hostname", "principal.asset_id", "asset_id"],
+            "user": ["principal.user.userid", "principal"],
+            "timestamp": ["metadata.event_timestamp"],
+        },
+    },
+    "guardduty": {
+        "sources": ["guardduty", "aws guardduty", "guard duty"],
+        "fields": {
+            "alert_id": ["Id", "id"],
+            "title": ["Title", "Type"],
+            "host": ["Resource.InstanceDetails.InstanceId", "resource"],
+            "user": ["Resource.AccessKeyDetails.UserName", "principal"],
+            "timestamp": ["UpdatedAt", "CreatedAt"],
+        },
+    },
+}
+
+def source_tokens(source):
+    return " ".join(re.findall(r"[a-z0-9]+", str(source or "").casefold()))
+
+
+def detect_vendor(source):
+    """Map an alert's "source" string to a VENDOR_SCHEMAS key, or None.
+
+    A vendor matches when one of its names appears as whole words in the source
+    ("Microsoft 365 Defender" → defender), never as a substring of another word.
+    """
+    padded = f" {source_tokens(source)} "
+    for vendor, schema in VENDOR_SCHEMAS.items():
+        if any(f" {source_tokens(name)} " in padded for name in schema["sources"]):
+            return vendor
+    return None
+
+
+def field_lookups(vendor):
+    """[(field, aliases, default)]: vendor aliases first, then the generic chain, without duplicates."""
+    fields = VENDOR_SCHEMAS[vendor]["fields"] if vendor else {}
+    lookups = []
+    for field, generic in GENERIC_ALIASES.items():
+        aliases = []
+        for alias in fields.get(field, []) + generic:
+            if alias not in aliases:
+                aliases.append(alias)
+        lookups.append((field, tuple(aliases), CANONICAL_DEFAULTS[field]))
+    return lookups
+
+
+MAX_SHAPES_PER_SOURCE = 64  # extractors kept per source; the oldest is dropped beyond this
+
+
+def _first_of(aliases, default):
+    """get → first truthy value among `aliases`, else default (the slow path of an extractor)."""
+    if not aliases:
+        return lambda get: default
+
+    def first(get):
+        for alias in aliases:
+            value = get(alias)
+            if value:
+                return value
+        return default
+    return first
+
+
+class _ShapeExtractor:
+    """Field extraction specialised to the aliases one alert shape actually carries.
+
+    For each field the first alias present in the sample alert is read directly;
+    the aliases after it are only tried when that value is empty. It is valid for
+    any alert that has none of the aliases ranked before the chosen ones
+    (`shadowed`), which then maps exactly as the full alias chain would.
+    """
+
+    def __init__(self, lookups, alert):
+        chosen, rest, shadowed = [], [], set()
+        for field, aliases, default in lookups:
+            present = next((i for i, alias in enumerate(aliases) if alias in alert), len(aliases))
+            shadowed.update(aliases[:present])
+            chosen.append(aliases[present] if present < len(aliases) else None)
+            rest.append(_first_of(aliases[present + 1:], default))
+        self.shadowed = frozenset(shadowed)
+        self.extract = _extractor(chosen, rest)
+
+
+def _extractor(chosen, rest):
+    # One dict display over the canonical fields is several times cheaper than
+    # building the record field by field; keep it in CANONICAL_DEFAULTS order.
+    (a_id, a_title, a_tactic, a_technique, a_technique_id, a_process, a_host, a_user, a_timestamp) = chosen
+    (r_id, r_title, r_tactic, r_technique, r_technique_id, r_process, r_host, r_user, r_timestamp) = rest
+
+    def extract(alert, source):
+        get = alert.get
+        return {
+            "source": source,
+            "alert_id": get(a_id) or r_id(get),
+            "title": get(a_title) or r_title(get),
+            "tactic": get(a_tactic) or r_tactic(get),
+            "technique": get(a_technique) or r_technique(get),
+            "technique_id": get(a_technique_id) or r_technique_id(get),
+            "process": get(a_process) or r_process(get),
+            "host": get(a_host) or r_host(get),
+            "user": get(a_user) or r_user(get),
+            "timestamp": get(a_timestamp) or r_timestamp(get),
+        }
+    return extract
+
+
+class FieldMapper:
+    """Maps alerts to canonical fields through extractors cached per source and alert shape."""
+
+    def __init__(self):
+        self._tables = {None: field_lookups(None)}
+        self._by_source = {}
+        self._shapes = {}
+
+    def lookups_for(self, source):
+        key = source if isinstance(source, str) else str(source)
+        table = self._by_source.get(key)
+        if table is None:
+            vendor = detect_vendor(key)
+            if vendor not in self._tables:
+                self._tables[vendor] = field_lookups(vendor)
+            table = self._by_source[key] = self._tables[vendor]
+        return table
+
+    def shapes_for(self, source):
+        """Extractors already built for `source`, most recent last."""
+        return self._shapes.setdefault(source if isinstance(source, str) else str(source), [])
+
+    def extract(self, alert):
+        source = alert.get("source", "Unknown")
+        try:
+            shapes = self._shapes[source]
+        except (KeyError, TypeError):  # new source, or an unhashable one
+            shapes = self.shapes_for(source)
+        keys = alert.keys()
+        for extractor in shapes:
+            if keys.isdisjoint(extractor.shadowed):
+                break
+        else:
+            if len(shapes) >= MAX_SHAPES_PER_SOURCE:
+                del shapes[0]
+            extractor = _ShapeExtractor(self.lookups_for(source), alert)
+            shapes.append(extractor)
+        return extractor.extract(alert, source)
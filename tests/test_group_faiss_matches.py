@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import group_faiss_matches  # noqa: E402
+
+
+def sample_matches(n=500):
+    matches = []
+    for i in range(n):
+        alert = {"alert_id": f"a{i}", "host": f"HOST-{i % 13:02d}", "user": f"user{i % 5}",
+                 "tactic": ["Execution", "Impact", "Persistence"][i % 3],
+                 "timestamp": f"2025-07-06T07:{i % 60:02d}:00+00:00"}
+        matches.append({"alert": alert, "matches": [{"title": f"rule {i % 7}", "score": 0.1 * (i % 9)}]})
+    return matches
+
+
+def test_spilled_output_matches_in_memory_grouping(tmp_path):
+    matches = sample_matches()
+    input_file = tmp_path / "alert_matches.jsonl"
+    input_file.write_text("".join(json.dumps(m) + "\n" for m in matches), encoding="utf-8")
+    output_file = tmp_path / "grouped_matches.jsonl"
+
+    read, groups, spills = group_faiss_matches.group_file(str(input_file), str(output_file),
+                                                          max_entries=7, partitions=4, spill_dir=str(tmp_path))
+
+    expected = {r["group_id"]: r for r in group_faiss_matches.to_records(group_faiss_matches.group_matches(matches))}
+    spilled = [json.loads(line) for line in output_file.read_text(encoding="utf-8").splitlines()]
+    assert (read, groups) == (len(matches), len(expected))
+    assert spills > 1
+    assert {r["group_id"]: r for r in spilled} == expected
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith("argus-group-")]  # spill files cleaned up
@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import group_faiss_matches  # noqa: E402
+from group_store import GroupStore  # noqa: E402
+
+
+def match(alert_id, timestamp, host="host-01"):
+    alert = {"alert_id": alert_id, "host": host, "user": "guest", "tactic": "Impact", "timestamp": timestamp}
+    rule = {"title": "Ransomware", "risk_score": 73, "query": "x" * 500, "references": ["https://example"]}
+    return {"alert": alert, "matches": [dict(rule, score=0.4)]}
+
+
+def write_matches(path, matches):
+    path.write_text("".join(json.dumps(m) + "\n" for m in matches), encoding="utf-8")
+
+
+def test_alerts_at_the_watermark_are_neither_lost_nor_counted_twice(tmp_path):
+    store_path = str(tmp_path / "store.sqlite")
+    input_file, output_file = tmp_path / "matches.jsonl", tmp_path / "grouped.jsonl"
+    first = [match("a", "2025-07-06T07:00:00+00:00"), match("b", "2025-07-06T07:05:00+00:00")]
+    write_matches(input_file, first)
+    group_faiss_matches.group_file_windowed(str(input_file), str(output_file), 900, store_path=store_path)
+
+    # Same export again, plus a second alert in the watermark's second and a later one
+    write_matches(input_file, first + [match("c", "2025-07-06T07:05:00+00:00"),
+                                       match("d", "2025-07-06T07:06:00+00:00")])
+    counts, _ = group_faiss_matches.group_file_windowed(str(input_file), str(output_file), 900,
+                                                        store_path=store_path)
+
+    assert counts == {"new": 2, "late": 2, "untimed": 0}
+    store = GroupStore(store_path)
+    assert [g["alert_count"] for g in store.iter_dirty()] == [4]
+    assert store.get_watermark_keys() == ["d"]
+    store.close()
+
+
+def test_prune_drops_only_clean_windows_past_the_horizon(tmp_path):
+    store = GroupStore(str(tmp_path / "store.sqlite"))
+    matches = [match("old", "2025-07-01T00:00:00+00:00", host="host-01"),
+               match("stale", "2025-07-01T00:00:00+00:00", host="host-02"),
+               match("new", "2025-07-06T07:00:00+00:00", host="host-01")]
+    batch, watermark, keys, _ = group_faiss_matches.group_windowed(matches, 900)
+    store.add_entries(batch, watermark, keys)
+    old = next(g for g in store.iter_dirty() if g["host"] == "host-01" and g["window_start"].startswith("2025-07-01"))
+    store.mark_clean([(old["group_id"], old["version"])])
+
+    assert store.prune(retention_s=86400) == 1
+    remaining = list(store.iter_dirty())
+    assert {(g["host"], g["window_start"][:10]) for g in remaining} == {("host-01", "2025-07-06"),
+                                                                       ("host-02", "2025-07-01")}
+    assert store.stats()["groups"] == 2
+    store.close()
+
+
+def test_entries_keep_a_slim_rule(tmp_path):
+    store = GroupStore(str(tmp_path / "store.sqlite"))
+    batch, watermark, keys, _ = group_faiss_matches.group_windowed([match("a", "2025-07-06T07:00:00+00:00")], 900)
+    store.add_entries(batch, watermark, keys)
+    (group,) = store.iter_dirty()
+    assert group["entries"][0]["matched_rule"] == {"title": "Ransomware", "risk_score": 73}
+    assert group["entries"][0]["score"] == 0.4
+    store.close()
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from group_store import GroupStore  # noqa: E402
+from ingest_daemon import IngestDaemon  # noqa: E402
+
+
+class StubRetriever:
+    """Matches every alert to one rule; records whether the spool file was still there."""
+
+    def __init__(self, spool_file, fail=False):
+        self.spool_file = spool_file
+        self.fail = fail
+        self.file_present = []
+
+    def match(self, alerts):
+        self.file_present.append(os.path.exists(self.spool_file))
+        if self.fail:
+            raise RuntimeError("index unavailable")
+        return [{"alert": alert, "matches": [{"title": "Ransomware", "risk_score": 73, "score": 0.4}]}
+                for alert in alerts]
+
+
+def spool_alerts(spool, name, count):
+    alerts = [{"alert_id": f"a{i}", "host": "host-01", "user": "guest", "tactic": "Impact",
+               "technique": "T1486", "timestamp": f"2025-07-06T07:0{i}:00+00:00"} for i in range(count)]
+    path = spool / name
+    path.write_text("".join(json.dumps(a) + "\n" for a in alerts), encoding="utf-8")
+    return str(path)
+
+
+def run_until_moved(daemon, spool_file):
+    async def stop_when_moved():
+        while os.path.exists(spool_file):
+            await asyncio.sleep(0.05)
+        daemon.stopping.set()
+
+    async def main():
+        await asyncio.wait_for(asyncio.gather(daemon.run(), stop_when_moved()), timeout=10)
+
+    asyncio.run(main())
+
+
+def test_spool_file_moves_to_processed_only_after_its_alerts_are_stored(tmp_path):
+    spool, store_path = tmp_path / "spool", str(tmp_path / "store.sqlite")
+    spool.mkdir()
+    spool_file = spool_alerts(spool, "alerts.jsonl", 5)
+    retriever = StubRetriever(spool_file)
+    daemon = IngestDaemon(spool=str(spool), batch_size=2, max_latency="0.1s", with_llm=False,
+                          store_path=store_path, retriever=retriever)
+    run_until_moved(daemon, spool_file)
+
+    assert retriever.file_present and all(retriever.file_present)
+    assert os.path.exists(spool / "processed" / "alerts.jsonl")
+    store = GroupStore(store_path)
+    assert sum(g["alert_count"] for g in store.iter_dirty()) == 5
+    store.close()
+
+
+def test_spool_file_moves_to_failed_when_a_batch_is_dropped(tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    spool_file = spool_alerts(spool, "alerts.jsonl", 3)
+    daemon = IngestDaemon(spool=str(spool), batch_size=2, max_latency="0.1s", with_llm=False,
+                          store_path=str(tmp_path / "store.sqlite"), retriever=StubRetriever(spool_file, fail=True))
+    run_until_moved(daemon, spool_file)
+
+    assert os.path.exists(spool / "failed" / "alerts.jsonl")
+    assert not os.path.exists(spool / "processed" / "alerts.jsonl")
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize, write_index  # noqa: E402
+
+RULES = {
+    0: {"title": "Ransomware File Encryption", "technique_id": "T1486", "tactic": "Impact",
+        "query": "file.extension : locked"},
+    1: {"title": "Shadow Copy Deletion via vssadmin", "technique_id": "T1490", "tactic": "Impact",
+        "query": "process.name : vssadmin.exe and process.args : delete"},
+    2: {"title": "PowerShell Encoded Command", "technique_id": "T1059.001", "tactic": "Execution",
+        "query": "process.name : powershell.exe and process.args : -enc"},
+    3: {"title": "Suspicious cmd.exe Child Process", "technique_id": "T1059.003", "tactic": "Execution",
+        "query": "process.parent.name : cmd.exe"},
+}
+
+
+@pytest.fixture
+def lexical(tmp_path):
+    path = str(tmp_path / "lexical_index.json")
+    write_index(path, RULES)
+    return LexicalIndex(path)
+
+
+def test_tokenize_splits_compounds_and_sub_techniques():
+    assert tokenize("Ran cmd.exe for T1059.001") == ["ran", "cmd.exe", "cmd", "exe", "t1059.001", "t1059", "001"]
+
+
+def test_search_ranks_exact_tokens_and_respects_ids(lexical):
+    assert lexical.search("vssadmin.exe deleted shadow copies", 2)[0][0] == 1
+    assert [faiss_id for faiss_id, _ in lexical.search("cmd.exe", 4)] == [3, 1, 2]  # "exe" alone also scores
+    assert lexical.search("mimikatz", 4) == []
+    assert [faiss_id for faiss_id, _ in lexical.search("vssadmin", 2, ids=[0, 2])] == [0, 2]
+    assert lexical.technique_rules("Encoded command (T1059.001)") == [2, 3]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [doc for doc, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_fused_match_sets_mark_lexical_only_rules(lexical):
+    pytest.importorskip("sentence_transformers")
+    import query_faiss
+
+    # Dense search found rule 0; BM25 adds rule 1, which then has no L2 distance
+    match_set = query_faiss.fuse_match_set("vssadmin.exe delete", None, [0.3, 0.9], [0, -1], RULES, lexical, 2)
+    by_title = {m["title"]: m for m in match_set}
+    assert by_title["Ransomware File Encryption"]["score"] == pytest.approx(0.3)
+    assert "lexical_only" not in by_title["Ransomware File Encryption"]
+    assert by_title["Shadow Copy Deletion via vssadmin"]["score"] is None
+    assert by_title["Shadow Copy Deletion via vssadmin"]["lexical_only"] is True
+    assert all("fused_score" in m for m in match_set)
+
+
+def test_id_shortcut_only_when_bm25_settles_the_top_k(lexical):
+    pytest.importorskip("sentence_transformers")
+    import query_faiss
+
+    clear = query_faiss.technique_match_set("powershell.exe -enc T1059", lexical, RULES, 1)
+    assert [m["title"] for m in clear] == ["PowerShell Encoded Command"]
+    assert clear[0]["score"] is None and clear[0]["lexical_only"] is True
+    # Both T1059 rules score alike on the bare ID: leave the choice to the dense search
+    assert query_faiss.technique_match_set("T1059", lexical, RULES, 1) is None
+    assert query_faiss.technique_match_set("T1486", lexical, RULES, 2) is None  # fewer than k rules
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from llm_client import LLMError, OllamaClient  # noqa: E402
+from ollama_stub import StubOllamaServer  # noqa: E402
+
+
+def test_generate_reuses_one_connection():
+    with StubOllamaServer(responder=lambda payload: "ok") as stub:
+        client = OllamaClient("stub", host=stub.url, options={"temperature": 0})
+        first = client._connection()
+        assert [client.generate("a"), client.generate("b")] == ["ok", "ok"]
+        assert client._connection() is first
+        client.close()
+
+    assert [p["prompt"] for p in stub.requests] == ["a", "b"]
+    assert stub.requests[0]["options"] == {"temperature": 0}
+    assert client.stats["requests"] == 2
+
+
+def test_generate_reconnects_once_when_the_server_dropped_the_connection():
+    with StubOllamaServer(responder=lambda payload: "ok", drop_connections=True) as stub:
+        client = OllamaClient("stub", host=stub.url)
+        assert client.generate("first") == "ok"
+        assert client.generate("second") == "ok"  # the kept socket is dead; retried on a new one
+        client.close()
+
+    assert [p["prompt"] for p in stub.requests] == ["first", "second"]
+
+
+def test_generate_streams_tokens():
+    tokens = []
+    with StubOllamaServer(responder=lambda payload: "three word reply") as stub:
+        client = OllamaClient("stub", host=stub.url)
+        assert client.generate("p", stream=True, on_token=tokens.append) == "three word reply"
+        client.close()
+
+    assert "".join(tokens) == "three word reply" and len(tokens) == 3
+
+
+def test_unreachable_server_raises_llm_error():
+    stub = StubOllamaServer().start()
+    url = stub.url
+    stub.stop()
+    client = OllamaClient("stub", host=url, timeout=2)
+    with pytest.raises(LLMError):
+        client.generate("p")
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import llm_client  # noqa: E402
+import llm_summary  # noqa: E402
+from group_store import GroupStore  # noqa: E402
+from llm_client import get_client  # noqa: E402
+from ollama_stub import StubOllamaServer  # noqa: E402
+from summary_cache import SummaryCache  # noqa: E402
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(llm_summary, "USE_CACHE", False)
+
+
+def test_windowed_run_without_dirty_groups_keeps_summaries(tmp_path, no_cache):
+    output = tmp_path / "group_summaries.jsonl"
+    existing = {"tactic": "Impact", "technique": "T1486", "host_user": "host-09_guest", "alert_count": 3,
+                "summary": "Ransomware on HOST-09.", "window_start": "2025-07-06T07:30:00+00:00"}
+    output.write_text(json.dumps(existing) + "\n", encoding="utf-8")
+    store = GroupStore(str(tmp_path / "store.sqlite"))
+    store.close()
+
+    records = llm_summary.summarize_nested({}, output_file=str(output), store_path=store.path)
+
+    assert records == []
+    assert [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()] == [existing]
+
+
+def test_store_groups_require_a_store_path(tmp_path, no_cache):
+    nested = {"Impact": {"T1486": {"host-09_guest": [{"group_id": "g", "version": 1, "alert_count": 1,
+                                                      "entries": []}]}}}
+    with pytest.raises(ValueError):
+        llm_summary.summarize_nested(nested, output_file=str(tmp_path / "out.jsonl"))
+
+
+def batch_responder(answered=None, reply=None):
+    """Answer batch prompts with a JSON array (only the `answered` group numbers, or `reply` verbatim)."""
+    def respond(payload):
+        prompt = payload["prompt"]
+        if not prompt.startswith("Summarize each of the following"):
+            return "Single summary."
+        if reply is not None:
+            return reply
+        numbers = answered or range(1, prompt.count("\nGroup ") + 1)
+        return json.dumps([{"group": n, "summary": f"Batched summary {n}."} for n in numbers])
+    return respond
+
+
+@pytest.fixture
+def stub_model(request):
+    """Register a model name whose client talks to a StubOllamaServer; returns (model, stub)."""
+    servers = []
+
+    def start(responder):
+        stub = StubOllamaServer(responder=responder).start()
+        model = f"stub-{request.node.name}-{len(servers)}"
+        get_client(model, host=stub.url)
+        servers.append((model, stub))
+        return model, stub
+
+    yield start
+    for model, stub in servers:
+        llm_client._clients.pop(model).close()
+        stub.stop()
+
+
+def small_job(host):
+    return ("Impact", "T1486", f"{host}_guest",
+            {"alert_count": 1, "entries": [{"alert": {"description": f"Ransomware on {host}"}, "matches": []}]})
+
+
+def test_batched_summaries_are_not_cached_under_the_single_group_prompt(tmp_path, stub_model):
+    model, stub = stub_model(batch_responder())
+    jobs = [small_job("host-01"), small_job("host-02")]
+    cache = SummaryCache(str(tmp_path / "cache.sqlite"))
+
+    first = llm_summary.summarize_batch(model, jobs, cache=cache)
+    again = llm_summary.summarize_batch(model, jobs, cache=cache)  # same batch prompt: served from the cache
+    single = llm_summary.summarize_group(model, *jobs[0], cache=cache)
+    cache.close()
+
+    assert [r["summary"] for r in first] == ["Batched summary 1.", "Batched summary 2."]
+    assert [r["summary"] for r in again] == ["Batched summary 1.", "Batched summary 2."]
+    assert single["summary"] == "Single summary."
+    assert len(stub.requests) == 2
+
+
+def test_groups_missing_from_the_batch_reply_fall_back_to_single_prompts(stub_model, no_cache):
+    model, stub = stub_model(batch_responder(answered=[2]))
+    jobs = [small_job("host-01"), small_job("host-02"), small_job("host-03")]
+
+    records = llm_summary.summarize_batch(model, jobs)
+
+    assert [r["summary"] for r in records] == ["Single summary.", "Batched summary 2.", "Single summary."]
+    assert [r["host_user"] for r in records] == ["host-01_guest", "host-02_guest", "host-03_guest"]
+    assert len(stub.requests) == 3
+
+
+def test_unparseable_batch_reply_falls_back_for_every_group(stub_model, no_cache):
+    model, stub = stub_model(batch_responder(reply="Sorry, here are the summaries: group one is bad"))
+    nested = {"Impact": {"T1486": {hu: [group] for _, _, hu, group in [small_job("host-01"), small_job("host-02")]}}}
+
+    records = llm_summary.summarize_nested(nested, model, workers=2, output_file=None)
+
+    assert sorted(r["summary"] for r in records) == ["Single summary.", "Single summary."]
+    assert len(stub.requests) == 3
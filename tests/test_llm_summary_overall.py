@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import llm_client  # noqa: E402
+import llm_summary_overall  # noqa: E402
+from llm_client import get_client  # noqa: E402
+from llm_summary import estimate_tokens  # noqa: E402
+from ollama_stub import StubOllamaServer  # noqa: E402
+
+
+@pytest.fixture
+def stub_model(request, monkeypatch):
+    """Point llm_summary_overall at a StubOllamaServer answering with `responder`; returns the stub."""
+    servers = []
+
+    def start(responder):
+        stub = StubOllamaServer(responder=responder).start()
+        model = f"stub-{request.node.name}"
+        get_client(model, host=stub.url)
+        monkeypatch.setattr(llm_summary_overall, "MODEL_TAG", model)
+        servers.append((model, stub))
+        return stub
+
+    monkeypatch.setattr(llm_summary_overall, "backoff_delay", lambda attempt: 0.0)
+    yield start
+    for model, stub in servers:
+        llm_client._clients.pop(model).close()
+        stub.stop()
+
+
+def test_reduce_terminates_when_digests_come_back_too_long(monkeypatch):
+    # Every digest is clipped; two clipped texts must still fit one chunk for a level to shrink
+    monkeypatch.setattr(llm_summary_overall, "ask_llm", lambda prompt, format=None: "word " * 5000)
+    inputs = {"tactic: Impact": ["summary " * 800] * 6}
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        done = llm_summary_overall.reduce_all(inputs, pool, fan_in=20, budget=2800)
+
+    assert estimate_tokens(done["tactic: Impact"]) <= 2800
+
+
+def test_reduce_falls_back_to_truncation_after_max_levels(monkeypatch):
+    monkeypatch.setattr(llm_summary_overall, "MAX_REDUCE_LEVELS", 1)
+    monkeypatch.setattr(llm_summary_overall, "ask_llm", lambda prompt, format=None: "word " * 5000)
+    inputs = {"organization": ["line " * 300] * 40}
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        done = llm_summary_overall.reduce_all(inputs, pool, fan_in=2, budget=1000)
+
+    assert estimate_tokens(done["organization"]) <= 1000
+
+
+def test_reduce_context_condenses_oversized_context_through_the_server(stub_model):
+    stub = stub_model(lambda payload: "Digest: ransomware and credential theft across many hosts.")
+    groups = [{"tactic": tactic, "technique": "T1486", "host_user": f"host-{n:02d}_guest", "alert_count": n,
+               "summary": "Encryption of user files observed. " * 10}
+              for n in range(1, 31) for tactic in ("Impact", "Credential Access")]
+
+    context = llm_summary_overall.reduce_context(groups, fan_in=4, level_budget=400, budget=400)
+
+    assert estimate_tokens(context) <= 400
+    assert [line.split(" (")[0] for line in context.splitlines() if line.startswith("- ")] == [
+        "- Impact", "- Credential Access"]
+    prompts = [p["prompt"] for p in stub.requests]
+    assert prompts and all(p.startswith("Condense the following") for p in prompts)
+    assert {p.split("(", 1)[1].split(")", 1)[0] for p in prompts} == {"tactic: Impact", "tactic: Credential Access"}
+    assert all(estimate_tokens(p.split("\n\n", 1)[1]) <= 400 for p in prompts)  # each chunk within the level budget
+
+
+def test_titles_are_retried_until_the_reply_parses(stub_model):
+    replies = iter(["Here are your titles!", json.dumps(["only", "four", "titles", "here"]),
+                    json.dumps([f"Title {n}" for n in range(1, 6)])])
+    stub = stub_model(lambda payload: next(replies))
+
+    titles = llm_summary_overall.ask_json("prompt", "[", "]", llm_summary_overall.check_titles, "Titles")
+
+    assert titles == [f"Title {n}" for n in range(1, 6)]
+    assert len(stub.requests) == 3
+
+
+def test_detail_falls_back_to_a_placeholder_after_max_attempts(stub_model):
+    stub = stub_model(lambda payload: json.dumps({"what": "only one key"}))
+
+    detail = llm_summary_overall.fetch_detail("Ransomware")
+
+    assert detail["impact"] == llm_summary_overall.DETAIL_PLACEHOLDER
+    assert len(stub.requests) == llm_summary_overall.MAX_ATTEMPTS
+    assert stub.requests[0]["format"] == "json"
@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import normalize_alerts  # noqa: E402
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, "data", "xdr_gui_alerts.json")
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 4096])
+def test_streaming_matches_json_load(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(normalize_alerts, "CHUNK_SIZE", chunk_size)
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        expected = [json.dumps(normalize_alerts.normalize(alert)) + "\n" for alert in json.load(f)["alerts"]]
+    output = tmp_path / "normalized.jsonl"
+    with open(output, "w", encoding="utf-8") as out_f:
+        count = normalize_alerts.normalize_stream(normalize_alerts.iter_alerts(SAMPLE), out_f)
+    assert count == len(expected)
+    assert output.read_text(encoding="utf-8") == "".join(expected)
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 12))
+def test_numbers_split_across_reads(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(normalize_alerts, "CHUNK_SIZE", chunk_size)
+    path = tmp_path / "alerts.json"
+    path.write_text('{"version": 3.5, "alerts": [{"risk": 12.25, "id": "a"}, 1e5, -0.5]}', encoding="utf-8")
+    assert list(normalize_alerts.iter_alerts(str(path))) == [{"risk": 12.25, "id": "a"}, 1e5, -0.5]
+
+
+def test_bare_array_and_ndjson(tmp_path):
+    alerts = [{"id": "a", "title": "x"}, {"id": "b", "title": "y"}]
+    array = tmp_path / "alerts.json"
+    array.write_text(json.dumps(alerts), encoding="utf-8")
+    ndjson = tmp_path / "alerts.jsonl"
+    ndjson.write_text("\n".join(json.dumps(a) for a in alerts) + "\n", encoding="utf-8")
+    assert list(normalize_alerts.iter_alerts(str(array))) == alerts
+    assert list(normalize_alerts.iter_alerts(str(ndjson))) == alerts
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from vendor_schemas import FieldMapper, detect_vendor  # noqa: E402
+
+
+def test_vendor_aliases_win_over_generic_ones_whatever_shape_came_first():
+    mapper = FieldMapper()
+    assert mapper.extract({"source": "CrowdStrike", "id": "generic"})["alert_id"] == "generic"
+    assert mapper.extract({"source": "CrowdStrike", "id": "generic", "detection_id": "vendor"})["alert_id"] == "vendor"
+    assert mapper.extract({"source": "CrowdStrike", "id": "generic"})["alert_id"] == "generic"
+
+
+def test_empty_values_fall_through_to_later_aliases():
+    mapper = FieldMapper()
+    record = mapper.extract({"source": "CrowdStrike", "detection_id": "", "composite_id": "c", "title": ""})
+    assert record["alert_id"] == "c"
+    assert record["title"] == "Unknown Alert"
+
+
+def test_unhashable_source_is_kept_as_is():
+    record = FieldMapper().extract({"source": {"vendor": "elastic"}, "title": "t"})
+    assert record["source"] == {"vendor": "elastic"}
+    assert record["title"] == "t"
+
+
+def test_vendors_match_whole_words_only():
+    assert detect_vendor("Microsoft 365 Defender") == "defender"
+    assert detect_vendor("AWS GuardDuty") == "guardduty"
+    assert detect_vendor("awsome-defenderless") is None